@@ -0,0 +1,120 @@
+import asyncio
+from packetsyntax import *
+from client import Client
+from server import ThreadedServer
+from serversettings import *
+import logging
+
+log = logging.getLogger('asyncserver')
+
+
+class AsyncClientHandle(object):
+    # Socket-like wrapper around an asyncio StreamWriter. It is also the client's flush scheduler:
+    # packets queued from any thread are written to the transport by AsyncServer.writeLoop().
+    loop = None
+    writer = None
+    flushEvent = None
+    writableEvent = None
+    
+    
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.flushEvent = asyncio.Event()
+        self.writableEvent = asyncio.Event()
+        
+        
+    def send(self, data):
+        # Only called on the event loop; the transport buffers whatever can't be sent right away
+        self.writer.write(bytes(data))
+        return len(data)
+    
+    
+    def shutdown(self, how):
+        # Like socket.shutdown: ends handleConnection, which cleans up after the client
+        self.close()
+        
+        
+    def close(self):
+        try:
+            self.loop.call_soon_threadsafe(self.writer.close)
+        except RuntimeError: # Event loop already closed
+            pass
+        
+        
+    def scheduleFlush(self, client):
+        try:
+            self.loop.call_soon_threadsafe(self.flushEvent.set)
+        except RuntimeError:
+            pass
+
+
+class AsyncServer(ThreadedServer):
+    # Handles every connection, ping and request on a single asyncio event loop
+    # instead of two threads per connected client.
+    loop = None
+    
+    
+    def listen(self):
+        log.info('Listening for clients (asyncio).')
+        asyncio.run(self.serve())
+        
+        
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handleConnection, sock = self.sock, backlog = LISTEN_BACKLOG)
+        self.matchmaker.start()
+        self.loop.create_task(self.keepaliveLoop())
+        async with server:
+            await server.serve_forever()
+            
+            
+    async def keepaliveLoop(self):
+        while True:
+            self.keepalive.tick()
+            await asyncio.sleep(self.keepalive.tickSeconds)
+            
+            
+    async def writeLoop(self, clientClass, handle):
+        while not clientClass.isDisconnected():
+            await handle.flushEvent.wait()
+            handle.flushEvent.clear()
+            if clientClass.isDisconnected():
+                break
+            try:
+                if not clientClass.flush():
+                    raise ConnectionError('Failed to write to the transport.')
+                if not clientClass.writePaused:
+                    handle.writableEvent.set()
+                # Packets queued while the transport drains are coalesced into the next write
+                await handle.writer.drain()
+            except ConnectionError:
+                # Closing the transport ends handleConnection, which cleans up after the client
+                handle.writer.close()
+                break
+            
+            
+    async def handleConnection(self, reader, writer):
+        handle = AsyncClientHandle(self.loop, writer)
+        clientClass = Client(handle, writer.get_extra_info('peername'), "", handle)
+        writeTask = self.loop.create_task(self.writeLoop(clientClass, handle))
+        try:
+            while not clientClass.isDisconnected():
+                # Stop reading requests while the client isn't reading what we send to it
+                if clientClass.writePaused:
+                    handle.writableEvent.clear()
+                    if clientClass.writePaused:
+                        await asyncio.wait_for(handle.writableEvent.wait(), CLIENT_TIMEOUT_SECONDS)
+                message = await asyncio.wait_for(reader.read(RECEIVE_BUFFER_SIZE), CLIENT_TIMEOUT_SECONDS)
+                if message == b'':
+                    log.info('Client %s disconnected.', clientClass.name)
+                    break
+                # Received a message
+                self.parseMessage(clientClass, message)
+                self.keepalive.addClient(clientClass)
+        except Exception as e:
+            log.info('Client %s disconnected: %s', clientClass.name, e)
+        finally:
+            writeTask.cancel()
+            # Also cleans up after clients disconnected with closeConnection; disconnecting twice is harmless
+            self.disconnectClient(clientClass)
@@ -0,0 +1,116 @@
+# Compares FrameDecoder with the original byte-by-byte ThreadedServer.parseMessage.
+# Run from the repository root: python benchmarks/bench_framing.py
+import socket
+import timeit
+from benchutil import Benchmark
+
+from framedecoder import FrameDecoder
+from packetsyntax import *
+
+
+class LegacyRequest(object):
+    requestID = 0
+    requestType = ''
+    data = b''
+
+
+def legacyParseMessage(request, message, frames):
+    # The parser ThreadedServer used before FrameDecoder, with handleRequest replaced by a list append
+    while 1:
+        if not message or message == b'':
+            break
+        
+        firstByte = bytes([message[0]])
+        
+        if firstByte == SX_EOR:
+            message = message[1:]
+            frames.append((request.requestType, request.data))
+            request.requestType = ''
+            request.data = b''
+            
+        elif request.requestType == '':
+            request.requestType = firstByte
+            request.requestID += 1
+            message = message[1:]
+            
+        else:
+            if SX_EOR not in message:
+                request.data += message
+                message = ''
+            else:
+                messageSplit = message.split(SX_EOR, 1)
+                request.data += messageSplit[0]
+                message = SX_EOR + messageSplit[1]
+                
+                
+def chunk(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def makeInputs():
+    bet = SX_GAME_INFO + SX_GAME_BET + b'120' + SX_EOR
+    ping = SX_PING + b'QZ0SF' + SX_EOR
+    chat = SX_GAME_INFO + SX_GAME_CHAT_MESSAGE + b'x' * 120 + SX_EOR
+    large = SX_GAME_INFO + SX_GAME_CHAT_MESSAGE + b'y' * 60000 + SX_EOR
+    return {
+        # Many small requests arriving in the same recv
+        'pipelined': chunk((bet + ping + chat) * 200, 4096),
+        # One large request split over many 256-byte recvs
+        'fragmented': chunk(large * 4, 256),
+    }
+
+
+def runLegacy(chunks):
+    request = LegacyRequest()
+    frames = []
+    for message in chunks:
+        legacyParseMessage(request, message, frames)
+    return frames
+
+
+def runDecoder(chunks):
+    decoder = FrameDecoder()
+    frames = []
+    for message in chunks:
+        decoder.feed(message)
+        frames.extend(decoder.frames())
+    return frames
+
+
+def runDecoderRecvInto(sender, receiver, chunks):
+    decoder = FrameDecoder()
+    frames = []
+    for message in chunks:
+        sender.send(message)
+        decoder.recvInto(receiver)
+        frames.extend(decoder.frames())
+    return frames
+
+
+def collect():
+    inputs = makeInputs()
+    sender, receiver = socket.socketpair()
+    benchmarks = []
+    for name, chunks in inputs.items():
+        benchmarks.append(Benchmark('framing.legacy[%s]' % name, lambda chunks = chunks: runLegacy(chunks), 20))
+        benchmarks.append(Benchmark('framing.decoder[%s]' % name, lambda chunks = chunks: runDecoder(chunks), 20))
+        benchmarks.append(Benchmark('framing.decoderRecvInto[%s]' % name, lambda chunks = chunks: runDecoderRecvInto(sender, receiver, chunks), 20))
+    return benchmarks
+
+
+def main(number = 20):
+    sender, receiver = socket.socketpair()
+    try:
+        for name, chunks in makeInputs().items():
+            assert runLegacy(chunks) == runDecoder(chunks) == runDecoderRecvInto(sender, receiver, chunks)
+            legacy = min(timeit.repeat(lambda: runLegacy(chunks), number = number, repeat = 3)) / number
+            decoder = min(timeit.repeat(lambda: runDecoder(chunks), number = number, repeat = 3)) / number
+            recvInto = min(timeit.repeat(lambda: runDecoderRecvInto(sender, receiver, chunks), number = number, repeat = 3)) / number
+            print('%-11s legacy %9.1f us   decoder %9.1f us (%5.1fx)   decoder+recv_into %9.1f us' % (name, legacy * 1e6, decoder * 1e6, legacy / decoder, recvInto * 1e6))
+    finally:
+        sender.close()
+        receiver.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# Table hot paths: side pots and settling a hand, shuffling and dealing, going around a full table
+# and broadcasting to a crowd.
+# Run from the repository root: python benchmarks/bench_game.py
+import random
+import socket
+from benchutil import Benchmark, NullSocket, formatSeconds, summarize
+
+from client import Client
+from game import TexasHoldEmGame
+from pokerplayer import PokerPlayer
+from packetsyntax import *
+
+ALL_IN_PLAYERS = 10
+DEAL_PLAYERS = 10
+SPECTATORS = 200
+SEATED_PLAYERS = 10
+
+
+def makeClient(handle, number):
+    return Client(handle, ('bench', number), 'bench%d' % number)
+
+
+def makeGame(playerCount, handles = None):
+    game = TexasHoldEmGame(0, maxPlayers = max(2, playerCount))
+    for i in range(playerCount):
+        handle = handles[i] if handles is not None else NullSocket()
+        game.takeSeat(PokerPlayer(makeClient(handle, i)), i)
+    return game
+
+
+def primeAllIns(game, rng):
+    # Every player has gone all in with a different stack, as many side pots as players
+    game.cleanTable()
+    game.shuffleDeck()
+    game.cardsOnTable = game.deck[:5]
+    cards = game.deck[5:]
+    for i, p in enumerate(game.players):
+        p.reset()
+        p.cards = cards[i * 2:i * 2 + 2]
+        p.totalBet = (i + 1) * 10 + rng.randrange(10)
+        p.chips = 0
+        p.allIn = True
+        game.pot += p.totalBet
+
+
+def collect():
+    rng = random.Random(1)
+    allInGame = makeGame(ALL_IN_PLAYERS)
+    primeAllIns(allInGame, rng)
+
+    def calculateSidePots():
+        allInGame.calculateSidePots()
+
+    def endHand():
+        primeAllIns(allInGame, rng)
+        allInGame.endHand()
+
+    dealGame = makeGame(DEAL_PLAYERS)
+
+    def shuffleAndDeal():
+        dealGame.cleanTable()
+        dealGame.resetPlayers()
+        dealGame.shuffleDeck()
+        dealGame.dealCardsToPlayers(2)
+        dealGame.dealCardsToTable(3)
+        dealGame.dealCardsToTable(1)
+        dealGame.dealCardsToTable(1)
+
+    seatedGame = makeGame(SEATED_PLAYERS)
+    seatedGame.resetPlayers()
+    seatedGame.currentRound = 1 # Everyone still has to act
+    seatedGame.dealerPlayer = seatedGame.players[0]
+
+    def goAround():
+        # A turn around the table, as taken once per betting round
+        player = seatedGame.players[0]
+        for i in range(SEATED_PLAYERS):
+            player = seatedGame.getNextPlayerFrom(player, True)
+        seatedGame.getNextChairFrom(player.chair, True)
+
+    # Spectators are real socket pairs; the receiving ends are drained between repeats
+    pairs = [socket.socketpair() for i in range(SPECTATORS)]
+    broadcastGame = makeGame(0)
+    broadcastGame.spectatingPlayers = [PokerPlayer(makeClient(sender, i)) for i, (sender, receiver) in enumerate(pairs)]
+    for sender, receiver in pairs:
+        receiver.setblocking(False)
+
+    def drain():
+        for sender, receiver in pairs:
+            try:
+                while receiver.recv(65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def sendToAll():
+        broadcastGame.sendToAll(SX_GAME_CHAT_MESSAGE, [broadcastGame.spectatingPlayers[0], 'good luck everyone'])
+
+    return [
+        Benchmark('game.calculateSidePots[%d all-ins]' % ALL_IN_PLAYERS, calculateSidePots, 1000),
+        Benchmark('game.endHand[%d all-ins]' % ALL_IN_PLAYERS, endHand, 200),
+        Benchmark('game.shuffleAndDeal[%d players]' % DEAL_PLAYERS, shuffleAndDeal, 200),
+        Benchmark('game.goAround[%d seats]' % SEATED_PLAYERS, goAround, 1000),
+        Benchmark('game.sendToAll[%d spectators]' % SPECTATORS, sendToAll, 50, drain),
+    ]
+
+
+def main():
+    for benchmark in collect():
+        print('%-36s %s' % (benchmark.name, formatSeconds(summarize(benchmark.run())['min'])))
+
+
+if __name__ == '__main__':
+    main()
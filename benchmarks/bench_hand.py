@@ -0,0 +1,42 @@
+# Hand evaluation over random 7-card sets.
+# Run from the repository root: python benchmarks/bench_hand.py
+import random
+from benchutil import Benchmark, formatSeconds, summarize
+
+from card import CARDS
+from hand import Hand
+
+HAND_COUNT = 1000
+
+
+def makeHands(count = HAND_COUNT, seed = 1):
+    rng = random.Random(seed)
+    deck = list(CARDS)
+    return [rng.sample(deck, 7) for i in range(count)]
+
+
+def collect():
+    cardSets = makeHands()
+    pairs = list(zip(cardSets[0::2], cardSets[1::2]))
+
+    def getBestHand():
+        for cards in cardSets:
+            Hand(cards).getBestHand()
+
+    def compareToHand():
+        for cards, otherCards in pairs:
+            Hand(cards).compareToHand(Hand(otherCards))
+
+    return [
+        Benchmark('hand.getBestHand[%d]' % len(cardSets), getBestHand, 5),
+        Benchmark('hand.compareToHand[%d]' % len(pairs), compareToHand, 5),
+    ]
+
+
+def main():
+    for benchmark in collect():
+        print('%-30s %s' % (benchmark.name, formatSeconds(summarize(benchmark.run())['min'])))
+
+
+if __name__ == '__main__':
+    main()
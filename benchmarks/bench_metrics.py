@@ -0,0 +1,44 @@
+# Cost of one metric update on the hot paths, see metrics.py. Each should stay well under a microsecond.
+# Run from the repository root: python benchmarks/bench_metrics.py
+from time import perf_counter
+from benchutil import Benchmark, formatSeconds, summarize
+
+from client import buildPacket
+from metrics import Counter, Histogram, Registry, countPacketIn, countPacketOut
+from packetsyntax import *
+from protocol import PROTOCOL_V1, PROTOCOL_V2
+
+UPDATES = 10000
+
+
+def collect():
+    counter = Counter('bench_total', 'Benchmark counter.')
+    histogram = Histogram('bench_seconds', 'Benchmark histogram.')
+    packets = dict((version, buildPacket(SX_GAME_INFO, SX_GAME_PLAYER_CHIPS, b'\x01\x64', version)) for version in (PROTOCOL_V1, PROTOCOL_V2))
+    registry = Registry()
+    for i in range(20):
+        registry.register(Histogram('bench_%d_seconds' % i, 'Benchmark histogram.'))
+
+    def timed():
+        started = perf_counter()
+        histogram.observe(perf_counter() - started)
+
+    benchmarks = [
+        Benchmark('metrics.counter.inc', lambda: counter.inc(), UPDATES),
+        Benchmark('metrics.histogram.observe', lambda: histogram.observe(0.0003), UPDATES),
+        Benchmark('metrics.histogram.timed', timed, UPDATES),
+        Benchmark('metrics.countPacketIn', lambda: countPacketIn(SX_GAME_INFO, SX_GAME_BET + b'100'), UPDATES),
+    ]
+    for version in (PROTOCOL_V1, PROTOCOL_V2):
+        benchmarks.append(Benchmark('metrics.countPacketOut[v%d]' % version, lambda version = version: countPacketOut(packets[version], version), UPDATES))
+    benchmarks.append(Benchmark('metrics.render[20 histograms]', registry.render, 100))
+    return benchmarks
+
+
+def main():
+    for benchmark in collect():
+        print('%-40s %s' % (benchmark.name, formatSeconds(summarize(benchmark.run())['min'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Protocol version 1 against version 2 for the most frequent game packets: encoding chip updates
+# on the server, decoding them on a client and decoding bet requests on the server.
+# Run from the repository root: python benchmarks/bench_protocol.py
+from benchutil import Benchmark, formatSeconds, summarize
+
+from client import Client, buildPacket
+from framedecoder import FrameDecoder
+from packetsyntax import *
+from pokerplayer import PokerPlayer
+from protocol import PROTOCOL_V1, PROTOCOL_V2, decodeGameData, encodeGameData, encodeVarint, frame, readFrame
+
+PLAYERS = 10
+BETS = 500
+
+
+def makePlayers(count = PLAYERS):
+    players = []
+    for i in range(count):
+        player = PokerPlayer(Client(None, ('bench', i), 'player%d' % i))
+        player.chair = i
+        player.seated = True
+        player.chips = 1500 + i * 250
+        players.append(player)
+    return players
+
+
+def chipsFields(players):
+    fields = []
+    for p in players:
+        fields += [p, p.chips]
+    return fields
+
+
+def encodeChips(players, version):
+    return buildPacket(SX_GAME_INFO, SX_GAME_PLAYER_CHIPS, encodeGameData(SX_GAME_PLAYER_CHIPS, chipsFields(players), version), version)
+
+
+def decodeChipsV1(packet):
+    fields = packet[2:-1].split(SX_EOO)
+    return [(fields[i].decode('utf-8'), int(fields[i + 1])) for i in range(0, len(fields), 2)]
+
+
+def decodeChipsV2(packet, chairNames):
+    body = readFrame(packet, 0, PROTOCOL_V2)[0]
+    fields = decodeGameData(SX_GAME_PLAYER_CHIPS, body[2:])
+    return [(chairNames[fields[i]], fields[i + 1]) for i in range(0, len(fields), 2)]
+
+
+def makeBets(version, count = BETS):
+    amounts = [(i * 37) % 2000 for i in range(count)]
+    if version >= PROTOCOL_V2:
+        return b''.join(frame(SX_GAME_INFO + SX_GAME_BET + encodeVarint(a), version) for a in amounts)
+    return b''.join(frame(SX_GAME_INFO + SX_GAME_BET + str(a).encode('utf-8'), version) for a in amounts)
+
+
+def decodeBets(data, version):
+    decoder = FrameDecoder()
+    decoder.protocolVersion = version
+    decoder.feed(data)
+    return list(decoder.frames())
+
+
+def collect():
+    players = makePlayers()
+    chairNames = dict((p.chair, p.getName()) for p in players)
+    packets = dict((version, encodeChips(players, version)) for version in (PROTOCOL_V1, PROTOCOL_V2))
+    assert decodeChipsV1(packets[PROTOCOL_V1]) == decodeChipsV2(packets[PROTOCOL_V2], chairNames)
+    bets = dict((version, makeBets(version)) for version in (PROTOCOL_V1, PROTOCOL_V2))
+    benchmarks = []
+    for version in (PROTOCOL_V1, PROTOCOL_V2):
+        benchmarks.append(Benchmark('protocol.encodeChips[v%d, %d players]' % (version, PLAYERS), lambda version = version: encodeChips(players, version), 2000))
+        benchmarks.append(Benchmark('protocol.decodeBets[v%d, %d]' % (version, BETS), lambda version = version: decodeBets(bets[version], version), 50))
+    benchmarks.append(Benchmark('protocol.decodeChips[v1, %d players]' % PLAYERS, lambda: decodeChipsV1(packets[PROTOCOL_V1]), 2000))
+    benchmarks.append(Benchmark('protocol.decodeChips[v2, %d players]' % PLAYERS, lambda: decodeChipsV2(packets[PROTOCOL_V2], chairNames), 2000))
+    return benchmarks
+
+
+def main():
+    players = makePlayers()
+    for version in (PROTOCOL_V1, PROTOCOL_V2):
+        print('v%d: chip update %d bytes, %d bets %d bytes' % (version, len(encodeChips(players, version)), BETS, len(makeBets(version))))
+    for benchmark in collect():
+        print('%-40s %s' % (benchmark.name, formatSeconds(summarize(benchmark.run())['min'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Shared helpers for the benchmark modules (bench_*.py) and benchmarks/run.py
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+class Benchmark(object):
+    # One timed function. setup is called before every repeat and is not timed.
+    name = ''
+    function = None
+    number = 1 # Calls per repeat
+    setup = None
+
+
+    def __init__(self, name, function, number = 1, setup = None):
+        self.name = name
+        self.function = function
+        self.number = number
+        self.setup = setup
+
+
+    def run(self, repeat = 5):
+        # Seconds per call of every repeat
+        timings = []
+        self.function() # Warm up caches and lazily built tables
+        for r in range(repeat):
+            if self.setup is not None:
+                self.setup()
+            function = self.function
+            started = time.perf_counter()
+            for i in range(self.number):
+                function()
+            timings.append((time.perf_counter() - started) / self.number)
+        return timings
+
+
+def summarize(timings):
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'repeat': len(timings),
+    }
+
+
+def formatSeconds(seconds):
+    if seconds < 1e-3:
+        return '%.2f us' % (seconds * 1e6)
+    if seconds < 1:
+        return '%.2f ms' % (seconds * 1e3)
+    return '%.2f s' % seconds
+
+
+class NullSocket(object):
+    # Stands in for a client socket when only the server side of sending matters
+    def send(self, data):
+        return len(data)
+
+
+    def close(self):
+        pass
@@ -0,0 +1,50 @@
+# Compares two result files written by benchmarks/run.py.
+# Exits with status 1 if any benchmark got slower than the threshold allows.
+# Example: python benchmarks/compare.py benchmarks/results/bf6eab6.json benchmarks/results/2f89d02.json
+import argparse
+import json
+import sys
+from benchutil import formatSeconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Diff two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type = float, default = 10.0, help = 'percentage slowdown reported as a regression')
+    parser.add_argument('--stat', default = 'min', choices = ('min', 'median', 'mean'))
+    options = parser.parse_args()
+
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    with open(options.current) as f:
+        current = json.load(f)
+
+    if baseline.get('machine') != current.get('machine') or baseline.get('python') != current.get('python'):
+        print('Warning: the results come from different machines or Python versions.')
+    print('%s -> %s' % (baseline.get('commit'), current.get('commit')))
+
+    regressions = 0
+    names = sorted(set(baseline['benchmarks']) | set(current['benchmarks']))
+    for name in names:
+        before = baseline['benchmarks'].get(name)
+        after = current['benchmarks'].get(name)
+        if before is None or after is None:
+            print('%-44s %s' % (name, 'only in current' if before is None else 'only in baseline'))
+            continue
+        change = (after[options.stat] / before[options.stat] - 1) * 100
+        note = ''
+        if change > options.threshold:
+            note = '  REGRESSION'
+            regressions += 1
+        elif change < -options.threshold:
+            note = '  faster'
+        print('%-44s %12s -> %12s %+7.1f%%%s' % (name, formatSeconds(before[options.stat]), formatSeconds(after[options.stat]), change, note))
+
+    if regressions > 0:
+        print('%d regression(s) over %.1f%%.' % (regressions, options.threshold))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
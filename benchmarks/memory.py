@@ -0,0 +1,42 @@
+# Memory used per connected client and per seated player, measured with tracemalloc.
+# Not part of benchmarks/run.py, which only times things.
+# Run from the repository root: python benchmarks/memory.py [--count 50000]
+import argparse
+import gc
+import sys
+import tracemalloc
+import benchutil
+
+from client import Client
+from pokerplayer import PokerPlayer
+
+
+def measure(create, count):
+    # Bytes allocated per object by count calls of create, counting everything the objects keep alive
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [create(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    listBytes = sys.getsizeof(objects)
+    del objects
+    return (after - before - listBytes) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Measure bytes per client and per player.')
+    parser.add_argument('--count', type = int, default = 50000)
+    options = parser.parse_args()
+
+    clients = [Client(None, ('bench', i), 'bench%d' % i) for i in range(options.count)]
+    results = [
+        ('Client', measure(lambda i: Client(None, ('bench', i), 'bench%d' % i), options.count)),
+        ('PokerPlayer', measure(lambda i: PokerPlayer(clients[i]), options.count)),
+    ]
+    for name, perObject in results:
+        print('%-12s %8.1f bytes each, %8.1f MB for %d' % (name, perObject, perObject * options.count / 1e6, options.count))
+
+
+if __name__ == '__main__':
+    main()
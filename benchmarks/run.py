@@ -0,0 +1,72 @@
+# Runs every benchmark in benchmarks/bench_*.py and stores the results as JSON.
+# Compare two runs on the same machine with benchmarks/compare.py.
+# Examples:
+#   python benchmarks/run.py
+#   python benchmarks/run.py --filter hand --output /tmp/hand.json
+import argparse
+import datetime
+import glob
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+from benchutil import formatSeconds, summarize
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def getCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = BENCHMARK_DIR, stderr = subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def loadBenchmarks():
+    benchmarks = []
+    for path in sorted(glob.glob(os.path.join(BENCHMARK_DIR, 'bench_*.py'))):
+        module = importlib.import_module(os.path.splitext(os.path.basename(path))[0])
+        benchmarks.extend(module.collect())
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Run the benchmark suite.')
+    parser.add_argument('--output', '-o', default = None, help = 'JSON file to write, default benchmarks/results/<commit>.json')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--filter', default = '', help = 'only run benchmarks whose name contains this')
+    options = parser.parse_args()
+
+    commit = getCommit()
+    results = {}
+    for benchmark in loadBenchmarks():
+        if options.filter not in benchmark.name:
+            continue
+        summary = summarize(benchmark.run(options.repeat))
+        summary['number'] = benchmark.number
+        results[benchmark.name] = summary
+        print('%-44s %12s  (median %s)' % (benchmark.name, formatSeconds(summary['min']), formatSeconds(summary['median'])))
+
+    report = {
+        'commit': commit,
+        'date': datetime.datetime.now().isoformat(timespec = 'seconds'),
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'benchmarks': results,
+    }
+    output = options.output
+    if output is None:
+        output = os.path.join(BENCHMARK_DIR, 'results', '%s.json' % (commit or 'unknown'))
+    if os.path.dirname(output) != '':
+        os.makedirs(os.path.dirname(output), exist_ok = True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent = 2, sort_keys = True)
+    print('Results written to %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,39 @@
 class Card(object):
-    suit = 0 # 0 - 3: hearts, diamonds, clubs, spades
-    rank = 0 # 0 - 12: 2, 3, 4, 5, 6, 7, 8, 9, 10, jack, queen, king, ace
-    
-    def __init__(self, suit, rank):
-        self.suit = suit
-        self.rank = rank
-        
-        
+    # There is only one instance of each of the 52 cards, see CARDS. Card(suit, rank) returns
+    # the shared instance, so dealing and comparing cards never creates new objects.
+    __slots__ = ('suit', 'rank', 'value', 'string')
+    # suit: 0 - 3: hearts, diamonds, clubs, spades
+    # rank: 0 - 12: 2, 3, 4, 5, 6, 7, 8, 9, 10, jack, queen, king, ace
+    # value: rank + suit * 13, used by the evaluator and on the wire
+    # string: the value as sent to the clients, see CARD_STRINGS
+
+    def __new__(cls, suit, rank):
+        return CARDS[rank + (suit * 13)]
+
+
+    def __reduce__(self):
+        return (Card, (self.suit, self.rank))
+
+
+    def __int__(self):
+        return self.value
+
+
     def __str__(self):
-        cardNumber = str(int(self.rank + (self.suit * 13)))
-        if int(cardNumber) < 10:
-            cardNumber = '0' + cardNumber
-        return str(cardNumber)
\ No newline at end of file
+        return self.string
+
+
+# Wire format of every card value: two digits, zero-padded
+CARD_STRINGS = tuple('%02d' % value for value in range(52))
+
+
+def makeCard(value):
+    card = object.__new__(Card)
+    card.suit = value // 13
+    card.rank = value % 13
+    card.value = value
+    card.string = CARD_STRINGS[value]
+    return card
+
+
+CARDS = tuple(makeCard(value) for value in range(52)) # Indexed by card value
@@ -1,79 +1,202 @@
 from packetsyntax import *
 from gamestates import *
 from request import *
+from framedecoder import FrameDecoder
+from protocol import PROTOCOL_V1, frame
+from metrics import BYTES_OUT, SEND_FAILURES, countPacketOut
 import socket #error
 import struct
+import threading
+from serversettings import *
+import logging
+
+log = logging.getLogger('client')
+
+
+def buildPacket(headerByte1, headerByte2 = b'', dataString = '', version = PROTOCOL_V1):
+    # Frames a packet once so the same bytes can be sent to any number of clients speaking the same protocol version
+    # Returns None if the data can't be encoded
+    try:
+        if type(dataString) is str:
+            log.debug('Sending: %s', dataString)
+            dataBytes = dataString.encode('utf-8')
+        elif type(dataString) is bytes:
+            log.debug('Sending data.')
+            dataBytes = dataString
+        else:
+            log.debug('Sending: %s', dataString)
+            dataBytes = str(dataString).encode('utf-8')
+    except UnicodeEncodeError as e:
+        log.warning('Failed to encode sendPacket data: %s', e)
+        return None
+        
+    return frame(headerByte1 + headerByte2 + dataBytes, version)
+
 
 class Client(object):
-    clientHandle = None
-        
-    # Connection information
-    pingThread = None
-    ping = 999
-    lastPingData = b''
-    lastPingTime = 0
-    address = None
-    currentRequest = None
-    lastHandledRequestID = -1
-    disconnected = False
-    
-    # Identification details
-    name = ''
-    
-    # Game related information
-    currentGame = GM_NONE
-    currentGameID = -1
-    gameStatus = ST_IDLE
+    __slots__ = ('clientHandle', 'ping', 'pingAverage', 'lastPingData', 'lastPingTime', 'address', 'currentRequest', 'decoder',
+                 'lastHandledRequestID', 'disconnected', 'flushScheduler', 'outBuffer', 'outLock', 'flushPending',
+                 'writePaused', 'writable', 'name', 'protocolVersion', '_currentGame', 'currentGameID', '_gameStatus', 'statusListener')
 
 
-    def __init__(self, clientHandle, address, name):
-        print('%s connected on port %d' % (address[0], address[1]))
+    def __init__(self, clientHandle, address, name, flushScheduler = None):
+        log.info('%s connected on port %d', address[0], address[1])
         self.clientHandle = clientHandle
+        
+        # Connection information
+        self.ping = 999 # Latest round trip time in milliseconds
+        self.pingAverage = -1 # Moving average of the round trip time, -1 until the first pong
+        self.lastPingData = b''
+        self.lastPingTime = 0
         self.address = address
-        self.name = name
         self.currentRequest = Request()
+        self.decoder = FrameDecoder()
+        self.lastHandledRequestID = -1
+        self.disconnected = False
+        
+        # Outbound data waiting to be flushed by the flush scheduler (OutboundWriter or the asyncio loop)
+        self.flushScheduler = flushScheduler
+        self.outBuffer = bytearray()
+        self.outLock = threading.Lock()
+        self.flushPending = False
+        self.writePaused = False # True while outBuffer is above OUTBOUND_HIGH_WATERMARK
+        self.writable = None # Event set while writePaused is False, created by the first waitUntilWritable()
+        
+        # Identification details
+        self.name = name
+        self.protocolVersion = PROTOCOL_V1 # Negotiated in SX_HELLO, see protocol.py
         
+        # Game related information
+        self._currentGame = GM_NONE
+        self.currentGameID = -1
+        self._gameStatus = ST_IDLE
+        self.statusListener = None # Called with the client when gameStatus or currentGame changes (see Clients)
         
+        
+    @property
+    def gameStatus(self):
+        return self._gameStatus
+    
+    
+    @gameStatus.setter
+    def gameStatus(self, gameStatus):
+        self._gameStatus = gameStatus
+        if self.statusListener is not None:
+            self.statusListener(self)
+            
+            
+    @property
+    def currentGame(self):
+        return self._currentGame
+    
+    
+    @currentGame.setter
+    def currentGame(self, currentGame):
+        self._currentGame = currentGame
+        if self.statusListener is not None:
+            self.statusListener(self)
+            
+            
     def sendPacket(self, headerByte1, headerByte2 = b'', dataString = ''):
         if self.isDisconnected():
             return False
         
-        dataToSend = b''
-        dataBytes = b''
-        
-        try:
-            if type(dataString) is str:
-                dataBytes = dataString.encode('utf-8')
-            elif type(dataString) is bytes:
-                dataBytes = dataString
-            else:
-                dataBytes = str(dataString).encode('utf-8')
-        except UnicodeEncodeError as e:
-            print('Failed to encode sendPacket data: ' + str(e))
+        packet = buildPacket(headerByte1, headerByte2, dataString, self.protocolVersion)
+        if packet is None:
             return True
-            
-        dataToSend = headerByte1 + headerByte2 + dataBytes + SX_EOR
-            
-        if self.clientHandle is not None:
-            try:
-                print('Sending: %s' % dataToSend.decode('utf-8'))
-            except UnicodeDecodeError as e:
-                print('Sending data.')
-                pass
+        return self.sendRawPacket(packet)
+    
+    
+    def sendRawPacket(self, packet):
+        # Queues an already framed packet (see buildPacket) to be sent
+        # Returns False if the client is disconnected or isn't reading its data
+        if self.isDisconnected():
+            SEND_FAILURES.value += 1
+            return False
+        
+        with self.outLock:
+            bufferFull = len(self.outBuffer) + len(packet) > OUTBOUND_BUFFER_MAX
+            if not bufferFull:
+                self.outBuffer += packet
+                countPacketOut(packet, self.protocolVersion)
+                if not self.writePaused and len(self.outBuffer) >= OUTBOUND_HIGH_WATERMARK:
+                    self.writePaused = True
+                    if self.writable is not None:
+                        self.writable.clear()
+                scheduleFlush = not self.flushPending
+                self.flushPending = True
                 
-            try:
-                sent = self.clientHandle.send(dataToSend)
-                if sent == 0:
-                    print('Can\'t send data to client.')
-                    return False
-            except Exception as e:
-                print('Can\'t send data to client: %s' % e)
+        if bufferFull:
+            log.warning('Outbound buffer of client %s is full, closing the connection.', self.name)
+            SEND_FAILURES.value += 1
+            self.closeConnection()
+            return False
+        
+        if scheduleFlush:
+            if self.flushScheduler is not None:
+                self.flushScheduler.scheduleFlush(self)
+            elif not self.flush():
                 return False
         return True
     
     
+    def flush(self):
+        # Sends as much of the outbound buffer as possible in a single send
+        # Returns False if the connection failed
+        with self.outLock:
+            if self.outBuffer and self.clientHandle is not None:
+                try:
+                    sent = self.clientHandle.send(self.outBuffer)
+                except (BlockingIOError, socket.timeout):
+                    sent = 0
+                except Exception as e:
+                    log.warning('Can\'t send data to client %s: %s', self.name, e)
+                    SEND_FAILURES.value += 1
+                    return False
+                del self.outBuffer[:sent]
+                BYTES_OUT.value += sent
+            elif self.clientHandle is None:
+                del self.outBuffer[:]
+                
+            if self.writePaused and len(self.outBuffer) <= OUTBOUND_LOW_WATERMARK:
+                self.writePaused = False
+                if self.writable is not None:
+                    self.writable.set()
+            # Without a flushScheduler nothing retries the rest, so the next sendRawPacket has to flush it
+            self.flushPending = len(self.outBuffer) > 0 and self.flushScheduler is not None
+        return True
+    
+    
+    def waitUntilWritable(self, timeout):
+        # Blocks a reading thread while outBuffer is above OUTBOUND_HIGH_WATERMARK
+        # Returns False if the client didn't read enough of its data in timeout seconds
+        with self.outLock:
+            if not self.writePaused or self.disconnected:
+                return True
+            if self.writable is None:
+                self.writable = threading.Event()
+            writable = self.writable
+        return writable.wait(timeout)
+        
+        
     def disconnect(self):
         self.disconnected = True
+        with self.outLock:
+            if self.writable is not None:
+                self.writable.set()
+        if self.flushPending and self.flushScheduler is not None:
+            self.flushScheduler.scheduleFlush(self) # Let the scheduler forget about this client
+        
+        
+    def closeConnection(self):
+        # Disconnects the client and shuts down its socket, which wakes up the thread listening to it
+        # so it can clean up after the client (see ThreadedServer.disconnectClient)
+        self.disconnect()
+        if self.clientHandle is not None:
+            try:
+                self.clientHandle.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
         
         
     def isDisconnected(self):
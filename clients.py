@@ -1,48 +1,81 @@
+import threading
 from packetsyntax import *
-from games import *
+from gamestates import *
+import logging
+
+log = logging.getLogger('clients')
 
 
 class Clients(object):
-    clients = []
+    # Registry of the clients that have said hello, indexed by name and by connection handle.
+    # Clients searching for a game are kept in one set per game type, updated by Client
+    # whenever its gameStatus or currentGame changes.
+    clientsByName = None # name -> client
+    namesByHandle = None # handle -> name the client was registered with
+    searching = None # game type -> clients searching for it (dict used as an ordered set)
+    lock = None
+    
+    
+    def __init__(self):
+        self.clientsByName = {}
+        self.namesByHandle = {}
+        self.searching = {}
+        self.lock = threading.RLock()
+        
+        
+    @property
+    def clients(self):
+        with self.lock:
+            return list(self.clientsByName.values())
+    
     
     def containsName(self, name):
-        if self.clients == None:
-            return False
-        for client in self.clients:
-            if client.name == name:
-                return True
-        return False
+        return name in self.clientsByName
     
     
     def containsHandle(self, handle):
-        if self.clients == None:
-            return False
-        for c in self.clients:
-            if c.clientHandle == handle:
-                return True
-        return False
+        return handle in self.namesByHandle
     
     
     def addClient(self, client):
-        if self.containsName(client.name):
-            return -1
-        if self.containsHandle(client.clientHandle):
-            return -2
-        self.clients.append(client)
+        with self.lock:
+            if self.containsName(client.name):
+                return -1
+            if self.containsHandle(client.clientHandle):
+                return -2
+            self.clientsByName[client.name] = client
+            self.namesByHandle[client.clientHandle] = client.name
+            client.statusListener = self.updateSearching
+            self.updateSearching(client)
         return 1
     
     
     def removeClient(self, client):
         client.clientHandle.close()
-        if client in self.clients:
-            self.clients.remove(client)
-            print('Removed a client from clients. Clients still connected: %d' % len(self.clients))
+        with self.lock:
+            name = self.namesByHandle.pop(client.clientHandle, None)
+            if name is None:
+                return
+            del self.clientsByName[name]
+            client.statusListener = None
+            for searchers in self.searching.values():
+                searchers.pop(client, None)
+            log.info('Removed a client from clients. Clients still connected: %d', len(self.clientsByName))
             
             
+    def updateSearching(self, client):
+        with self.lock:
+            for gameType, searchers in self.searching.items():
+                if gameType != client.currentGame or client.gameStatus != ST_SEARCHING:
+                    searchers.pop(client, None)
+            if client.gameStatus == ST_SEARCHING and client.clientHandle in self.namesByHandle:
+                self.searching.setdefault(client.currentGame, {})[client] = None
+                
+                
     def getAllSearching(self, gameType):
-        players = []
-        for c in self.clients:
-            if c.gameStatus == ST_SEARCHING and c.currentGame == gameType:
-                players.append(c)
-        return players
-    
+        with self.lock:
+            return list(self.searching.get(gameType, ()))
+            
+            
+    def countSearching(self):
+        return sum(len(searchers) for searchers in list(self.searching.values()))
@@ -0,0 +1,151 @@
+# Hand strength evaluation on integer cards.
+# A card value is the card's wire number: rank + suit * 13 (see Card).
+# evaluate() returns a single integer; a stronger hand always has a bigger value.
+#
+# Value layout: category << 20 followed by five 4-bit rank slots in order of significance,
+# e.g. a full house of kings over fives is FULL_HOUSE, K, K, K, 5, 5.
+# Slots hold rank + 1 so that an empty slot (fewer than five cards) is 0.
+
+HIGH_CARD = 0
+PAIR = 1
+TWO_PAIRS = 2
+THREE_OF_A_KIND = 3
+STRAIGHT = 4
+FLUSH = 5
+FULL_HOUSE = 6
+FOUR_OF_A_KIND = 7
+STRAIGHT_FLUSH = 8
+
+CATEGORY_SHIFT = 20
+RANK_ACE = 12
+
+CARD_RANK = tuple(value % 13 for value in range(52))
+CARD_SUIT = tuple(value // 13 for value in range(52))
+CARD_RANK_BIT = tuple(1 << (value % 13) for value in range(52))
+# Each suit has its own 16-bit lane of rank bits
+CARD_MASK = tuple(1 << (value % 13 + 16 * (value // 13)) for value in range(52))
+
+
+def buildKickerTable(count):
+    # Slots for the count highest ranks in a rank bitmask, packed into the lowest count slots
+    table = []
+    for mask in range(8192):
+        packed = 0
+        taken = 0
+        for rank in range(12, -1, -1):
+            if taken == count:
+                break
+            if mask & (1 << rank):
+                packed = (packed << 4) | (rank + 1)
+                taken += 1
+        table.append(packed << (4 * (count - taken)))
+    return table
+
+
+def straightSlots(highRank):
+    ranks = [highRank - i for i in range(5)]
+    if highRank == 3: # Five-high straight: the ace counts as the lowest card
+        ranks[4] = RANK_ACE
+    packed = 0
+    for rank in ranks:
+        packed = (packed << 4) | (rank + 1)
+    return packed
+
+
+def buildStraightTable():
+    # Highest rank of the best straight in a rank bitmask, -1 if there is none
+    table = []
+    for mask in range(8192):
+        highRank = -1
+        for high in range(12, 2, -1):
+            needed = 0
+            for rank in range(high - 4, high + 1):
+                needed |= 1 << (rank if rank >= 0 else RANK_ACE)
+            if mask & needed == needed:
+                highRank = high
+                break
+        table.append(highRank)
+    return table
+
+
+KICKERS = [None] + [buildKickerTable(count) for count in range(1, 6)]
+KICKERS_1, KICKERS_2, KICKERS_3, KICKERS_5 = KICKERS[1], KICKERS[2], KICKERS[3], KICKERS[5]
+STRAIGHT_HIGH = buildStraightTable()
+STRAIGHT_VALUE = [(STRAIGHT << CATEGORY_SHIFT) | straightSlots(high) if high >= 3 else 0 for high in range(13)]
+STRAIGHT_FLUSH_VALUE = [(STRAIGHT_FLUSH << CATEGORY_SHIFT) | straightSlots(high) if high >= 3 else 0 for high in range(13)]
+POPCOUNT = [bin(mask).count('1') for mask in range(8192)]
+
+
+def evaluate(values):
+    # Strength of the best five-card hand that can be made of one to seven card values
+    return evaluateMask(sum(map(CARD_MASK.__getitem__, values)))
+
+
+def evaluateMask(handMask):
+    # Strength of a hand given as a card mask: OR (or sum) of CARD_MASK of its cards.
+    # Masks of the hole cards and the board can be combined without re-reading the cards.
+    s0 = handMask & 0x1FFF
+    s1 = (handMask >> 16) & 0x1FFF
+    s2 = (handMask >> 32) & 0x1FFF
+    s3 = handMask >> 48
+    
+    # With seven cards or fewer a flush rules out four of a kind and full house
+    for mask in (s0, s1, s2, s3):
+        if POPCOUNT[mask] >= 5:
+            high = STRAIGHT_HIGH[mask]
+            if high >= 0:
+                return STRAIGHT_FLUSH_VALUE[high]
+            return (FLUSH << CATEGORY_SHIFT) | KICKERS_5[mask]
+        
+    # Ranks held in at least one, two, three and four suits
+    m1 = s0 | s1 | s2 | s3
+    m2 = (s0 & (s1 | s2 | s3)) | (s1 & (s2 | s3)) | (s2 & s3)
+    m3 = (s0 & s1 & (s2 | s3)) | (s2 & s3 & (s0 | s1))
+    m4 = s0 & s1 & s2 & s3
+    
+    if m4:
+        quadRank = m4.bit_length() - 1
+        slot = quadRank + 1
+        return (FOUR_OF_A_KIND << CATEGORY_SHIFT) | (slot << 16) | (slot << 12) | (slot << 8) | (slot << 4) | KICKERS_1[m1 & ~(1 << quadRank)]
+    
+    if m3:
+        tripsRank = m3.bit_length() - 1
+        pairMask = m2 & ~(1 << tripsRank)
+        if pairMask:
+            tripsSlot = tripsRank + 1
+            pairSlot = pairMask.bit_length()
+            return (FULL_HOUSE << CATEGORY_SHIFT) | (tripsSlot << 16) | (tripsSlot << 12) | (tripsSlot << 8) | (pairSlot << 4) | pairSlot
+        
+    high = STRAIGHT_HIGH[m1]
+    if high >= 0:
+        return STRAIGHT_VALUE[high]
+    
+    if m3:
+        slot = tripsRank + 1
+        return (THREE_OF_A_KIND << CATEGORY_SHIFT) | (slot << 16) | (slot << 12) | (slot << 8) | KICKERS_2[m1 & ~(1 << tripsRank)]
+    
+    if m2:
+        highPairRank = m2.bit_length() - 1
+        lowPairMask = m2 & ~(1 << highPairRank)
+        highSlot = highPairRank + 1
+        if lowPairMask:
+            lowPairRank = lowPairMask.bit_length() - 1
+            lowSlot = lowPairRank + 1
+            return (TWO_PAIRS << CATEGORY_SHIFT) | (highSlot << 16) | (highSlot << 12) | (lowSlot << 8) | (lowSlot << 4) | KICKERS_1[m1 & ~(1 << highPairRank) & ~(1 << lowPairRank)]
+        return (PAIR << CATEGORY_SHIFT) | (highSlot << 16) | (highSlot << 12) | KICKERS_3[m1 & ~(1 << highPairRank)]
+    
+    return KICKERS_5[m1]
+
+
+def getCategory(strength):
+    return strength >> CATEGORY_SHIFT
+
+
+def getRanks(strength):
+    # Ranks of the best five cards in order of significance
+    ranks = []
+    for shift in (16, 12, 8, 4, 0):
+        slot = (strength >> shift) & 0xF
+        if slot:
+            ranks.append(slot - 1)
+    return ranks
@@ -0,0 +1,127 @@
+from packetsyntax import SX_EOR
+from protocol import PROTOCOL_V1, PROTOCOL_V2
+from serversettings import *
+
+# One bytes object per possible header byte so decoding a frame doesn't allocate a new one
+HEADER_BYTES = [bytes([i]) for i in range(256)]
+EOR_BYTE = SX_EOR[0]
+
+
+class FrameDecoder(object):
+    # Incremental decoder for the SX_EOR terminated protocol and the length-prefixed frames of protocol version 2.
+    # Received data is kept in one preallocated bytearray and frames are located with find() or their length,
+    # so a frame costs a single copy of its payload no matter how it was fragmented.
+    buffer = None
+    view = None
+    maxFrameSize = MAX_FRAME_SIZE
+    protocolVersion = PROTOCOL_V1 # Can change between two frames, see protocol.py
+    
+    start = 0 # Start of the first frame that has not been decoded yet
+    end = 0 # End of the received data
+    scanFrom = 0 # Where to continue looking for the next SX_EOR
+    
+    
+    def __init__(self, bufferSize = RECEIVE_BUFFER_SIZE, maxFrameSize = MAX_FRAME_SIZE):
+        self.buffer = bytearray(bufferSize)
+        self.view = memoryview(self.buffer)
+        self.maxFrameSize = maxFrameSize
+        self.protocolVersion = PROTOCOL_V1
+        self.start = 0
+        self.end = 0
+        self.scanFrom = 0
+        
+        
+    def getWriteBuffer(self):
+        # Returns a writable memoryview of the free space at the end of the buffer
+        if self.end == len(self.buffer):
+            self.makeRoom()
+        return self.view[self.end:]
+    
+    
+    def commit(self, length):
+        # Marks length bytes written into getWriteBuffer() as received
+        self.end += length
+        
+        
+    def recvInto(self, sock):
+        # Receives directly into the buffer. Returns the number of bytes received (0 on EOF).
+        with self.getWriteBuffer() as writeBuffer:
+            received = sock.recv_into(writeBuffer)
+        self.commit(received)
+        return received
+    
+    
+    def feed(self, data):
+        # Copies already received data (e.g. from asyncio) into the buffer
+        length = len(data)
+        while len(self.buffer) - self.end < length:
+            self.makeRoom()
+        self.buffer[self.end:self.end + length] = data
+        self.end += length
+        
+        
+    def makeRoom(self):
+        pending = self.end - self.start
+        if self.start > 0:
+            # Move the unfinished frame to the beginning of the buffer
+            self.buffer[:pending] = bytes(self.view[self.start:self.end])
+            self.scanFrom -= self.start
+            self.start = 0
+            self.end = pending
+            if pending < len(self.buffer):
+                return
+        if len(self.buffer) >= self.maxFrameSize:
+            raise ValueError('Request is longer than %d bytes.' % self.maxFrameSize)
+        # The unfinished frame fills the whole buffer: grow it
+        self.view.release()
+        self.buffer.extend(bytes(len(self.buffer)))
+        self.view = memoryview(self.buffer)
+        
+        
+    def frames(self):
+        # Yields every complete frame as (requestType, payload)
+        buffer = self.buffer
+        while True:
+            frameStart = self.start
+            if self.protocolVersion >= PROTOCOL_V2:
+                # Varint length followed by the frame
+                length = 0
+                shift = 0
+                position = frameStart
+                while position < self.end:
+                    byte = buffer[position]
+                    position += 1
+                    length |= (byte & 0x7F) << shift
+                    shift += 7
+                    if byte < 0x80:
+                        break
+                else:
+                    if position - frameStart >= 4:
+                        raise ValueError('Request is longer than %d bytes.' % self.maxFrameSize)
+                    break
+                if length > self.maxFrameSize:
+                    raise ValueError('Request is longer than %d bytes.' % self.maxFrameSize)
+                frameEnd = position + length
+                if frameEnd > self.end:
+                    break
+                self.start = frameEnd
+                self.scanFrom = frameEnd
+                if length == 0: # Empty request
+                    continue
+                yield HEADER_BYTES[buffer[position]], bytes(self.view[position + 1:frameEnd])
+                continue
+                
+            eor = buffer.find(EOR_BYTE, self.scanFrom, self.end)
+            if eor == -1:
+                self.scanFrom = self.end
+                break
+            self.start = eor + 1
+            self.scanFrom = self.start
+            if eor == frameStart: # Empty request
+                continue
+            yield HEADER_BYTES[buffer[frameStart]], bytes(self.view[frameStart + 1:eor])
+            
+        if self.start == self.end: # Everything was decoded; start filling from the beginning again
+            self.start = 0
+            self.end = 0
+            self.scanFrom = 0
\ No newline at end of file
@@ -1,26 +1,43 @@
 from math import floor
-from random import shuffle
+import random
 from gamestates import *
 from packetsyntax import *
-from time import sleep, time
-from hand import Hand
-from card import Card
+import threading
+from time import time, perf_counter
+from evaluator import CARD_MASK, evaluateMask
+from card import CARDS
 from pokerplayer import PokerPlayer
 from timer import Timer
 from sidepot import SidePot
 from serversettings import *
+from client import buildPacket
+from protocol import PROTOCOL_V2, encodeGameData, decodeVarint
+from handhistory import HandRecord
+from metrics import GAME_ACTION_SECONDS, GAME_SHOWDOWN_SECONDS
+import logging
+
+log = logging.getLogger('game')
+
+MAX_SEATS = 10 # Most seats a table can have
+BET_MAX = 0xFFFFFFFF # Most chips a bet can ask for, the hand history records them in 32 bits
 
 class TexasHoldEmGame(object):
     gameID = -1
     gameType = GM_HOLDEM
     gameState = GMST_START
     
-    players = []
-    maxPlayers = 2
+    players = [] # Players sitting at the table, in the order they sat down
+    maxPlayers = HOLDEM_SEATS
+    # Seats, always changed together by takeSeat, leaveSeat and moveToChair:
+    seats = [] # chair -> the player sitting in it, None if it is free
+    freeSeatBits = 0 # Bit chair is set while the chair is free
+    nextTakenChair = [] # chair -> the first taken chair after it going around the table (itself if it is the only one), -1 if all are free
     spectatingPlayers = []
+    leftPlayers = [] # Players who disconnected, kept while the game still points at them (see releaseLeftPlayers)
     lastAddedPlayer = None
     
-    deck = []
+    deck = [] # All 52 cards, shuffled in place every hand
+    deckPosition = 0 # Index of the next card to deal
     cardsOnTable = []
     
     defaultSmallBlind = 10
@@ -33,7 +50,7 @@ class TexasHoldEmGame(object):
     smallBlindPlayer = None
     bigBlindPlayer = None
     
-    sidePots = []
+    sidePots = [] # The main pot followed by the side pots, see calculateSidePots()
     pot = 0
     roundMinBet = 0
     
@@ -49,18 +66,118 @@ class TexasHoldEmGame(object):
     foldTimerSeconds = 15 # How many seconds each turn lasts
     waitTimer = None
     waitTimerSeconds = 2 # How many seconds the server has to wait between showing new cards
+    handEndTimer = None
+    handEndTimerSeconds = 5 # How many seconds the results of a hand are shown before the next one
     
+    # Hand history (see handhistory.py)
+    handHistory = None # HandHistoryWriter the finished hands are given to, None to not record them
+    handRecord = None # The hand being played
+    handNumber = 0
     
-    def __init__(self, gameID):
-        self.gameID = gameID
-        self.gameState = GMST_START
+    occupancyListener = None # Called with the game when a player sits down or leaves the table (see Games and WorkerGames)
+    playerPool = None # PlayerPool the players are taken from, None to create them (see tablepool.py)
+    clock = None # Returns the current time in seconds; a simulation can run the game on its own clock
+    rng = None # Shuffles the deck; random unless a simulation provides a seeded or stacked one
+    lock = None # Held while the game is updated or handles events from clients (see Games and GameScheduler)
+    
+    
+    def __init__(self, gameID, clock = time, rng = random, maxPlayers = HOLDEM_SEATS):
         self.players = []
+        self.setMaxPlayers(maxPlayers)
         self.spectatingPlayers = []
-        self.foldTimer = Timer(self.foldTimerSeconds)
-        self.waitTimer = Timer(self.waitTimerSeconds)
-        print('Created game with ID: %d' % self.gameID)
+        self.leftPlayers = []
+        self.deck = list(CARDS)
+        self.cardsOnTable = []
+        self.clock = clock
+        self.rng = rng
+        self.foldTimer = Timer(self.foldTimerSeconds, clock)
+        self.waitTimer = Timer(self.waitTimerSeconds, clock)
+        self.handEndTimer = Timer(self.handEndTimerSeconds, clock)
+        self.lock = threading.RLock()
+        self.reset(gameID)
+        log.info('Created game with ID: %d', self.gameID)
     
     
+    def reset(self, gameID):
+        # Makes the table as good as new for another game, so a closed table can be used again
+        self.gameID = gameID
+        self.gameState = GMST_START
+        del self.players[:]
+        self.setMaxPlayers(self.maxPlayers)
+        del self.spectatingPlayers[:]
+        del self.leftPlayers[:]
+        self.lastAddedPlayer = None
+        self.deck[:] = CARDS
+        self.deckPosition = 0
+        self.cleanTable()
+        self.dealerPlayerChair = -1
+        self.smallBlindPlayerChair = -1
+        self.bigBlindPlayerChair = -1
+        self.dealerPlayer = None
+        self.smallBlindPlayer = None
+        self.bigBlindPlayer = None
+        self.foldTimer.reset()
+        self.waitTimer.reset()
+        self.handEndTimer.reset()
+        self.handRecord = None
+        self.handNumber = 0
+    
+    
+    def setMaxPlayers(self, maxPlayers):
+        # Only while nobody sits at the table
+        if not 2 <= maxPlayers <= MAX_SEATS:
+            raise ValueError('A table has 2 - %d seats, not %d.' % (MAX_SEATS, maxPlayers))
+        if len(self.players) > 0:
+            raise ValueError('Can\'t change the seats of a table players are sitting at.')
+        self.maxPlayers = maxPlayers
+        self.seats = [None] * maxPlayers
+        self.freeSeatBits = (1 << maxPlayers) - 1
+        self.nextTakenChair = [-1] * maxPlayers
+        
+        
+    def takeSeat(self, player, chair):
+        player.chair = chair
+        self.seats[chair] = player
+        self.freeSeatBits &= ~(1 << chair)
+        self.players.append(player)
+        self.linkSeats()
+        
+        
+    def leaveSeat(self, player):
+        self.players.remove(player)
+        if self.seats[player.chair] is player:
+            self.seats[player.chair] = None
+            self.freeSeatBits |= 1 << player.chair
+        self.linkSeats()
+        
+        
+    def moveToChair(self, player, chair):
+        # Moves a sitting player to a free chair, keeping the player's place in self.players
+        self.seats[player.chair] = None
+        self.freeSeatBits |= 1 << player.chair
+        player.chair = chair
+        self.seats[chair] = player
+        self.freeSeatBits &= ~(1 << chair)
+        self.linkSeats()
+        
+        
+    def linkSeats(self):
+        # Updates nextTakenChair, going around the table twice backwards. Only runs when someone
+        # sits down or leaves, so stepping from chair to chair costs a single lookup.
+        nextChair = -1
+        for i in range(2 * self.maxPlayers - 1, -1, -1):
+            chair = i % self.maxPlayers
+            if i < self.maxPlayers:
+                self.nextTakenChair[chair] = nextChair
+            if self.seats[chair] is not None:
+                nextChair = chair
+                
+                
+    def getFreeChair(self):
+        # The lowest free chair, -1 if the table is full
+        return (self.freeSeatBits & -self.freeSeatBits).bit_length() - 1
+        
+        
     def addPlayers(self, clientClasses):
         for c in clientClasses:
             self.addPlayer(c)
@@ -70,7 +187,10 @@ class TexasHoldEmGame(object):
         clientClass.currentGameID = self.gameID
         clientClass.gameStatus = ST_IN_GAME
         
-        player = PokerPlayer(clientClass)
+        if self.playerPool is not None:
+            player = self.playerPool.acquire(clientClass)
+        else:
+            player = PokerPlayer(clientClass)
         self.spectatingPlayers.append(player)
         self.announcePlayersChips([player], player) # Tell the player how many chips the player has
         self.announcePlayers(player) # Tell the player who is sitting at the table
@@ -82,7 +202,13 @@ class TexasHoldEmGame(object):
         
     def removePlayer(self, player):
         if player in self.players:
-            self.players.remove(player)
+            self.leaveSeat(player)
+            self.occupancyChanged()
+            
+            
+    def occupancyChanged(self):
+        if self.occupancyListener is not None:
+            self.occupancyListener(self)
             
             
     def removeSpectator(self, player):
@@ -101,33 +227,76 @@ class TexasHoldEmGame(object):
         return self.players + self.spectatingPlayers
         
         
-    def sendToAll(self, headerByte, dataString = ''):
-        for p in self.getAllPlayers():
-            self.sendToPlayer(p, headerByte, dataString)
+    # The fields of a game packet are listed in protocol.GAME_FIELDS
+    def sendToAll(self, headerByte, fields = ()):
+        self.sendToPlayers(self.getAllPlayers(), headerByte, fields)
             
     
-    def sendToAllBut(self, clientClassNotIncluded, headerByte, dataString = ''):
-        for p in self.getAllPlayers():
-            if p.clientClass is not clientClassNotIncluded:
-                self.sendToPlayer(p, headerByte, dataString)
+    def sendToAllBut(self, clientClassNotIncluded, headerByte, fields = ()):
+        self.sendToPlayers([p for p in self.getAllPlayers() if p.clientClass is not clientClassNotIncluded], headerByte, fields)
+        
+        
+    def sendToPlayers(self, players, headerByte, fields = ()):
+        # Encode the packet once per protocol version and send the same bytes to every player speaking it
+        packets = {}
+        for p in players:
+            version = p.clientClass.protocolVersion
+            if version not in packets:
+                packets[version] = self.buildGamePacket(headerByte, fields, version)
+            if packets[version] is not None:
+                self.sendPacketToPlayer(p, packets[version])
                 
                 
-    def sendToPlayer(self, player, headerByte, dataString = '', disconnectOnFail = True):
+    def sendToPlayer(self, player, headerByte, fields = (), disconnectOnFail = True):
+        if player.clientClass.isDisconnected():
+            return
+        packet = self.buildGamePacket(headerByte, fields, player.clientClass.protocolVersion)
+        if packet is not None:
+            self.sendPacketToPlayer(player, packet)
+            
+            
+    def buildGamePacket(self, headerByte, fields, version):
+        try:
+            data = encodeGameData(headerByte, fields, version)
+        except UnicodeEncodeError as e:
+            log.warning('Failed to encode game data: %s', e)
+            return None
+        return buildPacket(SX_GAME_INFO, headerByte, data, version)
+        
+        
+    def sendPacketToPlayer(self, player, packet):
         if player.clientClass.isDisconnected():
             return
-        if not player.clientClass.sendPacket(SX_GAME_INFO, headerByte, dataString):
-            print('Failed to send a packet to player %s.' % player.getName())
+        if not player.clientClass.sendRawPacket(packet):
+            log.warning('Failed to send a packet to player %s.', player.getName())
             self.handleDisconnect(player.clientClass)
         
         
     def handleDisconnect(self, clientClass):
         player = self.findPlayer(clientClass)
         if player is not None:
-            print('Player %s disconnected from the game.' % player.getName())
+            log.info('Player %s disconnected from the game.', player.getName())
             self.endGameForPlayer(player)
-            self.sendToAllBut(clientClass, SX_GAME_DISCONNECT, player.getName())
+            self.sendToAllBut(clientClass, SX_GAME_DISCONNECT, [player])
             self.removePlayer(player)
             self.removeSpectator(player)
+            self.leftPlayers.append(player)
+        
+        
+    def releaseLeftPlayers(self):
+        # Gives the players who left back to the player pool once no button, turn or pot points at them.
+        # Only called from update(): a player who disconnects in the middle of a loop over the players
+        # may still be used by that loop.
+        inUse = set(p for p in (self.dealerPlayer, self.smallBlindPlayer, self.bigBlindPlayer,
+                                self.currentPlayerTurn, self.lastPlayerTurn, self.lastAddedPlayer) if p is not None)
+        for sidePot in self.sidePots:
+            inUse.update(sidePot.playersInPot)
+        released = [p for p in self.leftPlayers if p not in inUse]
+        if len(released) == 0:
+            return
+        self.leftPlayers = [p for p in self.leftPlayers if p in inUse]
+        if self.playerPool is not None:
+            self.playerPool.release(released)
         
         
     def addSittingPlayer(self, player):
@@ -135,31 +304,19 @@ class TexasHoldEmGame(object):
         if player in self.spectatingPlayers:
             self.spectatingPlayers.remove(player)
             
-        # Assign a free chair for the player
-        chair = 0
-        freeChair = False
-        while not freeChair:
-            freeChair = True
-            for p in self.players:
-                if p.chair == chair:
-                    freeChair = False
-                    chair += 1
-                    break
-        player.chair = chair
-        
         # If there were at least two other players before the player, the player has to pay a big blind (when he gets to play)
         if len(self.players) > 1:
             player.waitForBigBlind = True
         
-        # Add the player to active players
-        self.players.append(player)
+        # Add the player to active players on the lowest free chair
+        self.takeSeat(player, self.getFreeChair())
+        self.occupancyChanged()
         
         # Change the player's status to ST_PLAYING
         player.sitIn()
 
         # Tell everyone there is a new player sitting at the table
-        playersData = player.getName() + SXSTR_EOO + str(player.chair)
-        self.sendToAll(SX_GAME_PLAYER_CHAIR, playersData)
+        self.sendToAll(SX_GAME_PLAYER_CHAIR, [player.getName(), player.chair])
         
         # Tell everyone how many chips this player has
         self.announcePlayersChips([player])
@@ -173,7 +330,7 @@ class TexasHoldEmGame(object):
         player.sitOut()
 
         # Tell everyone the player is no longer sitting at the table
-        self.sendToAll(SX_GAME_PLAYER_SIT_OUT, player.getName())
+        self.sendToAll(SX_GAME_PLAYER_SIT_OUT, [player])
         
         # Remove the player from active players and make the player a spectator
         self.removePlayer(player)
@@ -200,17 +357,28 @@ class TexasHoldEmGame(object):
                 self.sendToPlayer(player, SX_GAME_TABLE_FULL)
             elif player not in self.players:
                 if player.chips > 0:
-                    print('Player %s now sits at the table.' % player.getName())
+                    log.info('Player %s now sits at the table.', player.getName())
                 else:
-                    print('Player %s wants to sit at the table but does not have enough chips.' % player.getName())
+                    log.info('Player %s wants to sit at the table but does not have enough chips.', player.getName())
                     player.chips = 100
                 self.addSittingPlayer(player)
             
         elif dataByte == SX_GAME_BET:
-            self.checkCallRaiseBetFold(player, int(data[1:]))
+            started = perf_counter()
+            if clientClass.protocolVersion >= PROTOCOL_V2:
+                amount = decodeVarint(data, 1)[0]
+            else:
+                amount = int(data[1:])
+            if not 0 <= amount <= BET_MAX:
+                log.warning('Player %s tried to bet %d chips.', player.getName(), amount)
+                return
+            self.checkCallRaiseBetFold(player, amount)
+            GAME_ACTION_SECONDS.observe(perf_counter() - started)
             
         elif dataByte == SX_GAME_FOLD:
+            started = perf_counter()
             self.checkCallRaiseBetFold(player, 0, True)
+            GAME_ACTION_SECONDS.observe(perf_counter() - started)
             
         elif dataByte == SX_GAME_PLAYER_SIT_OUT:
             self.endGameForPlayer(player)
@@ -221,9 +389,9 @@ class TexasHoldEmGame(object):
         
     def sendChatMessage(self, sendingPlayer, message):
         try:
-            decodedMessage = sendingPlayer.clientClass.currentRequest.data.decode("utf-8")
+            decodedMessage = message.decode("utf-8")
         except UnicodeDecodeError as e:
-            print('Failed to decode a chat message from player %s: ' % (sendingPlayer.getName(), str(e)))
+            log.warning('Failed to decode a chat message from player %s: %s', sendingPlayer.getName(), e)
             return
         
         # Remove and replace newlines
@@ -231,33 +399,35 @@ class TexasHoldEmGame(object):
         decodedMessage = decodedMessage.replace("\n", " ")
         
         decodedMessage = decodedMessage[:CHAT_MESSAGE_MAX_LENGTH]
-        self.sendToAll(SX_GAME_CHAT_MESSAGE, sendingPlayer.getName() + SXSTR_EOO + decodedMessage)
+        self.sendToAll(SX_GAME_CHAT_MESSAGE, [sendingPlayer, decodedMessage])
         
         
     def checkCallRaiseBetFold(self, player, amount, fold = False):
-        print('Player %s is trying to check, call, raise, bet or fold.' % player.getName())
+        requestedAmount = amount
+        log.debug('Player %s is trying to check, call, raise, bet or fold.', player.getName())
         if self.currentPlayerTurn is not None:
-            print('Current player turn: %s' % self.currentPlayerTurn.getName())
+            log.debug('Current player turn: %s', self.currentPlayerTurn.getName())
         else:
-            print('But it is no one\'s turn!')
+            log.debug('But it is no one\'s turn!')
             return
         
         if self.currentPlayerTurn is player:
             messageAction = SX_GAME_BET
+            chipsTaken = 0
             if fold:
-                print('Player %s folded.' % player.getName())
+                log.debug('Player %s folded.', player.getName())
                 player.folded = True
                 messageAction = SX_GAME_FOLD
             else:
                 if amount == 0:
                     if self.roundMinBet == player.totalBet:
-                        print('Player %s is checking.' % player.getName())
+                        log.debug('Player %s is checking.', player.getName())
                     else:
                         amount = self.roundMinBet - player.totalBet
                         if amount < player.chips:
-                            print('Player %s is calling [%d].' % (player.getName(), amount))
+                            log.debug('Player %s is calling [%d].', player.getName(), amount)
                         else:
-                            print('Player %s is going all in with a call [%d].' % (player.getName(), amount))
+                            log.debug('Player %s is going all in with a call [%d].', player.getName(), amount)
                 else:
                     self.currentRound += 1
                     minBetRaiseAmount = (self.roundMinBet - player.totalBet) + self.bigBlindAmount
@@ -267,27 +437,29 @@ class TexasHoldEmGame(object):
                         
                     if self.roundMinBet == player.totalBet:
                         if amount < player.chips:
-                            print('Player %s is betting [%d].' % (player.getName(), amount))
+                            log.debug('Player %s is betting [%d].', player.getName(), amount)
                         else:
-                            print('Player %s is going all in with a bet [%d].' % (player.getName(), amount))
+                            log.debug('Player %s is going all in with a bet [%d].', player.getName(), amount)
                     else:
                         if amount < player.chips:
-                            print('Player %s is raising [%d].' % (player.getName(), amount))
+                            log.debug('Player %s is raising [%d].', player.getName(), amount)
                         else:
-                            print('Player %s is going all in with a raise [%d].' % (player.getName(), amount))
+                            log.debug('Player %s is going all in with a raise [%d].', player.getName(), amount)
 
-                self.pot += player.takeChips(amount)
+                chipsTaken = player.takeChips(amount)
+                self.pot += chipsTaken
                 if self.roundMinBet < player.totalBet:
                     self.roundMinBet = player.totalBet
                     
             player.currentRound = self.currentRound
-            self.sendToAll(messageAction, player.getName() + SXSTR_EOO + str(amount))
+            self.recordAction(player, messageAction, requestedAmount, chipsTaken)
+            self.sendToAll(messageAction, [player, amount])
             self.handleTurn()
 
                         
     def everyoneHasPlayed(self):
         if len(self.players) < 2:
-            print('Not enough players!')
+            log.debug('Not enough players!')
             return -1
         
         allPlayed = True
@@ -300,7 +472,7 @@ class TexasHoldEmGame(object):
         if not allPlayed:
             return 0
         
-        print('All players have played.')
+        log.debug('All players have played.')
         return 1
                         
         
@@ -309,65 +481,49 @@ class TexasHoldEmGame(object):
         
         
     def shuffleDeck(self):
-        self.deck = []
-        for x in range(0, 51):
-            suit = floor(x / 13)
-            rank = x % 13
-            card = Card(suit, rank)
-            self.deck.append(card)
-        shuffle(self.deck)
-        print('Deck shuffled.')
+        self.rng.shuffle(self.deck)
+        self.deckPosition = 0
+        log.debug('Deck shuffled.')
+        
+        
+    def dealCard(self):
+        card = self.deck[self.deckPosition]
+        self.deckPosition += 1
+        return card
         
         
     def dealCardsToTable(self, number):
-        print('Dealing cards to the table.')
+        log.debug('Dealing cards to the table.')
         for x in range(0, number):
-            print('Dealt %d of %d to the table.' % (self.deck[0].rank, self.deck[0].suit))
-            self.cardsOnTable.append(self.deck[0])
-            self.deck.pop(0)
+            card = self.dealCard()
+            log.debug('Dealt %d of %d to the table.', card.rank, card.suit)
+            self.cardsOnTable.append(card)
         
-        cardString = ""
-        
-        for c in self.cardsOnTable:
-            cardString += str(c)
-            cardString += SXSTR_EOO
-        cardString = cardString[:-1] # Remove last unnecessary SXSTR_EOO
-        self.sendToAll(SX_GAME_DEAL_TABLE, cardString)
+        self.sendToAll(SX_GAME_DEAL_TABLE, self.cardsOnTable)
 
         
     def dealCardsToPlayers(self, number):
-        print('Dealing cards to players.')
+        log.debug('Dealing cards to players.')
         playingPlayers = self.getPlayingPlayers()
         for x in range(0, number):
             for p in playingPlayers:
-                print('Dealt %d of %d to %s.' % (self.deck[0].rank, self.deck[0].suit, p.getName()))
-                p.addCard(self.deck[0])
-                self.deck.pop(0)
+                card = self.dealCard()
+                log.debug('Dealt %d of %d to %s.', card.rank, card.suit, p.getName())
+                p.addCard(card)
                 
         for p in playingPlayers:
-            cardString = ""
-            for c in p.cards:
-                cardString += str(c)
-                cardString += SXSTR_EOO
-            cardString = cardString[:-1] # Remove last unnecessary SXSTR_EOO
-            self.sendToPlayer(p, SX_GAME_DEAL_HAND, cardString)
+            self.sendToPlayer(p, SX_GAME_DEAL_HAND, p.cards)
             
         self.announcePlayersCardCounts(self.players)
         
         
-    def startGame(self):
-        print('Waiting for players to be ready.')
-        self.gameLoop()
-        print('gameLoop() ended.')
-        
-        
     def resetPlayers(self):
         for p in self.players:
             p.reset()
         
         
     def checkChips(self):
-        for p in self.players:
+        for p in list(self.players): # endGameForPlayer() removes the player from self.players
             if p.chips == 0:
                 self.endGameForPlayer(p)
         
@@ -376,16 +532,13 @@ class TexasHoldEmGame(object):
         if player is None:
             return None
         
+        # Every taken chair once, the player's own chair last
         nextChair = player.chair
-        for x in range(0, self.maxPlayers):
-            if nextChair == (self.maxPlayers - 1):
-                nextChair = 0
-            else:
-                nextChair += 1
-                
-            for p in self.players:
-                if p.chair == nextChair and (allowSame or p.chair != player.chair) and self.playerCanPlayThisTurn(p):
-                    return p
+        for x in range(0, len(self.players)):
+            nextChair = self.nextTakenChair[nextChair]
+            p = self.seats[nextChair]
+            if (allowSame or nextChair != player.chair) and self.playerCanPlayThisTurn(p):
+                return p
                 
         return None
     
@@ -395,21 +548,17 @@ class TexasHoldEmGame(object):
             chair = 0
         
         nextChair = chair
-        for x in range(0, self.maxPlayers):
-            if nextChair >= (self.maxPlayers - 1):
-                nextChair = 0
-            else:
-                nextChair += 1
-                
+        for x in range(0, len(self.players)):
+            nextChair = self.nextTakenChair[nextChair]
             if bigBlind and nextChair == self.dealerPlayer.chair:
                 # Dealer can never also be the big blind
-                print('Dealer can never also be the big blind!')
+                log.debug('Dealer can never also be the big blind!')
                 continue
                 
-            for p in self.players:
-                if p.chair == nextChair and p.chair != chair and (bigBlind or not p.waitForBigBlind):
-                    print('Original chair: %d found chair: %d' % (chair, nextChair))
-                    return p
+            p = self.seats[nextChair]
+            if nextChair != chair and (bigBlind or not p.waitForBigBlind):
+                log.debug('Original chair: %d found chair: %d', chair, nextChair)
+                return p
                 
         return None
         
@@ -423,27 +572,33 @@ class TexasHoldEmGame(object):
     def moveButtons(self):
         playersTotal = len(self.players)
         
+        # Waiting for the big blind only works while at least two players are already playing
+        if len([p for p in self.players if not p.waitForBigBlind]) < 2:
+            for p in self.players:
+                p.waitForBigBlind = False
+        
         for p in self.players:
-            print('Player: %s. Chair: %d.' % (p.getName(), p.chair))
+            log.debug('Player: %s. Chair: %d.', p.getName(), p.chair)
         
         if self.dealerPlayerChair == -1:
-            # The very first player sitting at the table gets to be the dealer
-            self.dealerPlayer = self.players[0]
+            # The player on the lowest taken chair gets to be the dealer
+            takenBits = ~self.freeSeatBits & ((1 << self.maxPlayers) - 1)
+            self.dealerPlayer = self.seats[(takenBits & -takenBits).bit_length() - 1]
             
             if playersTotal > 2:
-                # The ones following the dealer get to be the small and big blinds, respectively
-                self.smallBlindPlayer = self.players[1]
-                self.bigBlindPlayer = self.players[2]
+                # The ones following the dealer around the table get to be the small and big blinds, respectively
+                self.smallBlindPlayer = self.seats[self.nextTakenChair[self.dealerPlayer.chair]]
+                self.bigBlindPlayer = self.seats[self.nextTakenChair[self.smallBlindPlayer.chair]]
                 
             else:
                 # In two-player matches the dealer is also the small blind
-                self.smallBlindPlayer = self.players[0]
-                self.bigBlindPlayer = self.players[1]
+                self.smallBlindPlayer = self.dealerPlayer
+                self.bigBlindPlayer = self.seats[self.nextTakenChair[self.dealerPlayer.chair]]
                 
         else:
             if playersTotal > 2:
                 if self.dealerPlayer is not self.smallBlindPlayer:
-                    print('A')
+                    log.debug('A')
                     # The dealer button always moves to the next chair unless the player sitting on that chair only just joined
                     self.dealerPlayer = self.getNextChairFrom(self.dealerPlayerChair)
                     # Small blind player is the next one from dealer
@@ -452,7 +607,7 @@ class TexasHoldEmGame(object):
                     self.bigBlindPlayer = self.getNextChairFrom(self.smallBlindPlayer.chair, True)
                     
                 else:
-                    print('B')
+                    log.debug('B')
                     # The dealer is also the small blind; this means it used to be a two-player match but no longer is
                     # Make the old big blind the small blind while the dealer stays the same and make that new player the big blind
                     self.smallBlindPlayer = self.getNextChairFrom(self.dealerPlayerChair)
@@ -461,7 +616,7 @@ class TexasHoldEmGame(object):
             else:
                 # Move the dealer button to the next chair and also make that player the small blind
                 # The other player is then the big blind
-                print('C')
+                log.debug('C')
                 self.dealerPlayer = self.getNextChairFrom(self.dealerPlayerChair)
                 self.smallBlindPlayer = self.dealerPlayer
                 self.bigBlindPlayer = self.getNextChairFrom(self.smallBlindPlayer.chair, True)
@@ -471,47 +626,38 @@ class TexasHoldEmGame(object):
         self.smallBlindPlayerChair = self.smallBlindPlayer.chair
         self.bigBlindPlayerChair = self.bigBlindPlayer.chair
         
-        print('D player\'s chair: %d' % self.dealerPlayer.chair)
-        print('SB player\'s chair: %d' % self.smallBlindPlayer.chair)
-        print('BB player\'s chair: %d' % self.bigBlindPlayer.chair)
+        log.debug('D player\'s chair: %d', self.dealerPlayer.chair)
+        log.debug('SB player\'s chair: %d', self.smallBlindPlayer.chair)
+        log.debug('BB player\'s chair: %d', self.bigBlindPlayer.chair)
         
         
     def takeBlinds(self):
         smallBlind = self.smallBlindPlayer.takeChips(self.smallBlindAmount)
-        print('Taking a small blind of %d from %s.' % (smallBlind, self.smallBlindPlayer.getName()))
+        self.recordAction(self.smallBlindPlayer, SX_GAME_BLINDS, self.smallBlindAmount, smallBlind)
+        log.debug('Taking a small blind of %d from %s.', smallBlind, self.smallBlindPlayer.getName())
         self.pot += smallBlind
         
-        blindsData = self.smallBlindPlayer.getName()
-        blindsData += SXSTR_EOO
-        blindsData += str(self.smallBlindAmount)
+        blindsData = [self.smallBlindPlayer, self.smallBlindAmount]
         
         # Allow every new player sitting ahead of the big blind but before the dealer to play
         # Also collect big blinds from them and from the big blind player
-        bigBlindPlayers = [p for p in self.players if (p.waitForBigBlind or p is self.bigBlindPlayer)]
-        print('bigBlindPlayers length: %d.' % len(bigBlindPlayers))
+        # The taken chairs from the big blind's up to the dealer's
         newChair = self.bigBlindPlayer.chair
-        for x in range(0, self.maxPlayers):
-            for p in bigBlindPlayers:
-                print('Checking %s (%d).' % (p.getName(), p.chair))
-                if p.chair == newChair and (p.waitForBigBlind or p is self.bigBlindPlayer):
-                    p.waitForBigBlind = False
-                    bigBlindPlayers.remove(p)
-                    bigBlind = p.takeChips(self.bigBlindAmount)
-                    if p is not self.bigBlindPlayer:
-                        print('New player %s is sitting on %d and therefore is between %d and %d and can now play!' % (p.getName(), p.chair, self.bigBlindPlayer.chair, self.dealerPlayer.chair))
-                    print('Taking a big blind of %d from %s.' % (bigBlind, p.getName()))
-                    self.pot += bigBlind
-                    
-                    blindsData += SXSTR_EOO
-                    blindsData += p.getName()
-                    blindsData += SXSTR_EOO
-                    blindsData += str(self.bigBlindAmount)
-                    
-            if newChair == (self.maxPlayers - 1):
-                newChair = 0
-            else:
-                newChair += 1
+        for x in range(0, len(self.players)):
+            p = self.seats[newChair]
+            log.debug('Checking %s (%d).', p.getName(), p.chair)
+            if p.waitForBigBlind or p is self.bigBlindPlayer:
+                p.waitForBigBlind = False
+                bigBlind = p.takeChips(self.bigBlindAmount)
+                self.recordAction(p, SX_GAME_BLINDS, self.bigBlindAmount, bigBlind)
+                if p is not self.bigBlindPlayer:
+                    log.debug('New player %s is sitting on %d and therefore is between %d and %d and can now play!', p.getName(), p.chair, self.bigBlindPlayer.chair, self.dealerPlayer.chair)
+                log.debug('Taking a big blind of %d from %s.', bigBlind, p.getName())
+                self.pot += bigBlind
+                
+                blindsData += [p, self.bigBlindAmount]
                 
+            newChair = self.nextTakenChair[newChair]
             if newChair == self.dealerPlayer.chair:
                 break
         
@@ -522,8 +668,8 @@ class TexasHoldEmGame(object):
 
 
     def cleanTable(self): # Next hand
-        print('Cleaning the table!')
-        self.cardsOnTable = []
+        log.debug('Cleaning the table!')
+        del self.cardsOnTable[:]
         
         self.smallBlindAmount = self.defaultSmallBlind
         self.bigBlindAmount = self.smallBlindAmount * 2
@@ -543,7 +689,7 @@ class TexasHoldEmGame(object):
 
 
     def nextRound(self, firstRound = False):
-        print('nextRound() Called!')
+        log.debug('nextRound() Called!')
         
         self.currentPlayerTurn = None
         self.currentRound += 1
@@ -555,9 +701,9 @@ class TexasHoldEmGame(object):
         if self.currentPlayerTurn is not None:
             if force or not self.foldTimer.update():
                 if toPlayer is not None:
-                    self.sendToPlayer(player, SX_GAME_PLAYER_TURN, self.currentPlayerTurn.getName() + SXSTR_EOO + str(int(round(self.foldTimer.timerLeft))))
+                    self.sendToPlayer(toPlayer, SX_GAME_PLAYER_TURN, [self.currentPlayerTurn, max(0, int(round(self.foldTimer.timerLeft)))])
                 else:
-                    self.sendToAll(SX_GAME_PLAYER_TURN, self.currentPlayerTurn.getName() + SXSTR_EOO + str(int(round(self.foldTimer.timerLeft))))
+                    self.sendToAll(SX_GAME_PLAYER_TURN, [self.currentPlayerTurn, max(0, int(round(self.foldTimer.timerLeft)))])
 
 
     def nextTurn(self):
@@ -568,7 +714,7 @@ class TexasHoldEmGame(object):
 
 
     def handleTurn(self):
-        print('handleTurn() Called!')
+        log.debug('handleTurn() Called!')
         newTurn = False
         
         if self.currentPlayerTurn is None or not self.playerCanPlayThisTurn(self.currentPlayerTurn):
@@ -579,12 +725,12 @@ class TexasHoldEmGame(object):
             playersThatCanPlay = [p for p in self.players if (p is not self.currentPlayerTurn and not p.allIn and not p.folded and not p.waitForBigBlind)]
                 
             if len(playersThatCanPlay) == 0:
-                print('We have gone All In or everyone else has gone All In!')
-                print('Player %s totalBet %d roundMinBet %d' % (self.currentPlayerTurn.getName(), self.currentPlayerTurn.totalBet, self.roundMinBet))
+                log.debug('We have gone All In or everyone else has gone All In!')
+                log.debug('Player %s totalBet %d roundMinBet %d', self.currentPlayerTurn.getName(), self.currentPlayerTurn.totalBet, self.roundMinBet)
                 if self.currentPlayerTurn.totalBet < self.roundMinBet:
-                    print('Player %s can only make a call.' % self.currentPlayerTurn.getName())
+                    log.debug('Player %s can only make a call.', self.currentPlayerTurn.getName())
                 else:
-                    print('Auto-checking for player %s.' % self.currentPlayerTurn.getName())
+                    log.debug('Auto-checking for player %s.', self.currentPlayerTurn.getName())
                     self.currentPlayerTurn.allIn = True
                     self.currentPlayerTurn = None
                     return
@@ -592,7 +738,7 @@ class TexasHoldEmGame(object):
             if newTurn:
                 self.foldTimer.start()
                 self.announceTurn()
-                print('Player %s\'s turn!' % self.currentPlayerTurn.getName())
+                log.debug('Player %s\'s turn!', self.currentPlayerTurn.getName())
             else:
                 self.announceTurn(False)
 
@@ -601,13 +747,9 @@ class TexasHoldEmGame(object):
         if len(self.players) == 0:
             return
 
-        cardsData = ''
+        cardsData = []
         for p in players:
-            cardsData += p.getName()
-            cardsData += SXSTR_EOO
-            cardsData += str(len(p.cards))
-            cardsData += SXSTR_EOO
-        cardsData = cardsData[:-1]
+            cardsData += [p, len(p.cards)]
         
         if toPlayer is None:
             self.sendToAll(SX_GAME_PLAYER_CARD_COUNT, cardsData)
@@ -619,21 +761,11 @@ class TexasHoldEmGame(object):
         if len(self.players) == 0:
             return
         
-        chipsData = ''
+        chipsData = []
+        chipsInPotData = []
         for p in players:
-            chipsData += p.getName()
-            chipsData += SXSTR_EOO
-            chipsData += str(p.chips)
-            chipsData += SXSTR_EOO
-        chipsData = chipsData[:-1]
-        
-        chipsInPotData = ''
-        for p in players:
-            chipsInPotData += p.getName()
-            chipsInPotData += SXSTR_EOO
-            chipsInPotData += str(p.totalBet)
-            chipsInPotData += SXSTR_EOO
-        chipsInPotData = chipsInPotData[:-1]
+            chipsData += [p, p.chips]
+            chipsInPotData += [p, p.totalBet]
         
         if toPlayer is None:
             self.sendToAll(SX_GAME_PLAYER_CHIPS, chipsData)
@@ -647,13 +779,9 @@ class TexasHoldEmGame(object):
         if len(self.players) == 0:
             return
         
-        playersData = ''
+        playersData = []
         for p in self.players:
-            playersData += p.getName()
-            playersData += SXSTR_EOO
-            playersData += str(p.chair)
-            playersData += SXSTR_EOO
-        playersData = playersData[:-1]
+            playersData += [p.getName(), p.chair]
 
         if toPlayer is None:
             self.sendToAll(SX_GAME_PLAYER_CHAIR, playersData)
@@ -662,12 +790,7 @@ class TexasHoldEmGame(object):
             
         
     def announceButtons(self, toPlayer = None):
-        buttonsData = ''
-        buttonsData += str(self.dealerPlayerChair)
-        buttonsData += SXSTR_EOO
-        buttonsData += str(self.smallBlindPlayerChair)
-        buttonsData += SXSTR_EOO
-        buttonsData += str(self.bigBlindPlayerChair)
+        buttonsData = [self.dealerPlayerChair, self.smallBlindPlayerChair, self.bigBlindPlayerChair]
 
         if toPlayer is None:
             self.sendToAll(SX_GAME_BUTTONS_CHAIRS, buttonsData)
@@ -693,111 +816,120 @@ class TexasHoldEmGame(object):
         self.dealCardsToTable(1)
 
         
-    # Return the player with the losing hand
-    # In case of a tie, return a None
-    def comparePlayerHands(self, player1, player2):
-        print('Comparing hands of player %s and player %s.' % (player1.getName(), player2.getName()))
-        player1Hand = Hand(player1.cards + self.cardsOnTable)
-        player2Hand = Hand(player2.cards + self.cardsOnTable)
-        
-        comparison = player1Hand.compareToHand(player2Hand)
-        
-        if comparison == -1:
-            return player2
-        elif comparison == 1:
-            return player1
-        else:
-            return None
+    def evaluateHands(self, players):
+        # Strength of each player's best hand, evaluated exactly once per player
+        started = perf_counter()
+        boardMask = sum(CARD_MASK[int(c)] for c in self.cardsOnTable)
+        strengths = {}
+        for p in players:
+            strengths[p] = evaluateMask(boardMask + sum(CARD_MASK[int(c)] for c in p.cards))
+        GAME_SHOWDOWN_SECONDS.observe(perf_counter() - started)
+        return strengths
         
         
     def endHand(self, prematureEnding = False):
-        print('Hand ended!')
-        playersNotHandled = [p for p in self.getPlayingPlayers()]
+        log.debug('Hand ended!')
+        playingPlayers = self.getPlayingPlayers()
         
         if not prematureEnding:
             self.showAllCards()
             
         self.sendToAll(SX_GAME_HAND_ENDED)
         
-        while self.pot > 0:
-            winners = [p for p in playersNotHandled]
-            
-            for p1 in playersNotHandled:
-                if p1 in winners:
-                    for p2 in playersNotHandled:
-                        if p1 is not p2 and p1 in winners and p2 in winners:
-                            losingPlayer = self.comparePlayerHands(p1, p2)
-                            if losingPlayer is not None:
-                                print('Removing %s from winners.' % losingPlayer.getName())
-                                winners.remove(losingPlayer)
-            pot = self.pot
-            sidePot = None
-            
-            for s in self.sidePots:
-                print('Looping side pot.')
+        if len(playingPlayers) > 0:
+            # Rank the hands once and settle every pot from the same ranking
+            strengths = self.evaluateHands(playingPlayers) if len(playingPlayers) > 1 else {playingPlayers[0]: 0}
+            ranking = sorted(playingPlayers, key = lambda p: strengths[p], reverse = True)
+            self.calculateSidePots()
+            
+            for sidePot in self.sidePots:
+                if self.handRecord is not None:
+                    self.handRecord.pots.append((sidePot.totalPot, sidePot.potPerPlayer, [p.chair for p in sidePot.playersInPot]))
+                winners = []
+                for p in ranking:
+                    if p in sidePot.playersInPot:
+                        if winners and strengths[p] < strengths[winners[0]]:
+                            break
+                        winners.append(p)
+                        
+                log.debug('Winners (%d) of pot %d (%d):', len(winners), sidePot.potNumber, sidePot.totalPot)
+                winningAmount = int(floor(sidePot.totalPot / len(winners)))
                 for p in winners:
-                    print('Looping winners %s.' % p.getName())
-                    if p in s.playersInPot:
-                        print('Winner %s is in side pot %d.' % (p.getName(), s.potNumber))
-                        pot = s.totalPot
-                        sidePot = s
-                        if p.totalBet == s.potPerPlayer:
-                            print('Removing %s from playersNotHandled.' % p.getName())
-                            playersNotHandled.remove(p)
-            
-            if sidePot is not None:
-                print('Removing side pot!')
-                self.sidePots.remove(sidePot)
-                print('Winners (%d) of side pot %d (%d):' % (len(winners), sidePot.potNumber, pot))
-            else:
-                print('Winners (%d) of pot (%d):' % (len(winners), pot))
+                    p.chips += winningAmount
+                    if self.handRecord is not None:
+                        self.handRecord.payouts.append((p.chair, winningAmount))
+                    log.debug('    %s wins %d.', p.getName(), winningAmount)
+                    # Tell players who won and how much
+                    self.sendToAll(SX_GAME_POT, [p, winningAmount])
+                self.pot -= sidePot.totalPot
+        else:
+            log.debug('No players left to win the pot.')
+            
+        self.finishHandRecord()
+        self.handEndTimer.start()
+        self.gameState = GMST_HAND_ENDED
+        
+        
+    def startHandRecord(self):
+        self.handNumber += 1
+        if self.handHistory is None:
+            return
+        record = HandRecord(self.gameID, self.handNumber)
+        record.startTime = self.clock()
+        record.dealerChair = self.dealerPlayerChair
+        record.smallBlindChair = self.smallBlindPlayerChair
+        record.bigBlindChair = self.bigBlindPlayerChair
+        record.smallBlind = self.smallBlindAmount
+        record.bigBlind = self.bigBlindAmount
+        self.handRecord = record
+        
+        
+    def recordSeats(self):
+        # The players dealt into the hand, with the chips they had before the blinds
+        if self.handRecord is not None:
+            self.handRecord.seats = [(p.chair, p.getName(), p.chips + p.totalBet, [int(c) for c in p.cards]) for p in self.getPlayingPlayers()]
+            
+            
+    def recordAction(self, player, action, requestedChips, chips):
+        if self.handRecord is not None:
+            self.handRecord.actions.append((action[0], player.chair, len(self.cardsOnTable), requestedChips, chips))
             
-            winningAmount = int(floor(pot / len(winners)))
-            for p in winners:
-                p.chips += winningAmount
-                print('    %s wins %d.' % (p.getName(), winningAmount))
-                # Tell players who won and how much
-                self.sendToAll(SX_GAME_POT, p.getName() + SXSTR_EOO + str(winningAmount))
-            self.pot -= pot
-            print('Pot left: %d.' % self.pot)
             
-        sleep(5)
-        self.gameState = GMST_CHECK_CHIPS
+    def finishHandRecord(self):
+        record = self.handRecord
+        if record is None:
+            return
+        self.handRecord = None
+        record.board = [int(c) for c in self.cardsOnTable]
+        record.endTime = self.clock()
+        self.handHistory.record(record)
         
         
     def calculateSidePots(self):
-        sortedPlayers = [p for p in self.players]
+        # Split the pot into the main pot and side pots, one for each all-in amount.
+        # A pot is contested by the playing players who have bet at least its potPerPlayer.
+        playingPlayers = self.getPlayingPlayers()
+        levels = sorted(set([p.totalBet for p in playingPlayers if p.allIn] + [max([p.totalBet for p in self.players] + [0])]))
         
-        for i in range (0, len(sortedPlayers)):
-            minBetIndex = i
-            for j in range (i+1, len(sortedPlayers)):
-                if sortedPlayers[j].totalBet < sortedPlayers[minBetIndex].totalBet:
-                    minBetIndex = j
-                    
-            temp = sortedPlayers[i]
-            sortedPlayers[i] = sortedPlayers[minBetIndex]
-            sortedPlayers[minBetIndex] = temp
-        
-        for p in sortedPlayers:
-            if p.allIn and p.totalBet < self.roundMinBet and not p.inSidePot:
-                self.createSidePot(sortedPlayers, p.totalBet)
-        
-        
-    def createSidePot(self, sortedPlayers, totalBetAmount):
-        sidePotPlayers = []
-        totalPot = 0
-        sidePotNumber = (len(self.sidePots) + 1)
-        print('Creating a side pot %d with the size of %d!' % (sidePotNumber, totalBetAmount))
-        for p in sortedPlayers:
-            if not p.inSidePot:
-                totalPot += totalBetAmount
-            if p.totalBet == totalBetAmount:
-                print('Player %s added to the side pot!' % p.getName())
-                sidePotPlayers.append(p)
-                p.inSidePot = True
-                
-        sidePot = SidePot(sidePotNumber, totalBetAmount, totalPot, sidePotPlayers)
-        self.sidePots.append(sidePot)
+        self.sidePots = []
+        previousLevel = 0
+        potTotal = self.pot - sum(p.totalBet for p in self.players) # Chips left behind by players who left the table
+        for level in levels:
+            potTotal += sum(min(p.totalBet, level) - previousLevel for p in self.players if p.totalBet > previousLevel)
+            playersInPot = [p for p in playingPlayers if p.totalBet >= level]
+            previousLevel = level
+            if len(playersInPot) == 0:
+                # Nobody still playing has bet this much: the chips go to the previous pot
+                if len(self.sidePots) > 0:
+                    self.sidePots[-1].totalPot += potTotal
+                    potTotal = 0
+                continue
+            log.debug('Pot %d: %d per player, %d in total.', len(self.sidePots) + 1, level, potTotal)
+            self.sidePots.append(SidePot(len(self.sidePots) + 1, level, potTotal, playersInPot))
+            potTotal = 0
+            
+        if potTotal > 0 and len(self.sidePots) > 0:
+            self.sidePots[-1].totalPot += potTotal
 
 
     # Sitting players that are still competing for the pot
@@ -819,7 +951,7 @@ class TexasHoldEmGame(object):
         if not self.showedAllCards:
             self.showedAllCards = True
             for p in self.getPlayingPlayers():
-                self.sendToAllBut(p.clientClass, SX_GAME_PLAYER_HAND, p.getName() + SXSTR_EOO + str(p.cards[0]) + SXSTR_EOO + str(p.cards[1]))
+                self.sendToAllBut(p.clientClass, SX_GAME_PLAYER_HAND, [p, p.cards[0], p.cards[1]])
 
 
     def handleAutoFold(self):
@@ -832,78 +964,104 @@ class TexasHoldEmGame(object):
         self.waitTimer.start(fullSeconds)
 
 
-    def gameLoop(self):
-        while True:
-            if self.gameState == GMST_ENDED:
-                print('Closing game thread.')
-                break
+    def getNextWakeTime(self):
+        # The clock() time at which update() has to be called next if no player does anything before that
+        deadlines = []
+        if self.gameState == GMST_BET:
+            if self.currentPlayerTurn is not None:
+                deadlines.append(self.foldTimer.getDeadline())
+            deadlines.append(self.waitTimer.getDeadline())
+        elif self.gameState == GMST_HAND_ENDED:
+            deadlines.append(self.handEndTimer.getDeadline())
             
-            if self.gameState == GMST_START:
-                if len(self.players) > 1:
-                    print('We have enough players. Starting the game.')
-                    self.gameState = GMST_CHECK_CHIPS
-                    
-            if self.gameState == GMST_CHECK_CHIPS:
-                self.resetPlayers()
-                self.announcePlayersChips(self.players)
-                self.cleanTable()
-                self.checkChips()
+        now = self.clock()
+        deadlines = [d for d in deadlines if d is not None and d > now]
+        if len(deadlines) == 0:
+            return None
+        return min(deadlines)
+    
+    
+    def update(self):
+        # Advances the game as far as it can go right now. Called by GameScheduler whenever
+        # something happens at the table or one of the timers runs out.
+        # Returns True if the game moved on without waiting for anything, in which case it has
+        # to be updated again right away (e.g. dealing the next street when nobody can bet).
+        if self.gameState == GMST_ENDED:
+            return False
+        progressBefore = (self.gameState, len(self.cardsOnTable), self.currentRound)
+        self.releaseLeftPlayers()
+        
+        if self.gameState == GMST_HAND_ENDED:
+            if not self.handEndTimer.update():
+                self.gameState = GMST_CHECK_CHIPS
+        
+        if self.gameState == GMST_START:
+            if len(self.players) > 1:
+                log.info('We have enough players. Starting the game.')
+                self.gameState = GMST_CHECK_CHIPS
                 
-                if len(self.players) > 1:
-                    self.gameState = GMST_DEAL_CARDS
-                else:
-                    print('Not enough players with enough chips.')
-                    self.gameState = GMST_START
-                    self.sendToAll(SX_GAME_NOT_ENOUGH_PLAYERS)
-                    
-            if self.gameState == GMST_DEAL_CARDS:
-                self.announcePlayers()
-                self.shuffleDeck()
-                self.moveButtons()
-                self.announceButtons()
-                self.takeBlinds()
-                self.nextRound(True)
-                self.dealCardsToPlayers(2)
-                self.gameState = GMST_BET
+        if self.gameState == GMST_CHECK_CHIPS:
+            self.resetPlayers()
+            self.announcePlayersChips(self.players)
+            self.cleanTable()
+            self.checkChips()
+            
+            if len(self.players) > 1:
+                self.gameState = GMST_DEAL_CARDS
+            else:
+                log.debug('Not enough players with enough chips.')
+                self.gameState = GMST_START
+                self.sendToAll(SX_GAME_NOT_ENOUGH_PLAYERS)
                 
-            if self.gameState == GMST_BET:
-                self.handleAutoFold() # Did the timer run out for the current player
+        if self.gameState == GMST_DEAL_CARDS:
+            self.announcePlayers()
+            self.shuffleDeck()
+            self.moveButtons()
+            self.announceButtons()
+            self.startHandRecord()
+            self.takeBlinds()
+            self.nextRound(True)
+            self.dealCardsToPlayers(2)
+            self.recordSeats()
+            self.gameState = GMST_BET
+            
+        if self.gameState == GMST_BET:
+            self.handleAutoFold() # Did the timer run out for the current player
+            
+            if len(self.players) < 2 or len(self.getPlayingPlayers()) < 2:
+                # Not enough players: end the hand
+                self.gameState = GMST_END_HAND_PREMATURE
+            else:
+                canPlay = self.canPlayersPlay() # No plays can be made if too many players have gone All In
+                playersHavePlayed = 0
                 
-                if len(self.players) < 2 or len(self.getPlayingPlayers()) < 2:
-                    # Not enough players: end the hand
-                    self.gameState = GMST_END_HAND_PREMATURE
-                else:
-                    canPlay = self.canPlayersPlay() # No plays can be made if too many players have gone All In
+                if canPlay:
+                    playersHavePlayed = self.everyoneHasPlayed()
+                    if playersHavePlayed != 1: # Not everyone has played on this round yet
+                        self.announceTurn(False)
+                elif not self.showedAllCards:
+                    log.debug('Showing all cards!')
+                    self.showAllCards()
                     
-                    if canPlay:
-                        playersHavePlayed = self.everyoneHasPlayed()
-                        if playersHavePlayed != 1: # Not everyone has played on this round yet
-                            self.announceTurn(False)
-                    elif not self.showedAllCards:
-                        print('Showing all cards!')
-                        self.showAllCards()
-                        
-                    if (not canPlay or playersHavePlayed == 1) and not self.waitTimer.update(): # No plays can be made on this round
-                        if len(self.cardsOnTable) < 5:
-                            self.nextRound()
-                        self.calculateSidePots()
-                        if len(self.cardsOnTable) == 0:
-                            self.dealFlop()
-                        elif len(self.cardsOnTable) == 3:
-                            self.dealTurn()
-                        elif len(self.cardsOnTable) == 4:
-                            self.dealRiver()
-                        else:
-                            self.gameState = GMST_END_HAND
-                            
-                    elif playersHavePlayed == -1:
-                        self.gameState = GMST_END_HAND_PREMATURE
+                if (not canPlay or playersHavePlayed == 1) and not self.waitTimer.update(): # No plays can be made on this round
+                    if len(self.cardsOnTable) < 5:
+                        self.nextRound()
+                    self.calculateSidePots()
+                    if len(self.cardsOnTable) == 0:
+                        self.dealFlop()
+                    elif len(self.cardsOnTable) == 3:
+                        self.dealTurn()
+                    elif len(self.cardsOnTable) == 4:
+                        self.dealRiver()
+                    else:
+                        self.gameState = GMST_END_HAND
                         
-            if self.gameState == GMST_END_HAND:
-                self.endHand()
-            elif self.gameState == GMST_END_HAND_PREMATURE:
-                self.endHand(True)
-                
-            sleep(0.05)
+                elif playersHavePlayed == -1:
+                    self.gameState = GMST_END_HAND_PREMATURE
+                    
+        if self.gameState == GMST_END_HAND:
+            self.endHand()
+        elif self.gameState == GMST_END_HAND_PREMATURE:
+            self.endHand(True)
             
-        print('Game thread closed.')
\ No newline at end of file
+        return (self.gameState, len(self.cardsOnTable), self.currentRound) != progressBefore
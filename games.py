@@ -1,56 +1,143 @@
 import threading
 from game import TexasHoldEmGame
+from scheduler import GameScheduler
+from handhistory import HandHistoryWriter
+from tablepool import PlayerPool, TablePool
+from metrics import TABLE_POOL_SIZE
+from client import buildPacket
+from packetsyntax import *
+from serversettings import *
 from gamestates import *
+import logging
+
+log = logging.getLogger('games')
 
 class Games(object):
-    games = []
+    # Registry of the running tables, indexed by game ID.
+    # Which clients go to which table is decided by the Matchmaker (see matchmaker.py).
+    # Tables and their players come from pools and go back to them once the table has closed.
+    games = None # gameID -> game
     nextGameID = 0
+    lock = None
+    scheduler = None
+    handHistory = None
+    tablePools = None # game type -> TablePool
+    playerPool = None
+    seatListener = None # Called with a table whose players have changed, e.g. Matchmaker.seatFreed
     
     
-    def createGame(self, gameType, playerClients):
-        print('Creating a new game.')
-        if gameType == GM_HOLDEM:
-            game = TexasHoldEmGame(self.nextGameID)
-        game.addPlayers(playerClients)
-        self.games.append(game)
-        threading.Thread(target = game.startGame,args = ()).start()
-        self.nextGameID += 1
+    def __init__(self, historyName = 'server'):
+        self.games = {}
+        self.lock = threading.RLock()
+        self.tablePools = {GM_HOLDEM: TablePool(TexasHoldEmGame)}
+        self.playerPool = PlayerPool()
+        for pool in self.tablePools.values():
+            pool.start()
+        TABLE_POOL_SIZE.setFunction(lambda: sum(pool.size() for pool in self.tablePools.values()))
+        self.scheduler = GameScheduler()
+        self.scheduler.endedListener = self.recycleGame
+        self.scheduler.start()
+        if HAND_HISTORY_DIRECTORY is not None:
+            self.handHistory = HandHistoryWriter(historyName)
+            self.handHistory.start()
+        
+        
+    def createGame(self, gameType, playerClients, gameID = None):
+        log.info('Creating a new game.')
+        if gameID is None:
+            with self.lock:
+                gameID = self.nextGameID
+                self.nextGameID += 1
+        game = self.tablePools[gameType].acquire(gameID)
+        game.handHistory = self.handHistory
+        game.playerPool = self.playerPool
+        game.occupancyListener = self.occupancyChanged
+        with self.lock:
+            self.games[gameID] = game
+        self.joinGame(game, playerClients)
+        return game
+        
         
+    def joinGame(self, game, playerClients):
+        # Returns False if the game has closed since it was picked, in which case nobody joined it
+        with game.lock:
+            if self.getGame(game.gameID) is not game or game.gameState == GMST_ENDED:
+                return False
+            self.announceSeats(playerClients)
+            game.addPlayers(playerClients)
+        self.scheduler.wake(game)
+        return True
         
-    def findGame(self, gameType):
-        bestNumOfPlayers = -1
-        bestGame = None
-        for g in self.games:
-            if g.gameType == GM_HOLDEM:
-                numOfPlayers = len(g.players)
-                if numOfPlayers > bestNumOfPlayers and numOfPlayers < g.maxPlayers:
-                    bestGame = g
-                    bestNumOfPlayers = numOfPlayers
-        return bestGame
         
+    def announceSeats(self, playerClients):
+        # Tells the clients they have a table, before the table tells them anything
+        opponentFound = {} # Built once per protocol version
+        for client in playerClients:
+            if client.protocolVersion not in opponentFound:
+                opponentFound[client.protocolVersion] = buildPacket(SX_SEARCH_OPPONENT, SX_OPPONENT_FOUND, '', client.protocolVersion)
+            client.sendRawPacket(opponentFound[client.protocolVersion])
+            client.gameStatus = ST_IN_GAME
         
+        
+    def getGame(self, gameID):
+        return self.games.get(gameID)
+    
+    
+    def getMaxPlayers(self, gameType):
+        # Seats at a table of the game type
+        if gameType == GM_HOLDEM:
+            return TexasHoldEmGame.maxPlayers
+        return 0
+    
+    
+    def freeSeats(self, game):
+        # Seats not taken by the clients that joined the table, whether they sit at it or not
+        return game.maxPlayers - game.currentlyInGame()
+    
+    
     def deliverGameData(self, gameID, clientClass, data):
-        for g in self.games:
-            if g.gameID == gameID:
+        g = self.getGame(gameID)
+        if g is not None:
+            with g.lock:
                 g.handleData(clientClass, data)
-                break
+            self.scheduler.wake(g)
             
             
     def closeGame(self, game):
+        # The scheduler drops the game the next time it looks at it
         game.gameState = GMST_ENDED
         for p in game.getAllPlayers():
-            p.currentGameID = -1
-            p.currentGame = GM_NONE
-            p.gameStatus = ST_IDLE
-        self.games.remove(game)
+            p.clientClass.currentGameID = -1
+            p.clientClass.currentGame = GM_NONE
+            p.clientClass.gameStatus = ST_IDLE
+        with self.lock:
+            self.games.pop(game.gameID, None)
+            
+            
+    def occupancyChanged(self, game):
+        # Called by the game whenever a player sits down or leaves the table
+        if self.seatListener is not None:
+            self.seatListener(game)
+            
+            
+    def recycleGame(self, game):
+        # Called by the scheduler once a closed table is no longer updated
+        with game.lock:
+            if game.gameState != GMST_ENDED:
+                return # Already recycled
+            players = game.getAllPlayers() + game.leftPlayers
+            game.reset(-1)
+        self.playerPool.release(players)
+        self.tablePools[game.gameType].release(game)
             
             
     def playerDisconnect(self, clientClass):
         if clientClass.currentGameID != -1:
-            for g in self.games:
-                if g.gameID == clientClass.currentGameID:
+            g = self.getGame(clientClass.currentGameID)
+            if g is not None:
+                with g.lock:
                     g.handleDisconnect(clientClass)
                     if g.currentlyInGame() == 0:
-                        print('Not enough players. Closing the game.')
+                        log.info('Not enough players. Closing the game.')
                         self.closeGame(g)
-                    break
\ No newline at end of file
+                self.scheduler.wake(g)
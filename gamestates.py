@@ -6,6 +6,7 @@ GMST_DEAL_CARDS = 3
 GMST_BET = 4
 GMST_END_HAND = 5
 GMST_END_HAND_PREMATURE = 6
+GMST_HAND_ENDED = 7 # Showing the results before the next hand
 
 # Games
 GM_NONE = 0
@@ -0,0 +1,317 @@
+import atexit
+import glob
+import os
+import queue
+import re
+import struct
+import threading
+import zlib
+from time import time
+from serversettings import *
+import logging
+
+log = logging.getLogger('handhistory')
+
+# Every finished hand is appended to a segment file in HAND_HISTORY_DIRECTORY.
+# A segment starts with SEGMENT_HEADER and is followed by records, each one a RECORD_HEADER
+# (length and CRC-32 of the body) and the body:
+#
+#   HAND_HEADER    gameID, handNumber, startMs, endMs, dealer/small blind/big blind chairs, blind amounts
+#   seat count     u8, then per seat: SEAT (chair, chips at the start, name length), name, two hole cards
+#   board          u8 count, then the cards
+#   action count   u16, then per action: ACTION (packetsyntax header of the action, chair, cards on the board,
+#                  chips the player asked to bet, chips actually taken)
+#                  Version 1 segments have ACTION_V1 without the chips asked for; they are read as if the
+#                  player had asked for the chips taken.
+#   pot count      u8, then per pot: POT (total, chips per player, player count), then their chairs
+#   payout count   u8, then per payout: PAYOUT (chair, chips won)
+#
+# Cards are stored as int(card), the same 0 - 51 numbers that are sent to the clients.
+# A missing card or chair is NONE (0xFF). All integers are little-endian.
+SEGMENT_MAGIC = b'GHHS'
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+SEGMENT_HEADER = struct.Struct('<4sH')
+RECORD_HEADER = struct.Struct('<II')
+HAND_HEADER = struct.Struct('<IIQQBBBII')
+SEAT = struct.Struct('<BIB')
+ACTION = struct.Struct('<BBBII')
+ACTION_V1 = struct.Struct('<BBBI')
+POT = struct.Struct('<IIB')
+PAYOUT = struct.Struct('<BI')
+COUNT8 = struct.Struct('<B')
+COUNT16 = struct.Struct('<H')
+NONE = 0xFF
+
+SEGMENT_NAME = 'hands-%s-%06d.hh'
+SEGMENT_PATTERN = re.compile(r'hands-(.+)-(\d{6})\.hh$')
+
+
+def toByte(value):
+    if value is None or value < 0:
+        return NONE
+    return value
+
+
+class HandRecord(object):
+    # Everything that happened during one hand. Filled in by the game as the hand goes on and
+    # handed over to HandHistoryWriter when it ends.
+    gameID = -1
+    handNumber = 0
+    startTime = 0
+    endTime = 0
+    dealerChair = -1
+    smallBlindChair = -1
+    bigBlindChair = -1
+    smallBlind = 0
+    bigBlind = 0
+    seats = [] # (chair, name, chips at the start, [hole cards])
+    board = []
+    actions = [] # (action, chair, cards on the board, chips asked for, chips taken)
+    pots = [] # (total, chips per player, [chairs])
+    payouts = [] # (chair, chips)
+    formatVersion = FORMAT_VERSION # Of the segment the hand was read from
+
+
+    def __init__(self, gameID, handNumber):
+        self.gameID = gameID
+        self.handNumber = handNumber
+        self.startTime = time()
+        self.seats = []
+        self.board = []
+        self.actions = []
+        self.pots = []
+        self.payouts = []
+
+
+    def encode(self):
+        name = lambda seat: seat[1].encode('utf-8')[:255]
+        parts = [HAND_HEADER.pack(self.gameID, self.handNumber, int(self.startTime * 1000), int(self.endTime * 1000),
+                                  toByte(self.dealerChair), toByte(self.smallBlindChair), toByte(self.bigBlindChair),
+                                  self.smallBlind, self.bigBlind),
+                 COUNT8.pack(len(self.seats))]
+        for seat in self.seats:
+            nameBytes = name(seat)
+            cards = (list(seat[3]) + [NONE, NONE])[:2]
+            parts.append(SEAT.pack(toByte(seat[0]), seat[2], len(nameBytes)))
+            parts.append(nameBytes)
+            parts.append(bytes(cards))
+        parts.append(COUNT8.pack(len(self.board)))
+        parts.append(bytes(self.board))
+        parts.append(COUNT16.pack(len(self.actions)))
+        for action, chair, street, requested, chips in self.actions:
+            parts.append(ACTION.pack(action, toByte(chair), street, requested, chips))
+        parts.append(COUNT8.pack(len(self.pots)))
+        for total, perPlayer, chairs in self.pots:
+            parts.append(POT.pack(total, perPlayer, len(chairs)))
+            parts.append(bytes(toByte(c) for c in chairs))
+        parts.append(COUNT8.pack(len(self.payouts)))
+        for chair, chips in self.payouts:
+            parts.append(PAYOUT.pack(toByte(chair), chips))
+        body = b''.join(parts)
+        return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def decodeRecord(buffer, offset = 0, version = FORMAT_VERSION):
+    # Decodes the record starting at offset, written in the format version of its segment.
+    # Returns the HandRecord and the offset of the next record.
+    # Raises ValueError if the record is cut short or damaged.
+    if offset + RECORD_HEADER.size > len(buffer):
+        raise ValueError('Truncated record header at %d.' % offset)
+    length, crc = RECORD_HEADER.unpack_from(buffer, offset)
+    start = offset + RECORD_HEADER.size
+    end = start + length
+    if end > len(buffer) or zlib.crc32(buffer[start:end]) != crc:
+        raise ValueError('Damaged record at %d.' % offset)
+
+    (gameID, handNumber, startMs, endMs, dealer, smallBlindChair, bigBlindChair,
+     smallBlind, bigBlind) = HAND_HEADER.unpack_from(buffer, start)
+    record = HandRecord(gameID, handNumber)
+    record.formatVersion = version
+    record.startTime = startMs / 1000.0
+    record.endTime = endMs / 1000.0
+    record.dealerChair = dealer
+    record.smallBlindChair = smallBlindChair
+    record.bigBlindChair = bigBlindChair
+    record.smallBlind = smallBlind
+    record.bigBlind = bigBlind
+    position = start + HAND_HEADER.size
+
+    count = buffer[position]
+    position += 1
+    for i in range(count):
+        chair, chips, nameLength = SEAT.unpack_from(buffer, position)
+        position += SEAT.size
+        name = bytes(buffer[position:position + nameLength]).decode('utf-8', 'replace')
+        position += nameLength
+        cards = [c for c in buffer[position:position + 2] if c != NONE]
+        position += 2
+        record.seats.append((chair, name, chips, cards))
+
+    count = buffer[position]
+    record.board = list(buffer[position + 1:position + 1 + count])
+    position += 1 + count
+
+    count = COUNT16.unpack_from(buffer, position)[0]
+    position += COUNT16.size
+    if version == 1:
+        for i in range(count):
+            action, chair, street, chips = ACTION_V1.unpack_from(buffer, position)
+            record.actions.append((action, chair, street, chips, chips))
+            position += ACTION_V1.size
+    else:
+        for i in range(count):
+            record.actions.append(ACTION.unpack_from(buffer, position))
+            position += ACTION.size
+
+    count = buffer[position]
+    position += 1
+    for i in range(count):
+        total, perPlayer, numOfChairs = POT.unpack_from(buffer, position)
+        position += POT.size
+        record.pots.append((total, perPlayer, list(buffer[position:position + numOfChairs])))
+        position += numOfChairs
+
+    count = buffer[position]
+    position += 1
+    for i in range(count):
+        record.payouts.append(PAYOUT.unpack_from(buffer, position))
+        position += PAYOUT.size
+
+    return record, end
+
+
+def readSegment(path):
+    # Yields the hands of a segment file in the order they were played
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version = SEGMENT_HEADER.unpack_from(data, 0)
+    if magic != SEGMENT_MAGIC or version not in READABLE_VERSIONS:
+        raise ValueError('%s is not a hand history segment.' % path)
+    offset = SEGMENT_HEADER.size
+    while offset < len(data):
+        record, offset = decodeRecord(data, offset, version)
+        yield record
+
+
+def listSegments(directory = HAND_HISTORY_DIRECTORY):
+    return sorted(glob.glob(os.path.join(directory, 'hands-*.hh')))
+
+
+class HandHistoryWriter(object):
+    # Appends finished hands to segment files from its own thread. record() only puts the
+    # hand in a queue, so the game never waits on disk I/O. The thread writes whatever has
+    # queued up with a single write, fsyncs at most every HAND_HISTORY_FSYNC_SECONDS and
+    # starts a new segment when the current one reaches HAND_HISTORY_SEGMENT_BYTES.
+    directory = HAND_HISTORY_DIRECTORY
+    name = 'server' # Segments of different processes are kept apart by name
+    segmentBytes = HAND_HISTORY_SEGMENT_BYTES
+    fsyncSeconds = HAND_HISTORY_FSYNC_SECONDS
+    records = None
+    file = None
+    segmentNumber = 0
+    segmentSize = 0
+    lastSync = 0
+    unsynced = False
+    thread = None
+
+
+    def __init__(self, name = 'server', directory = HAND_HISTORY_DIRECTORY):
+        self.name = name
+        self.directory = directory
+        self.records = queue.SimpleQueue()
+        self.thread = threading.Thread(target = self.run, args = (), name = 'HandHistoryWriter', daemon = True)
+
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok = True)
+        numbers = [int(m.group(2)) for m in (SEGMENT_PATTERN.search(os.path.basename(p)) for p in listSegments(self.directory))
+                   if m is not None and m.group(1) == self.name]
+        self.segmentNumber = max(numbers) if numbers else 0
+        self.thread.start()
+        atexit.register(self.stop)
+
+
+    def record(self, handRecord):
+        # Called by the game thread when a hand ends
+        self.records.put(handRecord)
+
+
+    def stop(self):
+        # Writes out the queued hands and closes the segment
+        if self.thread.is_alive():
+            self.records.put(None)
+            self.thread.join()
+
+
+    def run(self):
+        while True:
+            try:
+                handRecord = self.records.get(timeout = self.fsyncSeconds)
+            except queue.Empty:
+                self.sync()
+                continue
+
+            batch = []
+            stopping = False
+            while handRecord is not None:
+                try:
+                    batch.append(handRecord.encode())
+                except Exception:
+                    # A hand that can't be encoded is dropped; the thread has to keep writing the others
+                    log.exception('Dropped hand %d of game %d from the hand history.', handRecord.handNumber, handRecord.gameID)
+                if len(batch) >= HAND_HISTORY_BATCH:
+                    break
+                try:
+                    handRecord = self.records.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                stopping = True
+
+            try:
+                self.write(batch)
+                if time() - self.lastSync >= self.fsyncSeconds:
+                    self.sync()
+            except OSError as e:
+                log.error('Failed to write %d hands to the hand history: %s', len(batch), e)
+
+            if stopping:
+                self.closeSegment()
+                return
+
+
+    def write(self, batch):
+        if len(batch) == 0:
+            return
+        data = b''.join(batch)
+        if self.file is None or (self.segmentSize > SEGMENT_HEADER.size and self.segmentSize + len(data) > self.segmentBytes):
+            self.openSegment()
+        self.file.write(data)
+        self.file.flush()
+        self.segmentSize += len(data)
+        self.unsynced = True
+
+
+    def sync(self):
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = False
+        self.lastSync = time()
+
+
+    def openSegment(self):
+        self.closeSegment()
+        self.segmentNumber += 1
+        path = os.path.join(self.directory, SEGMENT_NAME % (self.name, self.segmentNumber))
+        self.file = open(path, 'wb')
+        self.file.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, FORMAT_VERSION))
+        self.segmentSize = SEGMENT_HEADER.size
+        log.info('Writing hand history to %s.', path)
+
+
+    def closeSegment(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,343 @@
+# Looks up recorded hands (see handhistory.py) without reading whole segments.
+# Every segment gets a sidecar index file (segment + '.idx') listing where each hand starts,
+# its game, hand number, time, pot and players. Segments are memory-mapped, and the hands
+# matching a query are decoded lazily straight from the mapping.
+# Example: python handindex.py --player bob --since 2026-10-17 --until 2026-10-18
+import argparse
+import datetime
+import mmap
+import os
+import struct
+from card import CARDS
+from packetsyntax import *
+from handhistory import SEGMENT_HEADER, SEGMENT_MAGIC, FORMAT_VERSION, READABLE_VERSIONS, RECORD_HEADER, HAND_HEADER, SEAT, decodeRecord, listSegments
+from serversettings import *
+import logging
+
+log = logging.getLogger('handindex')
+
+# Index file: INDEX_HEADER, then one INDEX_ENTRY per hand followed by its players' names (u8 length + name)
+INDEX_MAGIC = b'GHHI'
+INDEX_HEADER = struct.Struct('<4sHQ') # magic, version, bytes of the segment covered by the index
+INDEX_ENTRY = struct.Struct('<QIIQIB') # offset, gameID, handNumber, startMs, total pot, player count
+
+ACTION_NAMES = {
+    SX_GAME_BLINDS[0]: 'posts',
+    SX_GAME_BET[0]: 'bets',
+    SX_GAME_FOLD[0]: 'folds',
+}
+RANK_NAMES = '23456789TJQKA'
+SUIT_NAMES = 'hdcs'
+
+
+def cardName(value):
+    card = CARDS[value]
+    return RANK_NAMES[card.rank] + SUIT_NAMES[card.suit]
+
+
+class HandView(object):
+    # A recorded hand read in place from a memory-mapped segment. The header fields are
+    # unpacked on access; the rest is decoded only when asked for.
+    buffer = None
+    offset = 0
+    start = 0
+    version = FORMAT_VERSION # Format version of the segment
+
+
+    def __init__(self, buffer, offset, version = FORMAT_VERSION):
+        self.buffer = buffer
+        self.offset = offset
+        self.start = offset + RECORD_HEADER.size
+        self.version = version
+
+
+    def header(self):
+        return HAND_HEADER.unpack_from(self.buffer, self.start)
+
+
+    @property
+    def gameID(self):
+        return struct.unpack_from('<I', self.buffer, self.start)[0]
+
+
+    @property
+    def handNumber(self):
+        return struct.unpack_from('<I', self.buffer, self.start + 4)[0]
+
+
+    @property
+    def startTime(self):
+        return struct.unpack_from('<Q', self.buffer, self.start + 8)[0] / 1000.0
+
+
+    @property
+    def endTime(self):
+        return struct.unpack_from('<Q', self.buffer, self.start + 16)[0] / 1000.0
+
+
+    def iterSeats(self):
+        # (chair, name as a memoryview, chips at the start, hole cards as a memoryview)
+        position = self.start + HAND_HEADER.size + 1
+        for i in range(self.buffer[position - 1]):
+            chair, chips, nameLength = SEAT.unpack_from(self.buffer, position)
+            position += SEAT.size
+            name = self.buffer[position:position + nameLength]
+            position += nameLength
+            yield chair, name, chips, self.buffer[position:position + 2]
+            position += 2
+
+
+    def getPlayerNames(self):
+        return [bytes(name).decode('utf-8', 'replace') for chair, name, chips, cards in self.iterSeats()]
+
+
+    def decode(self):
+        # The whole hand as a handhistory.HandRecord
+        return decodeRecord(self.buffer, self.offset, self.version)[0]
+
+
+class SegmentReader(object):
+    # A memory-mapped hand history segment
+    path = ''
+    file = None
+    map = None
+    buffer = None
+    version = FORMAT_VERSION
+
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < SEGMENT_HEADER.size:
+            self.file.close()
+            raise ValueError('%s is not a hand history segment.' % path)
+        self.map = mmap.mmap(self.file.fileno(), size, access = mmap.ACCESS_READ)
+        self.buffer = memoryview(self.map)
+        magic, self.version = SEGMENT_HEADER.unpack_from(self.buffer, 0)
+        if magic != SEGMENT_MAGIC or self.version not in READABLE_VERSIONS:
+            self.close()
+            raise ValueError('%s is not a hand history segment.' % path)
+
+
+    def __len__(self):
+        return len(self.buffer)
+
+
+    def hand(self, offset):
+        return HandView(self.buffer, offset, self.version)
+
+
+    def iterOffsets(self, offset = SEGMENT_HEADER.size):
+        # Offsets of the complete records from offset on. A record still being written ends the scan.
+        size = len(self.buffer)
+        while offset + RECORD_HEADER.size <= size:
+            length = RECORD_HEADER.unpack_from(self.buffer, offset)[0]
+            end = offset + RECORD_HEADER.size + length
+            if end > size:
+                break
+            yield offset
+            offset = end
+
+
+    def __iter__(self):
+        for offset in self.iterOffsets():
+            yield self.hand(offset)
+
+
+    def close(self):
+        try:
+            self.buffer.release()
+            self.map.close()
+        except BufferError:
+            pass # A HandView still uses the mapping; it is closed when the last one goes away
+        self.file.close()
+
+
+class SegmentIndex(object):
+    # The sidecar index of one segment, kept in memory as parallel lists
+    covered = SEGMENT_HEADER.size # Bytes of the segment that have been indexed
+    offsets = None
+    gameIDs = None
+    handNumbers = None
+    startTimes = None # Milliseconds
+    pots = None
+    playersByName = None # name -> indexes of the player's hands
+
+
+    def __init__(self):
+        self.covered = SEGMENT_HEADER.size
+        self.offsets = []
+        self.gameIDs = []
+        self.handNumbers = []
+        self.startTimes = []
+        self.pots = []
+        self.playersByName = {}
+
+
+    def add(self, offset, gameID, handNumber, startMs, pot, names):
+        number = len(self.offsets)
+        self.offsets.append(offset)
+        self.gameIDs.append(gameID)
+        self.handNumbers.append(handNumber)
+        self.startTimes.append(startMs)
+        self.pots.append(pot)
+        for name in names:
+            self.playersByName.setdefault(name, []).append(number)
+
+
+    def addHand(self, hand):
+        record = hand.decode()
+        self.add(hand.offset, record.gameID, record.handNumber, int(record.startTime * 1000),
+                 sum(pot[0] for pot in record.pots), [seat[1] for seat in record.seats])
+
+
+    @staticmethod
+    def load(path):
+        index = SegmentIndex()
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, covered = INDEX_HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or version != FORMAT_VERSION:
+            raise ValueError('%s is not a hand history index.' % path)
+        position = INDEX_HEADER.size
+        while position < len(data):
+            offset, gameID, handNumber, startMs, pot, count = INDEX_ENTRY.unpack_from(data, position)
+            position += INDEX_ENTRY.size
+            names = []
+            for i in range(count):
+                length = data[position]
+                names.append(data[position + 1:position + 1 + length].decode('utf-8', 'replace'))
+                position += 1 + length
+            index.add(offset, gameID, handNumber, startMs, pot, names)
+        index.covered = covered
+        return index
+
+
+    def save(self, path):
+        namesByHand = [[] for i in self.offsets]
+        for name, numbers in self.playersByName.items():
+            for number in numbers:
+                namesByHand[number].append(name.encode('utf-8')[:255])
+        parts = [INDEX_HEADER.pack(INDEX_MAGIC, FORMAT_VERSION, self.covered)]
+        for number, offset in enumerate(self.offsets):
+            names = namesByHand[number]
+            parts.append(INDEX_ENTRY.pack(offset, self.gameIDs[number], self.handNumbers[number], self.startTimes[number], self.pots[number], len(names)))
+            for name in names:
+                parts.append(bytes([len(name)]) + name)
+        temporaryPath = path + '.tmp'
+        with open(temporaryPath, 'wb') as f:
+            f.write(b''.join(parts))
+        os.replace(temporaryPath, path)
+
+
+class HandHistoryIndex(object):
+    # Queries over all segments of a hand history directory. Missing or outdated sidecar
+    # indexes are brought up to date when the index is opened: only the part of a
+    # segment written after the last indexing is scanned.
+    directory = HAND_HISTORY_DIRECTORY
+    segments = None # [(SegmentReader, SegmentIndex)]
+
+
+    def __init__(self, directory = HAND_HISTORY_DIRECTORY):
+        self.directory = directory
+        self.segments = []
+        for path in listSegments(directory):
+            try:
+                reader = SegmentReader(path)
+            except ValueError as e:
+                log.warning('Skipping %s: %s', path, e)
+                continue
+            self.segments.append((reader, self.loadIndex(reader)))
+
+
+    def loadIndex(self, reader):
+        indexPath = reader.path + '.idx'
+        index = None
+        if os.path.exists(indexPath):
+            try:
+                index = SegmentIndex.load(indexPath)
+            except (ValueError, struct.error) as e:
+                log.warning('Rebuilding the damaged index %s: %s', indexPath, e)
+        if index is None or index.covered > len(reader):
+            index = SegmentIndex()
+        if index.covered < len(reader):
+            for offset in reader.iterOffsets(index.covered):
+                try:
+                    index.addHand(reader.hand(offset))
+                except ValueError as e:
+                    log.warning('Stopped indexing %s: %s', reader.path, e)
+                    break
+                index.covered = offset + RECORD_HEADER.size + RECORD_HEADER.unpack_from(reader.buffer, offset)[0]
+            index.save(indexPath)
+        return index
+
+
+    def query(self, player = None, gameID = None, since = None, until = None, minPot = None, maxPot = None):
+        # Yields a HandView for every matching hand, oldest segment first.
+        # since and until are time() values, the pot limits are in chips.
+        sinceMs = None if since is None else int(since * 1000)
+        untilMs = None if until is None else int(until * 1000)
+        for reader, index in self.segments:
+            if player is not None:
+                numbers = index.playersByName.get(player, [])
+            else:
+                numbers = range(len(index.offsets))
+            for number in numbers:
+                if gameID is not None and index.gameIDs[number] != gameID:
+                    continue
+                if sinceMs is not None and index.startTimes[number] < sinceMs:
+                    continue
+                if untilMs is not None and index.startTimes[number] >= untilMs:
+                    continue
+                if minPot is not None and index.pots[number] < minPot:
+                    continue
+                if maxPot is not None and index.pots[number] > maxPot:
+                    continue
+                yield reader.hand(index.offsets[number])
+
+
+    def close(self):
+        for reader, index in self.segments:
+            reader.close()
+        self.segments = []
+
+
+def describeHand(record):
+    seatNames = dict((seat[0], seat[1]) for seat in record.seats)
+    lines = ['Game %d hand %d at %s' % (record.gameID, record.handNumber, datetime.datetime.fromtimestamp(record.startTime).isoformat(sep = ' ', timespec = 'seconds'))]
+    for chair, name, chips, cards in record.seats:
+        lines.append('  Chair %d: %s (%d chips) %s' % (chair, name, chips, ' '.join(cardName(c) for c in cards)))
+    for action, chair, street, requested, chips in record.actions:
+        lines.append('  %s %s %d' % (seatNames.get(chair, chair), ACTION_NAMES.get(action, 'action %d' % action), chips))
+    if len(record.board) > 0:
+        lines.append('  Board: %s' % ' '.join(cardName(c) for c in record.board))
+    for chair, chips in record.payouts:
+        lines.append('  %s wins %d' % (seatNames.get(chair, chair), chips))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Search the recorded hands.')
+    parser.add_argument('--directory', default = HAND_HISTORY_DIRECTORY)
+    parser.add_argument('--player')
+    parser.add_argument('--game', type = int)
+    parser.add_argument('--since', help = 'ISO date or time, e.g. 2026-10-17 or 2026-10-17T18:00')
+    parser.add_argument('--until')
+    parser.add_argument('--min-pot', type = int)
+    parser.add_argument('--max-pot', type = int)
+    parser.add_argument('--count', action = 'store_true', help = 'only print how many hands match')
+    options = parser.parse_args()
+
+    toTime = lambda value: None if value is None else datetime.datetime.fromisoformat(value).timestamp()
+    index = HandHistoryIndex(options.directory)
+    matches = 0
+    for hand in index.query(options.player, options.game, toTime(options.since), toTime(options.until), options.min_pot, options.max_pot):
+        matches += 1
+        if not options.count:
+            print(describeHand(hand.decode()))
+    print('%d hands.' % matches)
+
+
+if __name__ == '__main__':
+    main()
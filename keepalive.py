@@ -0,0 +1,123 @@
+import collections
+import threading
+import randomstring #generate
+from time import sleep, time
+from packetsyntax import *
+from serversettings import *
+from metrics import PING_RTT
+import logging
+
+log = logging.getLogger('keepalive')
+
+milliTime = lambda: int(round(time() * 1000))
+
+
+class KeepaliveService(object):
+    # Pings every client that has talked to the server, from a single thread or event loop task.
+    # Clients are spread over the slots of a timing wheel that turns once every PING_DELAY_SECONDS,
+    # so each tick only pings the clients in the current slot.
+    # A client that hasn't answered its ping in PING_TIMEOUT_SECONDS is handed to onTimeout.
+    slots = None
+    slotOf = None # client -> slot index
+    currentSlot = 0
+    tickSeconds = KEEPALIVE_TICK_SECONDS
+    pingTimeout = PING_TIMEOUT_SECONDS * 1000
+    onTimeout = None
+    samples = None # Latest round trip times of all clients in milliseconds
+    lock = None
+    
+    
+    def __init__(self, onTimeout, tickSeconds = KEEPALIVE_TICK_SECONDS):
+        self.onTimeout = onTimeout
+        self.tickSeconds = tickSeconds
+        self.slots = [set() for _ in range(max(1, int(round(PING_DELAY_SECONDS / tickSeconds))))]
+        self.slotOf = {}
+        self.currentSlot = 0
+        self.samples = collections.deque(maxlen = PING_SAMPLES)
+        self.lock = threading.Lock()
+        
+        
+    def start(self):
+        threading.Thread(target = self.run, args = (), name = 'Keepalive', daemon = True).start()
+        
+        
+    def run(self):
+        nextTick = time()
+        while True:
+            self.tick()
+            nextTick += self.tickSeconds
+            delay = nextTick - time()
+            if delay > 0:
+                sleep(delay)
+            else:
+                nextTick = time() # Fell behind; don't try to catch up
+                
+                
+    def addClient(self, clientClass):
+        # The client gets its first ping on the next tick
+        with self.lock:
+            if clientClass in self.slotOf:
+                return
+            self.slotOf[clientClass] = self.currentSlot
+            self.slots[self.currentSlot].add(clientClass)
+            
+            
+    def removeClient(self, clientClass):
+        with self.lock:
+            slot = self.slotOf.pop(clientClass, None)
+            if slot is not None:
+                self.slots[slot].discard(clientClass)
+                
+                
+    def tick(self):
+        with self.lock:
+            clients = list(self.slots[self.currentSlot])
+            self.currentSlot = (self.currentSlot + 1) % len(self.slots)
+            
+        now = milliTime()
+        timedOut = []
+        for clientClass in clients:
+            if clientClass.isDisconnected():
+                self.removeClient(clientClass)
+            elif clientClass.lastPingData != b'':
+                # Still waiting for the answer to the previous ping
+                if now - clientClass.lastPingTime > self.pingTimeout:
+                    timedOut.append(clientClass)
+            else:
+                pingData = randomstring.generate()
+                clientClass.lastPingData = pingData.encode('utf-8')
+                clientClass.lastPingTime = now
+                if not clientClass.sendPacket(SX_PING, b'', pingData):
+                    timedOut.append(clientClass)
+                    
+        for clientClass in timedOut:
+            log.info('Client %s did not answer a ping.', clientClass.name)
+            self.removeClient(clientClass)
+            self.onTimeout(clientClass)
+            
+            
+    def handlePong(self, clientClass, data):
+        # Returns the round trip time in milliseconds, None if data doesn't answer the last ping
+        if data == b'' or data != clientClass.lastPingData:
+            return None
+        rtt = milliTime() - clientClass.lastPingTime
+        clientClass.lastPingData = b''
+        clientClass.ping = rtt
+        if clientClass.pingAverage < 0:
+            clientClass.pingAverage = rtt
+        else:
+            clientClass.pingAverage += PING_AVERAGE_WEIGHT * (rtt - clientClass.pingAverage)
+        with self.lock:
+            self.samples.append(rtt)
+        PING_RTT.observe(rtt / 1000.0)
+        return rtt
+    
+    
+    def getPercentile(self, percentile):
+        # Round trip time in milliseconds below which the given percentage of the latest samples are,
+        # None before the first pong. Served as gamehub_ping_rtt_p50/p95_seconds (see metrics.py).
+        with self.lock:
+            samples = sorted(self.samples)
+        if len(samples) == 0:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
@@ -0,0 +1,395 @@
+# Load generator: connects simulated poker clients to a server and reports how it holds up.
+# Examples:
+#   python loadtest.py --clients 1000 --duration 60
+#   python loadtest.py --spawn --async --clients 500 --strategy mixed
+#   python loadtest.py --protocol 2 --clients 1000
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from gamestates import *
+from packetsyntax import *
+from protocol import GAME_FIELDS, PROTOCOL_V1, PROTOCOL_V2, decodeGameData, encodeVarint, frame, readFrame
+
+STRATEGIES = ('check', 'call', 'raise', 'fold', 'chat', 'mixed')
+MIXED_WEIGHTS = (('call', 60), ('raise', 15), ('fold', 20), ('chat', 5))
+RAISE_AMOUNT = 10
+CHAT_MESSAGES = ('gl', 'nice hand', 'hmm', 'all in next time', 'gg')
+
+
+class LoadStats(object):
+    connectStarted = 0
+    connected = 0
+    connectFailed = 0
+    connectSeconds = 0.0
+    disconnected = 0
+    helloFailed = 0
+    seated = 0
+    tableFull = 0
+    hands = 0.0 # Every player at the table sees the end of a hand, each of them counts a share
+    actions = 0
+    pings = 0
+    bytesReceived = 0
+    latencies = None # Seconds from sending an action to receiving its broadcast
+
+
+    def __init__(self):
+        self.latencies = []
+
+
+    def percentile(self, percentile):
+        if len(self.latencies) == 0:
+            return None
+        samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+class Bot(object):
+    # A simulated player: says hello, searches for a table, sits down and plays with a fixed strategy
+    name = ''
+    strategy = 'call'
+    stats = None
+    rng = None
+    reader = None
+    writer = None
+    requestedVersion = PROTOCOL_V1 # Protocol version asked for in SX_HELLO
+    protocolVersion = PROTOCOL_V1 # Version of the frames, switched when the server answers SX_HELLO
+    tablePlayers = None # Names of the players sitting at the bot's table
+    chairNames = None # chair -> name, for protocol version 2
+    sitting = False
+    actionSentAt = None
+    handBets = None # name -> chips bet in the current hand, to tell whether there is anything to call
+
+
+    def __init__(self, name, strategy, stats, rng, requestedVersion = PROTOCOL_V1):
+        self.name = name
+        self.strategy = strategy
+        self.stats = stats
+        self.rng = rng
+        self.requestedVersion = requestedVersion
+        self.tablePlayers = set()
+        self.chairNames = {}
+        self.handBets = {}
+
+
+    async def connect(self, host, port):
+        self.stats.connectStarted += 1
+        started = time.perf_counter()
+        try:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        except OSError:
+            self.stats.connectFailed += 1
+            return False
+        self.stats.connectSeconds += time.perf_counter() - started
+        self.stats.connected += 1
+        if self.requestedVersion > PROTOCOL_V1:
+            # Nothing else may be sent before the answer tells which version to use
+            self.send(SX_HELLO, self.name.encode('utf-8') + SX_EOO + str(self.requestedVersion).encode('utf-8'))
+        else:
+            self.send(SX_HELLO, self.name.encode('utf-8'))
+            self.send(SX_SEARCH_OPPONENT, bytes([GM_HOLDEM]))
+        return True
+
+
+    def send(self, header, data = b''):
+        self.writer.write(frame(header + data, self.protocolVersion))
+
+
+    def sendGameData(self, subHeader, data = b''):
+        self.send(SX_GAME_INFO, subHeader + data)
+
+
+    async def run(self, deadline):
+        buffer = b''
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    data = await asyncio.wait_for(self.reader.read(65536), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if not data:
+                    self.stats.disconnected += 1
+                    break
+                self.stats.bytesReceived += len(data)
+                buffer += data
+                offset = 0
+                while True:
+                    # The version can change after any frame
+                    body, offset = readFrame(buffer, offset, self.protocolVersion)
+                    if body is None:
+                        break
+                    if len(body) > 0:
+                        self.handleFrame(body)
+                buffer = buffer[offset:]
+        except (ConnectionError, OSError):
+            self.stats.disconnected += 1
+        finally:
+            self.writer.close()
+
+
+    def handleFrame(self, frame):
+        header = frame[:1]
+
+        if header == SX_PING:
+            self.stats.pings += 1
+            self.send(SX_PING, frame[1:])
+
+        elif header == SX_HELLO:
+            name, separator, version = frame[1:].partition(SX_EOO)
+            if len(frame) > 1 and name.decode('utf-8', 'replace') != self.name:
+                self.stats.helloFailed += 1
+            elif self.requestedVersion > PROTOCOL_V1:
+                if separator:
+                    self.protocolVersion = int(version)
+                self.send(SX_SEARCH_OPPONENT, bytes([GM_HOLDEM]))
+
+        elif header == SX_SEARCH_OPPONENT:
+            if frame[1:2] == SX_OPPONENT_FOUND:
+                self.sendGameData(SX_GAME_READY_TO_START)
+
+        elif header == SX_GAME_INFO:
+            if self.protocolVersion >= PROTOCOL_V2:
+                self.handleGameInfo(frame[1:2], self.decodeGameData(frame[1:2], frame[2:]))
+            else:
+                self.handleGameInfo(frame[1:2], [field.decode('utf-8', 'replace') for field in frame[2:].split(SX_EOO)])
+
+
+    def decodeGameData(self, subHeader, payload):
+        # Players referred to by their chair are replaced with their names, as in version 1
+        fields = decodeGameData(subHeader, payload)
+        if subHeader == SX_GAME_PLAYER_CHAIR:
+            for i in range(0, len(fields) - 1, 2):
+                self.chairNames[fields[i + 1]] = fields[i]
+        elif len(fields) > 0 and type(fields[0]) is int and GAME_FIELDS[subHeader].lstrip('*')[:1] == 'p':
+            fields[0] = self.chairNames.get(fields[0], '')
+        return fields
+
+
+    def handleGameInfo(self, subHeader, fields):
+        name = fields[0] if len(fields) > 0 else ''
+
+        if subHeader == SX_GAME_PLAYER_CHAIR:
+            self.tablePlayers.add(name)
+            if name == self.name:
+                self.sitting = True
+                self.stats.seated += 1
+
+        elif subHeader in (SX_GAME_PLAYER_SIT_OUT, SX_GAME_DISCONNECT):
+            self.tablePlayers.discard(name)
+            if name == self.name:
+                self.sitting = False
+                # Out of chips; sitting down again refills them
+                self.sendGameData(SX_GAME_READY_TO_START)
+
+        elif subHeader == SX_GAME_PLAYER_TURN:
+            if name == self.name:
+                self.act()
+
+        elif subHeader == SX_GAME_BLINDS:
+            for i in range(0, len(fields) - 1, 2):
+                self.addBet(fields[i], fields[i + 1])
+
+        elif subHeader in (SX_GAME_BET, SX_GAME_FOLD):
+            if subHeader == SX_GAME_BET and len(fields) > 1:
+                self.addBet(name, fields[1])
+            if name == self.name and self.actionSentAt is not None:
+                self.stats.latencies.append(time.perf_counter() - self.actionSentAt)
+                self.actionSentAt = None
+
+        elif subHeader == SX_GAME_TABLE_FULL:
+            self.stats.tableFull += 1
+
+        elif subHeader == SX_GAME_HAND_ENDED:
+            self.handBets.clear()
+            if self.sitting:
+                self.stats.hands += 1.0 / max(1, len(self.tablePlayers))
+
+
+    def addBet(self, name, amount):
+        if type(name) is int:
+            name = self.chairNames.get(name, '') # Only the first player of a version 2 packet has been looked up
+        try:
+            self.handBets[name] = self.handBets.get(name, 0) + int(amount)
+        except ValueError:
+            pass
+
+
+    def getAmountToCall(self):
+        if len(self.handBets) == 0:
+            return 0
+        return max(self.handBets.values()) - self.handBets.get(self.name, 0)
+
+
+    def act(self):
+        strategy = self.strategy
+        if strategy == 'mixed':
+            strategy = self.rng.choices([s for s, w in MIXED_WEIGHTS], [w for s, w in MIXED_WEIGHTS])[0]
+
+        if strategy == 'chat':
+            self.sendGameData(SX_GAME_CHAT_MESSAGE, self.rng.choice(CHAT_MESSAGES).encode('utf-8'))
+            strategy = 'call'
+
+        if strategy == 'check' and self.getAmountToCall() > 0:
+            strategy = 'fold' # Checks when it can, folds rather than calls
+
+        if strategy == 'fold':
+            self.sendGameData(SX_GAME_FOLD)
+        elif strategy == 'raise':
+            self.sendGameData(SX_GAME_BET, self.encodeAmount(RAISE_AMOUNT))
+        else:
+            # Betting zero checks when possible and calls otherwise
+            self.sendGameData(SX_GAME_BET, self.encodeAmount(0))
+        self.stats.actions += 1
+        self.actionSentAt = time.perf_counter()
+
+
+    def encodeAmount(self, amount):
+        if self.protocolVersion >= PROTOCOL_V2:
+            return encodeVarint(amount)
+        return str(amount).encode('utf-8')
+
+
+def readRSS(pid):
+    # Resident set size of a process in kilobytes, None where /proc is not available
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def spawnServer(port, asyncMode):
+    arguments = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')]
+    if asyncMode:
+        arguments.append('--async')
+    process = subprocess.Popen(arguments, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('The server did not start listening on port %d.' % port)
+
+
+async def monitorRSS(pid, samples, interval = 1.0):
+    while True:
+        rss = readRSS(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(interval)
+
+
+async def runLoadTest(options, serverPid = None):
+    stats = LoadStats()
+    rng = random.Random(options.seed)
+    rssSamples = []
+    monitor = None
+    if serverPid is not None:
+        monitor = asyncio.get_running_loop().create_task(monitorRSS(serverPid, rssSamples))
+
+    bots = []
+    tasks = []
+    connectStarted = time.perf_counter()
+    deadline = time.monotonic() + options.duration
+    for i in range(options.clients):
+        bot = Bot('%s%d' % (options.prefix, i), options.strategy, stats, random.Random(rng.random()), options.protocol)
+        if await bot.connect(options.host, options.port):
+            bots.append(bot)
+            tasks.append(asyncio.get_running_loop().create_task(bot.run(deadline)))
+        if options.connect_rate > 0:
+            await asyncio.sleep(max(0.0, connectStarted + (i + 1) / options.connect_rate - time.perf_counter()))
+    connectElapsed = time.perf_counter() - connectStarted
+
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - connectStarted
+
+    if monitor is not None:
+        monitor.cancel()
+        rss = readRSS(serverPid)
+        if rss is not None:
+            rssSamples.append(rss)
+
+    def milliseconds(seconds):
+        return None if seconds is None else round(seconds * 1000, 2)
+
+    return {
+        'clients': options.clients,
+        'strategy': options.strategy,
+        'connected': stats.connected,
+        'connectFailed': stats.connectFailed,
+        'connectsPerSecond': round(stats.connected / connectElapsed, 1) if connectElapsed > 0 else None,
+        'averageConnectMs': milliseconds(stats.connectSeconds / stats.connected) if stats.connected else None,
+        'disconnected': stats.disconnected,
+        'helloFailed': stats.helloFailed,
+        'seated': stats.seated,
+        'tableFull': stats.tableFull,
+        'hands': round(stats.hands),
+        'handsPerSecond': round(stats.hands / elapsed, 2) if elapsed > 0 else None,
+        'actions': stats.actions,
+        'pings': stats.pings,
+        'protocol': options.protocol,
+        'bytesReceived': stats.bytesReceived,
+        'actionLatencyP50Ms': milliseconds(stats.percentile(50)),
+        'actionLatencyP99Ms': milliseconds(stats.percentile(99)),
+        'serverRssKb': rssSamples[-1] if rssSamples else None,
+        'serverPeakRssKb': max(rssSamples) if rssSamples else None,
+    }
+
+
+def printReport(results):
+    width = max(len(key) for key in results)
+    for key, value in results.items():
+        print('%s  %s' % (key.ljust(width), '-' if value is None else value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Stress a game hub server with simulated poker clients.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 36936)
+    parser.add_argument('--clients', type = int, default = 100, help = 'number of concurrent connections')
+    parser.add_argument('--duration', type = float, default = 30, help = 'seconds the test runs, connecting included')
+    parser.add_argument('--connect-rate', type = float, default = 0, help = 'connections opened per second, 0 for no limit')
+    parser.add_argument('--strategy', choices = STRATEGIES, default = 'call')
+    parser.add_argument('--protocol', type = int, choices = (PROTOCOL_V1, PROTOCOL_V2), default = PROTOCOL_V1, help = 'protocol version the bots ask for')
+    parser.add_argument('--prefix', default = 'lt', help = 'bot names are the prefix followed by a number')
+    parser.add_argument('--seed', type = int, default = None)
+    parser.add_argument('--spawn', action = 'store_true', help = 'start a local server.py for the test')
+    parser.add_argument('--async', dest = 'asyncMode', action = 'store_true', help = 'start the spawned server with --async')
+    parser.add_argument('--server-pid', type = int, default = None, help = 'sample the RSS of an already running server')
+    parser.add_argument('--json', action = 'store_true', help = 'print the results as JSON')
+    options = parser.parse_args()
+
+    process = None
+    serverPid = options.server_pid
+    if options.spawn:
+        process = spawnServer(options.port, options.asyncMode)
+        serverPid = process.pid
+    try:
+        results = asyncio.run(runLoadTest(options, serverPid))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if options.json:
+        print(json.dumps(results, indent = 2))
+    else:
+        printReport(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+import bisect
+import threading
+from time import time
+from gamestates import *
+from metrics import MATCHMAKING_WAIT_SECONDS
+from serversettings import *
+import logging
+
+log = logging.getLogger('matchmaker')
+
+
+class Matchmaker(object):
+    # Seats searching clients at tables from its own thread, as soon as a client starts searching
+    # or a seat is freed. Searchers wait in one queue per game type, in the order they started searching.
+    # A pass over a queue first fills the free seats of the open tables, fullest table first, and then
+    # opens as many new tables as the rest can fill with at least MATCHMAKING_MIN_PLAYERS each,
+    # spreading them evenly over the tables. Whoever is left waits for the next searcher or free seat.
+    #
+    # With MATCHMAKING_PING_BUCKETS_MS a client is only seated with clients of the same ping bucket
+    # (by its average round trip time) until it has waited MATCHMAKING_PING_WAIT_SECONDS. Clients whose
+    # ping hasn't been measured yet go with any bucket, as do the tables they open.
+    games = None
+    queues = None # game type -> {client: time it started searching}, in search order
+    openTables = None # game type -> {gameID: game} of the tables that may have free seats
+    tableBuckets = None # gameID -> ping bucket of the table (None for any) of every table opened here
+    pending = None # Game types whose queues have to be looked at
+    deadlines = None # game type -> when the ping bucket of a waiting client runs out next
+    condition = None
+    clock = None
+    thread = None
+
+
+    def __init__(self, games, clock = time):
+        self.games = games
+        self.queues = {}
+        self.openTables = {}
+        self.tableBuckets = {}
+        self.pending = set()
+        self.deadlines = {}
+        self.condition = threading.Condition()
+        self.clock = clock
+        self.thread = threading.Thread(target = self.run, args = (), name = 'Matchmaker', daemon = True)
+
+
+    def start(self):
+        self.thread.start()
+
+
+    def addSearcher(self, client):
+        # Called once the client has been told it is searching
+        with self.condition:
+            self.queues.setdefault(client.currentGame, {}).setdefault(client, self.clock())
+            self.pending.add(client.currentGame)
+            self.condition.notify()
+
+
+    def seatFreed(self, game):
+        # Called when a client has left the table
+        with self.condition:
+            if game.gameID not in self.tableBuckets:
+                return
+            if self.games.getGame(game.gameID) is not game:
+                del self.tableBuckets[game.gameID] # Closed
+                self.openTables.get(game.gameType, {}).pop(game.gameID, None)
+                return
+            self.openTables.setdefault(game.gameType, {})[game.gameID] = game
+            self.pending.add(game.gameType)
+            self.condition.notify()
+
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    timeout = None
+                    if self.deadlines:
+                        timeout = max(0, min(self.deadlines.values()) - self.clock())
+                    if not self.condition.wait(timeout):
+                        self.pending.update(self.deadlines)
+                        self.deadlines.clear()
+                gameTypes = list(self.pending)
+                self.pending.clear()
+            for gameType in gameTypes:
+                try:
+                    self.match(gameType)
+                except Exception:
+                    log.exception('Matchmaking for game type %d failed.', gameType)
+
+
+    def pingBucket(self, client, waited):
+        # None if the client can be seated with anyone
+        if not MATCHMAKING_PING_BUCKETS_MS or client.pingAverage < 0 or waited >= MATCHMAKING_PING_WAIT_SECONDS:
+            return None
+        return bisect.bisect_left(MATCHMAKING_PING_BUCKETS_MS, client.pingAverage)
+
+
+    def match(self, gameType):
+        now = self.clock()
+        waiting = [] # (client, ping bucket)
+        with self.condition:
+            queue = self.queues.get(gameType, {})
+            for client, searchedAt in list(queue.items()):
+                if client.isDisconnected() or client.gameStatus != ST_SEARCHING or client.currentGame != gameType:
+                    del queue[client]
+                else:
+                    waiting.append((client, self.pingBucket(client, now - searchedAt)))
+            tables = []
+            openTables = self.openTables.get(gameType, {})
+            for gameID, game in list(openTables.items()):
+                if self.games.getGame(gameID) is game:
+                    tables.append((self.games.freeSeats(game), gameID, game))
+                else:
+                    del openTables[gameID] # Closed
+                    self.tableBuckets.pop(gameID, None)
+        if len(waiting) == 0:
+            return
+
+        seatings = [] # (table or None for a new one, ping bucket, clients)
+        # Free seats of the open tables, fullest table first
+        for free, gameID, game in sorted(tables, key = lambda table: (table[0], table[1])):
+            if free <= 0:
+                continue
+            tableBucket = self.tableBuckets.get(gameID)
+            joining = [c for c, b in waiting if b is None or tableBucket is None or b == tableBucket][:free]
+            if joining:
+                seatings.append((game, tableBucket, joining))
+                seated = set(joining)
+                waiting = [(c, b) for c, b in waiting if c not in seated]
+
+        # New tables, one ping bucket at a time and then the clients that go with any bucket
+        maxPlayers = self.games.getMaxPlayers(gameType)
+        for bucket in sorted(set(b for c, b in waiting if b is not None)) + [None]:
+            # The clients of the bucket first, topped up with the ones that go with any bucket
+            group = [c for c, b in waiting if b == bucket]
+            if len(group) == 0:
+                continue
+            if bucket is not None:
+                group += [c for c, b in waiting if b is None]
+            seated = set()
+            for clients in splitIntoTables(group, maxPlayers):
+                seatings.append((None, bucket, clients))
+                seated.update(clients)
+            waiting = [(c, b) for c, b in waiting if c not in seated]
+
+        searchedAt = {}
+        with self.condition:
+            queue = self.queues.get(gameType, {})
+            for table, bucket, clients in seatings:
+                for c in clients:
+                    searchedAt[c] = queue.pop(c, now)
+            # Wake up when the first of the clients still waiting may go with any bucket
+            deadlines = [queue[c] + MATCHMAKING_PING_WAIT_SECONDS for c, b in waiting if b is not None and c in queue]
+            if deadlines:
+                self.deadlines[gameType] = min(deadlines)
+            else:
+                self.deadlines.pop(gameType, None)
+
+        for table, bucket, clients in seatings:
+            if self.seat(gameType, table, bucket, clients):
+                for c in clients:
+                    MATCHMAKING_WAIT_SECONDS.observe(now - searchedAt[c])
+            else:
+                self.requeue(gameType, table, clients, searchedAt)
+
+
+    def seat(self, gameType, game, bucket, clients):
+        # Returns False if the table closed before the clients could join it
+        if game is None:
+            game = self.games.createGame(gameType, clients)
+            if game is None:
+                return True # No table could be opened; the clients have been sent back to the menu
+            log.debug('Opened game %d for %d clients.', game.gameID, len(clients))
+        elif self.games.joinGame(game, clients):
+            log.debug('Seated %d clients at game %d.', len(clients), game.gameID)
+        else:
+            return False
+        with self.condition:
+            self.tableBuckets[game.gameID] = bucket
+            if self.games.freeSeats(game) > 0:
+                self.openTables.setdefault(gameType, {})[game.gameID] = game
+            else:
+                self.openTables.get(gameType, {}).pop(game.gameID, None)
+        return True
+
+
+    def requeue(self, gameType, game, clients, searchedAt):
+        # Puts the clients back at the front of the queue and forgets the closed table
+        log.debug('Game %d closed before %d clients could join it.', game.gameID, len(clients))
+        with self.condition:
+            self.tableBuckets.pop(game.gameID, None)
+            self.openTables.get(gameType, {}).pop(game.gameID, None)
+            queue = dict((c, searchedAt[c]) for c in clients)
+            queue.update(self.queues.get(gameType, {}))
+            self.queues[gameType] = queue
+            self.pending.add(gameType)
+            self.condition.notify()
+
+
+def splitIntoTables(clients, maxPlayers, minPlayers = MATCHMAKING_MIN_PLAYERS):
+    # As few tables as seat the most clients, with the clients spread evenly over them
+    numOfTables = -(-len(clients) // maxPlayers)
+    while numOfTables * minPlayers > len(clients):
+        numOfTables -= 1
+    if numOfTables <= 0:
+        return []
+    seated = min(len(clients), numOfTables * maxPlayers)
+    tables = []
+    start = 0
+    for i in range(numOfTables):
+        size = seated // numOfTables + (1 if i < seated % numOfTables else 0)
+        tables.append(clients[start:start + size])
+        start += size
+    return tables
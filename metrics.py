@@ -0,0 +1,337 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import profiler
+import packetsyntax
+from packetsyntax import *
+from serversettings import *
+import logging
+
+log = logging.getLogger('metrics')
+
+# Counters, gauges and histograms served in the Prometheus text exposition format on
+# http://METRICS_ADDRESS:METRICS_PORT/metrics. Updating a metric is a single attribute
+# update without a lock, so it can stay on in the hot paths. The GIL keeps the values
+# consistent; an update can only be lost if two threads hit the same metric at the same instant.
+#
+# In the --workers mode the tables run in other processes; their metrics (game_*) aren't served.
+
+# Histogram buckets in seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+PING_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+
+
+def formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    if type(value) is float and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def formatLabels(labelNames, labelValues, extra = ''):
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in zip(labelNames, labelValues)]
+    if extra:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ''
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric(object):
+    # A metric family. Without label names the family itself is updated; with label names
+    # labels(...) returns the child for one combination of label values, which can be kept.
+    kind = ''
+    name = ''
+    help = ''
+    labelNames = ()
+    children = None # label values -> child
+
+
+    def __init__(self, name, help, labelNames = ()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.children = {}
+        self.reset()
+
+
+    def reset(self):
+        pass
+
+
+    def labels(self, *labelValues):
+        child = self.children.get(labelValues)
+        if child is None:
+            child = self.children.setdefault(labelValues, self.makeChild())
+        return child
+
+
+    def makeChild(self):
+        return self.__class__(self.name, self.help)
+
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        if len(self.labelNames) == 0:
+            self.renderSamples(lines, '')
+        for labelValues, child in sorted(self.children.items()):
+            child.renderSamples(lines, formatLabels(self.labelNames, labelValues), self.labelNames, labelValues)
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+    value = 0
+
+
+    def reset(self):
+        self.value = 0
+
+
+    def inc(self, amount = 1):
+        self.value += amount
+
+
+    def renderSamples(self, lines, labels, labelNames = (), labelValues = ()):
+        lines.append('%s%s %s' % (self.name, labels, formatValue(self.value)))
+
+
+class Gauge(Metric):
+    # Either set by the code or read from function when the metrics are served
+    kind = 'gauge'
+    value = 0
+    function = None
+
+
+    def reset(self):
+        self.value = 0
+
+
+    def set(self, value):
+        self.value = value
+
+
+    def inc(self, amount = 1):
+        self.value += amount
+
+
+    def dec(self, amount = 1):
+        self.value -= amount
+
+
+    def setFunction(self, function):
+        self.function = function
+
+
+    def renderSamples(self, lines, labels, labelNames = (), labelValues = ()):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception as e:
+                log.warning('Failed to read the gauge %s: %s', self.name, e)
+                return
+        lines.append('%s%s %s' % (self.name, labels, formatValue(value)))
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    buckets = LATENCY_BUCKETS # Upper bounds, +Inf is implied
+    counts = None # Observations per bucket, the last one for +Inf
+    sum = 0.0
+
+
+    def __init__(self, name, help, labelNames = (), buckets = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        Metric.__init__(self, name, help, labelNames)
+
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+
+    def makeChild(self):
+        return Histogram(self.name, self.help, (), self.buckets)
+
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+    def getCount(self):
+        return sum(self.counts)
+
+
+    def renderSamples(self, lines, labels, labelNames = (), labelValues = ()):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (self.name, formatLabels(labelNames, labelValues, 'le="%s"' % formatValue(float(bound))), cumulative))
+        lines.append('%s_sum%s %s' % (self.name, labels, formatValue(self.sum)))
+        lines.append('%s_count%s %d' % (self.name, labels, cumulative))
+
+
+class Registry(object):
+    metrics = None
+
+
+    def __init__(self):
+        self.metrics = []
+
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+    def counter(self, name, help, labelNames = ()):
+        return self.register(Counter(name, help, labelNames))
+
+
+    def gauge(self, name, help, labelNames = ()):
+        return self.register(Gauge(name, help, labelNames))
+
+
+    def histogram(self, name, help, labelNames = (), buckets = LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelNames, buckets))
+
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CLIENTS_CONNECTED = REGISTRY.gauge('gamehub_clients_connected', 'Clients that have said hello.')
+CLIENTS_SEARCHING = REGISTRY.gauge('gamehub_clients_searching', 'Clients searching for a game.')
+GAMES_ACTIVE = REGISTRY.gauge('gamehub_games_active', 'Tables being played.')
+PACKETS_IN = REGISTRY.counter('gamehub_packets_received_total', 'Requests received from clients.', ('type',))
+PACKETS_OUT = REGISTRY.counter('gamehub_packets_sent_total', 'Packets queued for clients.', ('type',))
+BYTES_IN = REGISTRY.counter('gamehub_bytes_received_total', 'Bytes received from clients.')
+BYTES_OUT = REGISTRY.counter('gamehub_bytes_sent_total', 'Bytes written to client sockets.')
+SEND_FAILURES = REGISTRY.counter('gamehub_send_failures_total', 'Packets that could not be queued or flushed.')
+PING_RTT = REGISTRY.histogram('gamehub_ping_rtt_seconds', 'Round trip time of the keepalive pings.', (), PING_BUCKETS)
+PING_RTT_P50 = REGISTRY.gauge('gamehub_ping_rtt_p50_seconds', 'Median round trip time of the latest keepalive pings.')
+PING_RTT_P95 = REGISTRY.gauge('gamehub_ping_rtt_p95_seconds', '95th percentile round trip time of the latest keepalive pings.')
+GAME_UPDATE_SECONDS = REGISTRY.histogram('gamehub_game_update_seconds', 'Time taken by one update() of a table.')
+GAME_ACTION_SECONDS = REGISTRY.histogram('gamehub_game_action_seconds', 'Time from a bet or fold reaching the table to its broadcast being queued.')
+GAME_SHOWDOWN_SECONDS = REGISTRY.histogram('gamehub_game_showdown_seconds', 'Time taken to evaluate the hands at a showdown.')
+TABLE_POOL_SIZE = REGISTRY.gauge('gamehub_table_pool_size', 'Tables ready to be handed out.')
+MATCHMAKING_WAIT_SECONDS = REGISTRY.histogram('gamehub_matchmaking_wait_seconds', 'Time from starting to search to being seated at a table.', (), WAIT_BUCKETS)
+
+# Packet type names for the labels of PACKETS_IN and PACKETS_OUT, by header byte and by SX_GAME_INFO subheader byte
+PACKET_NAMES = {
+    SX_HELLO[0]: 'hello',
+    SX_PING[0]: 'ping',
+    SX_PING_RESPONSE[0]: 'ping_response',
+    SX_SEARCH_OPPONENT[0]: 'search_opponent',
+    SX_GAME_INFO[0]: 'game',
+}
+GAME_PACKET_NAMES = dict((value[0], name[len('SX_GAME_'):].lower()) for name, value in vars(packetsyntax).items()
+                         if name.startswith('SX_GAME_') and name != 'SX_GAME_INFO')
+GAME_INFO_BYTE = SX_GAME_INFO[0]
+
+
+def makePacketCounters(metric):
+    # The child counter of every packet type, indexed by header byte * 256 + subheader byte
+    # (the subheader only for SX_GAME_INFO) so the hot paths don't look the labels up
+    counters = {}
+    for header, name in PACKET_NAMES.items():
+        if header == SX_GAME_INFO[0]:
+            for subheader, gameName in GAME_PACKET_NAMES.items():
+                counters[header * 256 + subheader] = metric.labels('game_' + gameName)
+        else:
+            counters[header * 256] = metric.labels(name)
+    return counters
+
+
+PACKETS_IN_BY_TYPE = makePacketCounters(PACKETS_IN)
+PACKETS_OUT_BY_TYPE = makePacketCounters(PACKETS_OUT)
+PACKETS_IN_OTHER = PACKETS_IN.labels('other')
+PACKETS_OUT_OTHER = PACKETS_OUT.labels('other')
+
+
+def countPacketIn(requestType, data):
+    header = requestType[0]
+    key = header * 256 + data[0] if header == GAME_INFO_BYTE and len(data) > 0 else header * 256
+    PACKETS_IN_BY_TYPE.get(key, PACKETS_IN_OTHER).value += 1
+
+
+def countPacketOut(packet, version):
+    # packet is framed; a protocol version 2 frame starts with its varint length
+    offset = 0
+    if version >= 2:
+        while packet[offset] >= 0x80:
+            offset += 1
+        offset += 1
+    header = packet[offset]
+    key = header * 256 + packet[offset + 1] if header == GAME_INFO_BYTE and len(packet) > offset + 1 else header * 256
+    PACKETS_OUT_BY_TYPE.get(key, PACKETS_OUT_OTHER).value += 1
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path in ('/metrics', '/'):
+            self.sendText(self.registry.render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif url.path == '/profile':
+            self.sendProfile(parse_qs(url.query))
+        else:
+            self.send_error(404)
+
+
+    def sendProfile(self, query):
+        # /profile?seconds=N: samples the server's threads for N seconds (see profiler.py)
+        # and answers with the collapsed stacks
+        try:
+            seconds = float(query.get('seconds', [PROFILE_SECONDS])[0])
+        except ValueError:
+            self.send_error(400, 'seconds must be a number')
+            return
+        if not 0 < seconds <= PROFILE_SECONDS_MAX:
+            self.send_error(400, 'seconds must be between 0 and %d' % PROFILE_SECONDS_MAX)
+            return
+        stacks = profiler.PROFILER.profile(seconds)
+        if stacks is None:
+            self.send_error(409, 'A profile is already being taken')
+            return
+        self.sendText(profiler.formatCollapsed(stacks), 'text/plain; charset=utf-8')
+
+
+    def sendText(self, text, contentType):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+def startMetricsServer(address = METRICS_ADDRESS, port = METRICS_PORT):
+    # Serves the metrics from a daemon thread. Returns the HTTP server, None if disabled or the port is taken.
+    if port is None:
+        return None
+    try:
+        httpServer = ThreadingHTTPServer((address, port), MetricsHandler)
+    except OSError as e:
+        log.error('Failed to serve the metrics on %s:%d: %s', address, port, e)
+        return None
+    httpServer.daemon_threads = True
+    threading.Thread(target = httpServer.serve_forever, args = (), name = 'MetricsServer', daemon = True).start()
+    log.info('Serving metrics on http://%s:%d/metrics', address, port)
+    return httpServer
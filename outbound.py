@@ -0,0 +1,96 @@
+import selectors
+import socket
+import threading
+
+
+class OutboundWriter(object):
+    # Flushes the outbound buffers of all clients from a single thread.
+    # Client.sendRawPacket only appends to the client's buffer and asks for a flush here,
+    # so a client that doesn't read its data never blocks the thread that produced it.
+    selector = None
+    pendingClients = None
+    pendingLock = None
+    wakeReader = None
+    wakeWriter = None
+    thread = None
+    
+    
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.pendingClients = []
+        self.pendingLock = threading.Lock()
+        self.wakeReader, self.wakeWriter = socket.socketpair()
+        self.wakeReader.setblocking(False)
+        self.wakeWriter.setblocking(False)
+        self.selector.register(self.wakeReader, selectors.EVENT_READ)
+        self.thread = threading.Thread(target = self.run, args = (), name = 'OutboundWriter', daemon = True)
+        
+        
+    def start(self):
+        self.thread.start()
+        
+        
+    def scheduleFlush(self, client):
+        # Called from any thread when a client has new data to send or has been disconnected
+        with self.pendingLock:
+            self.pendingClients.append(client)
+            wake = len(self.pendingClients) == 1
+        if wake:
+            try:
+                self.wakeWriter.send(b'\x00')
+            except BlockingIOError: # Already woken up
+                pass
+            
+            
+    def run(self):
+        while True:
+            for key, events in self.selector.select():
+                if key.fileobj is self.wakeReader:
+                    self.registerPendingClients()
+                else:
+                    self.flushClient(key.data)
+                    
+                    
+    def registerPendingClients(self):
+        try:
+            while self.wakeReader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        
+        with self.pendingLock:
+            clients = self.pendingClients
+            self.pendingClients = []
+            
+        for client in clients:
+            if client.isDisconnected():
+                self.unregister(client)
+                continue
+            # Wait until the socket is writable; a writable socket is reported on the next select()
+            try:
+                self.selector.register(client.clientHandle, selectors.EVENT_WRITE, client)
+            except KeyError:
+                key = self.selector.get_key(client.clientHandle.fileno())
+                if key.data is not client:
+                    # The file descriptor of a closed socket has been reused
+                    self.selector.unregister(key.fileobj)
+                    self.selector.register(client.clientHandle, selectors.EVENT_WRITE, client)
+            except (OSError, ValueError): # Socket already closed
+                pass
+                
+                
+    def flushClient(self, client):
+        if client.isDisconnected():
+            self.unregister(client)
+        elif not client.flush():
+            self.unregister(client)
+            client.closeConnection()
+        elif not client.flushPending:
+            self.unregister(client)
+            
+            
+    def unregister(self, client):
+        try:
+            self.selector.unregister(client.clientHandle)
+        except (KeyError, ValueError):
+            pass
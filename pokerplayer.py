@@ -1,29 +1,29 @@
 from gamestates import *
+import logging
+
+log = logging.getLogger('pokerplayer')
 
 class PokerPlayer(object):
-    clientClass = None
-    cards = []
-    chips = 100
-    totalBet = 0
-    inSidePot = False
-    
-    currentRound = 0
-    allIn = False
-    folded = False
-    waitForBigBlind = False
-    
-    chair = -1
+    __slots__ = ('clientClass', 'cards', 'chips', 'totalBet', 'currentRound', 'allIn', 'folded', 'waitForBigBlind', 'chair', 'seated')
         
     def __init__(self, clientClass):
+        self.cards = []
+        self.join(clientClass)
+        
+        
+    def join(self, clientClass):
+        # Sets the player up for a client joining a table; also used to reuse a pooled player
         self.reset()
         self.clientClass = clientClass
         self.chips = 100
+        self.waitForBigBlind = False
+        self.chair = -1 # Kept after the player leaves the table, the buttons move on from it
+        self.seated = False # Sitting at the table in chair
         
         
     def reset(self):
-        self.cards = []
+        del self.cards[:]
         self.totalBet = 0
-        self.inSidePot = False
         self.currentRound = 0
         self.allIn = False
         self.folded = False
@@ -45,7 +45,7 @@ class PokerPlayer(object):
             chipsTook = self.chips
             self.chips = 0
             self.allIn = True
-            print('Player %s goes all in!' % self.clientClass.name)
+            log.debug('Player %s goes all in!', self.clientClass.name)
         else:
             chipsTook = amount
             self.chips -= amount
@@ -56,17 +56,16 @@ class PokerPlayer(object):
         
         
     def sitOut(self):
+        self.seated = False
         self.clientClass.gameStatus = ST_IN_GAME
-        print('Player %s is sitting out (%d)!' % (self.clientClass.name, self.clientClass.gameStatus))
+        log.debug('Player %s is sitting out (%d)!', self.clientClass.name, self.clientClass.gameStatus)
         
         
     def sitIn(self):
+        self.seated = True
         self.clientClass.gameStatus = ST_PLAYING
-        print('Player %s is sitting in (%d)!' % (self.clientClass.name, self.clientClass.gameStatus))
+        log.debug('Player %s is sitting in (%d)!', self.clientClass.name, self.clientClass.gameStatus)
         
     
     def getCardsStr(self):
-        string = ''
-        for card in self.cards:
-            string += str(card)
-        return string
\ No newline at end of file
+        return ''.join([card.string for card in self.cards])
\ No newline at end of file
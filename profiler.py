@@ -0,0 +1,121 @@
+import os
+import re
+import signal
+import sys
+import threading
+from time import sleep, strftime, time
+from serversettings import *
+import logging
+
+log = logging.getLogger('profiler')
+
+THREAD_NUMBER = re.compile(r'-\d+')
+
+# Wall-clock sampling profiler for the running server. While a profile is being taken a thread
+# reads the stack of every other thread PROFILE_INTERVAL_SECONDS apart; the rest of the time
+# nothing runs at all. The result is in the collapsed stack format of flamegraph.pl and speedscope:
+# one line per distinct stack, the thread name and the frames from the outermost call separated by
+# semicolons, then the number of samples. Threads doing the same job (e.g. every listenToClient thread)
+# are merged by leaving the numbers out of their names.
+#
+# Taking a profile:
+#   kill -USR2 <server pid>                                     PROFILE_SECONDS, written to PROFILE_DIRECTORY
+#   curl 'http://METRICS_ADDRESS:METRICS_PORT/profile?seconds=10'   answered with the collapsed stacks
+#
+# Threads waiting for something (recv, sleep, locks) are sampled as well, so a stalled table shows
+# up as the place it is waiting in. In the --workers mode the tables run in other processes and
+# aren't sampled.
+
+
+class SamplingProfiler(object):
+    interval = PROFILE_INTERVAL_SECONDS
+    lock = None # Only one profile at a time
+    labels = None # code object -> frame label
+
+
+    def __init__(self, interval = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.labels = {}
+
+
+    def frameLabel(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = '%s:%s' % (os.path.splitext(os.path.basename(code.co_filename))[0], code.co_name)
+            self.labels[code] = label
+        return label
+
+
+    def sample(self, stacks, ownThread):
+        names = dict((thread.ident, THREAD_NUMBER.sub('', thread.name)) for thread in threading.enumerate())
+        for threadID, frame in sys._current_frames().items():
+            if threadID == ownThread:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self.frameLabel(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(threadID, 'Thread'))
+            labels.reverse()
+            stack = ';'.join(labels)
+            stacks[stack] = stacks.get(stack, 0) + 1
+
+
+    def profile(self, seconds):
+        # Samples every thread for seconds. Returns the samples per collapsed stack,
+        # None if another profile is being taken.
+        if not self.lock.acquire(blocking = False):
+            return None
+        try:
+            log.info('Profiling for %.1f seconds.', seconds)
+            stacks = {}
+            ownThread = threading.get_ident()
+            end = time() + seconds
+            while time() < end:
+                self.sample(stacks, ownThread)
+                sleep(self.interval)
+            log.info('Profile done: %d samples, %d distinct stacks.', sum(stacks.values()), len(stacks))
+            return stacks
+        finally:
+            self.lock.release()
+
+
+    def isProfiling(self):
+        return self.lock.locked()
+
+
+    def profileToFile(self, seconds = PROFILE_SECONDS, directory = PROFILE_DIRECTORY):
+        # Returns the path of the written profile, None if another profile is being taken
+        stacks = self.profile(seconds)
+        if stacks is None:
+            log.warning('A profile is already being taken.')
+            return None
+        os.makedirs(directory, exist_ok = True)
+        path = os.path.join(directory, 'profile-%s-%d.folded' % (strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        with open(path, 'w') as f:
+            f.write(formatCollapsed(stacks))
+        log.info('Profile written to %s.', path)
+        return path
+
+
+    def startInBackground(self, seconds = PROFILE_SECONDS, directory = PROFILE_DIRECTORY):
+        threading.Thread(target = self.profileToFile, args = (seconds, directory), name = 'Profiler', daemon = True).start()
+
+
+def formatCollapsed(stacks):
+    return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(stacks.items()))
+
+
+PROFILER = SamplingProfiler()
+
+
+def installSignalHandler(signalNumber = None):
+    # Starts a PROFILE_SECONDS profile when the server process gets the signal (SIGUSR2 by default).
+    # Must be called from the main thread. Does nothing where the signal doesn't exist (Windows).
+    if signalNumber is None:
+        signalNumber = getattr(signal, 'SIGUSR2', None)
+        if signalNumber is None:
+            return False
+    signal.signal(signalNumber, lambda number, frame: PROFILER.startInBackground())
+    return True
@@ -0,0 +1,199 @@
+from packetsyntax import *
+
+# Protocol version 2: length-prefixed frames, varint numbers and players referred to by their chair.
+#
+# A client asks for it in its SX_HELLO: SX_HELLO + name + SX_EOO + b'2'. The server answers in the
+# old framing with SX_HELLO + name + SX_EOO + the version it picked (a server that only speaks version 1
+# answers with the name alone). The client must not send anything else before it has the answer.
+# Every later frame, in both directions, uses the version that was picked:
+#
+#   frame    varint length of the body, then the body: header byte(s) and payload; there is no SX_EOR
+#   varint   unsigned LEB128: 7 bits per byte, lowest bits first, the high bit set on every byte but the last
+#
+# Lobby packets (SX_HELLO, SX_PING, SX_SEARCH_OPPONENT) keep their payloads. The payloads of game packets
+# (SX_GAME_INFO) are the fields listed in GAME_FIELDS:
+#
+#   p  player: varint chair + 1 for a player sitting at the table, or 0 followed by an s with the name
+#   h  chair: varint chair + 1, 0 for none
+#   i  number: varint
+#   c  card: one byte, the card's value (see card.py)
+#   s  string: varint length, then the UTF-8 bytes
+#
+# Fields after a * repeat until the end of the payload. Clients learn which name sits on which chair from
+# SX_GAME_PLAYER_CHAIR. In version 1 the same fields are sent as text separated by SX_EOO: players as
+# their names, numbers and chairs in decimal and cards as two digits.
+#
+# Clients send SX_GAME_BET amounts as a varint; a chat message is the rest of the frame.
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+PROTOCOL_VERSIONS = (PROTOCOL_V1, PROTOCOL_V2)
+
+GAME_FIELDS = {
+    SX_GAME_PLAYER_CHIPS: '*pi',
+    SX_GAME_DEAL_HAND: '*c',
+    SX_GAME_DEAL_TABLE: '*c',
+    SX_GAME_BLINDS: '*pi',
+    SX_GAME_BET: 'pi',
+    SX_GAME_POT: 'pi',
+    SX_GAME_DISCONNECT: 'p',
+    SX_GAME_NOT_ENOUGH_PLAYERS: '',
+    SX_GAME_BUTTONS_CHAIRS: 'hhh',
+    SX_GAME_PLAYER_CHIPS_IN_POT: '*pi',
+    SX_GAME_PLAYER_CHAIR: '*si',
+    SX_GAME_TABLE_FULL: '',
+    SX_GAME_PLAYER_TURN: 'pi',
+    SX_GAME_FOLD: 'pi',
+    SX_GAME_PLAYER_HAND: 'pcc',
+    SX_GAME_HAND_ENDED: '',
+    SX_GAME_PLAYER_SIT_OUT: 'p',
+    SX_GAME_CHAT_MESSAGE: 'ps',
+    SX_GAME_PLAYER_CARD_COUNT: '*pi',
+}
+
+# One bytes object per small varint so encoding the usual chairs, counts and card values doesn't allocate
+SMALL_VARINTS = [bytes([i]) for i in range(128)]
+
+
+def encodeVarint(value):
+    if 0 <= value < 128:
+        return SMALL_VARINTS[value]
+    if value < 0:
+        raise ValueError('Varints can not be negative: %d' % value)
+    encoded = bytearray()
+    while value >= 128:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def decodeVarint(buffer, offset = 0):
+    # Returns the value and the offset after it. Raises ValueError if the varint is cut short.
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(buffer):
+            raise ValueError('Truncated varint.')
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+        if shift > 63:
+            raise ValueError('Varint is too long.')
+
+
+def encodeString(string):
+    encoded = string.encode('utf-8')
+    return encodeVarint(len(encoded)) + encoded
+
+
+def frame(body, version):
+    if version >= PROTOCOL_V2:
+        return encodeVarint(len(body)) + body
+    return body + SX_EOR
+
+
+def readFrame(buffer, offset, version):
+    # For clients: the body of the frame starting at offset and the offset after it,
+    # or (None, offset) if the frame hasn't been received completely yet.
+    if version >= PROTOCOL_V2:
+        try:
+            length, start = decodeVarint(buffer, offset)
+        except ValueError:
+            return None, offset
+        if start + length > len(buffer):
+            return None, offset
+        return bytes(buffer[start:start + length]), start + length
+    end = buffer.find(SX_EOR, offset)
+    if end == -1:
+        return None, offset
+    return bytes(buffer[offset:end]), end + 1
+
+
+def encodeGameFieldsV1(headerByte, fields):
+    strings = []
+    kinds = GAME_FIELDS[headerByte]
+    repeatFrom = kinds.find('*')
+    if repeatFrom != -1:
+        kinds = kinds[repeatFrom + 1:]
+    for i, field in enumerate(fields):
+        kind = kinds[i % len(kinds)]
+        if kind == 'p':
+            strings.append(field.getName())
+        elif kind == 'c':
+            strings.append(field.string)
+        else:
+            strings.append(str(field))
+    return SXSTR_EOO.join(strings)
+
+
+def encodeGameFieldsV2(headerByte, fields):
+    encoded = bytearray()
+    kinds = GAME_FIELDS[headerByte]
+    repeatFrom = kinds.find('*')
+    if repeatFrom != -1:
+        kinds = kinds[repeatFrom + 1:]
+    for i, field in enumerate(fields):
+        kind = kinds[i % len(kinds)]
+        if kind == 'i':
+            if 0 <= field < 128:
+                encoded.append(field)
+            else:
+                encoded += encodeVarint(field)
+        elif kind == 'p':
+            if field.seated:
+                encoded += encodeVarint(field.chair + 1)
+            else:
+                encoded.append(0)
+                encoded += encodeString(field.getName())
+        elif kind == 'c':
+            encoded.append(field.value)
+        elif kind == 'h':
+            encoded += encodeVarint(field + 1)
+        else:
+            encoded += encodeString(field)
+    return bytes(encoded)
+
+
+def encodeGameData(headerByte, fields, version):
+    # The payload of a game packet in the given protocol version.
+    # Players are PokerPlayers, cards Cards, chairs and numbers ints and strings strs.
+    if version >= PROTOCOL_V2:
+        return encodeGameFieldsV2(headerByte, fields)
+    return encodeGameFieldsV1(headerByte, fields)
+
+
+def decodeGameData(headerByte, payload):
+    # For clients: the fields of a version 2 game packet. Players are decoded to their chair,
+    # or to their name if they aren't sitting at the table; chairs are -1 for none.
+    fields = []
+    kinds = GAME_FIELDS[headerByte]
+    repeatFrom = kinds.find('*')
+    if repeatFrom != -1:
+        kinds = kinds[repeatFrom + 1:]
+    offset = 0
+    i = 0
+    while offset < len(payload) and (repeatFrom != -1 or i < len(kinds)):
+        kind = kinds[i % len(kinds)]
+        i += 1
+        value = payload[offset]
+        if kind == 'c':
+            fields.append(value)
+            offset += 1
+            continue
+        if value < 0x80:
+            offset += 1
+        else:
+            value, offset = decodeVarint(payload, offset)
+        if kind == 'i':
+            fields.append(value)
+        elif kind == 'h' or (kind == 'p' and value > 0):
+            fields.append(value - 1)
+        else:
+            # A string, or the name of a player without a chair
+            length, offset = decodeVarint(payload, offset) if kind == 'p' else (value, offset)
+            fields.append(bytes(payload[offset:offset + length]).decode('utf-8', 'replace'))
+            offset += length
+    return fields
@@ -1,13 +1,10 @@
 class Request(object):
-    requestID = 0
-    requestType = ''
-    length = -1
-    rawLength = ''
-    data = b''
+    __slots__ = ('requestID', 'requestType', 'length', 'rawLength', 'data')
 
 
-    def Request(self):
-        self.reset
+    def __init__(self):
+        self.requestID = 0
+        self.reset()
 
 
     def reset(self):
@@ -0,0 +1,130 @@
+import heapq
+import itertools
+import logging
+import threading
+from time import time, perf_counter
+from gamestates import *
+from serversettings import *
+from metrics import GAME_UPDATE_SECONDS
+
+log = logging.getLogger('scheduler')
+
+
+class GameScheduler(object):
+    # Drives every table from a small pool of worker threads.
+    # A table's update() only runs when something happens at the table (wake) or when the
+    # earliest of its timers runs out (TexasHoldEmGame.getNextWakeTime), so idle tables cost nothing.
+    heap = None # (deadline, sequence, game)
+    deadlines = None # game -> (deadline, sequence) of its valid heap entry
+    running = None # Games being updated right now
+    pendingDeadlines = None # Earliest wake-up requested for a game while it was being updated
+    condition = None
+    sequence = None
+    workers = None
+    endedListener = None # Called with a game that has ended once no worker will update it anymore
+    
+    
+    def __init__(self, workers = SCHEDULER_WORKERS):
+        self.heap = []
+        self.deadlines = {}
+        self.running = set()
+        self.pendingDeadlines = {}
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()
+        self.workers = [threading.Thread(target = self.run, args = (), name = 'GameScheduler-%d' % i, daemon = True) for i in range(workers)]
+        
+        
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+            
+            
+    def wake(self, game):
+        # Update the game as soon as possible
+        self.schedule(game, time())
+        
+        
+    def schedule(self, game, deadline):
+        with self.condition:
+            if game in self.running:
+                # Update it again once the current update has finished
+                pending = self.pendingDeadlines.get(game)
+                if pending is None or deadline < pending:
+                    self.pendingDeadlines[game] = deadline
+                return
+            
+            current = self.deadlines.get(game)
+            if current is not None and current[0] <= deadline:
+                return
+            sequence = next(self.sequence)
+            self.deadlines[game] = (deadline, sequence)
+            heapq.heappush(self.heap, (deadline, sequence, game))
+            self.condition.notify()
+            
+            
+    def run(self):
+        while True:
+            with self.condition:
+                game = self.nextDueGame()
+                self.running.add(game)
+                
+            nextDeadline = self.updateGame(game)
+            
+            with self.condition:
+                self.running.discard(game)
+                pending = self.pendingDeadlines.pop(game, None)
+                ended = game.gameState == GMST_ENDED
+                if ended:
+                    self.deadlines.pop(game, None) # Any entry left in the heap is skipped
+            if ended:
+                if self.endedListener is not None:
+                    self.endedListener(game)
+                continue
+            if pending is not None and (nextDeadline is None or pending < nextDeadline):
+                nextDeadline = pending
+            if nextDeadline is not None:
+                self.schedule(game, nextDeadline)
+                
+                
+    def nextDueGame(self):
+        # Waits until a game is due; must be called with the condition held
+        while True:
+            if len(self.heap) == 0:
+                self.condition.wait()
+                continue
+            
+            deadline, sequence, game = self.heap[0]
+            if self.deadlines.get(game) != (deadline, sequence):
+                heapq.heappop(self.heap) # Replaced by an earlier wake-up
+                continue
+            
+            now = time()
+            if deadline > now:
+                self.condition.wait(deadline - now)
+                continue
+            
+            heapq.heappop(self.heap)
+            del self.deadlines[game]
+            return game
+        
+        
+    def updateGame(self, game):
+        # Returns when the game has to be updated next, None to wait for the next wake()
+        with game.lock:
+            if game.gameState == GMST_ENDED:
+                return None
+            
+            progressed = False
+            started = perf_counter()
+            try:
+                progressed = game.update()
+            except Exception:
+                log.exception('Updating game %d failed.', game.gameID)
+            GAME_UPDATE_SECONDS.observe(perf_counter() - started)
+                
+            if game.gameState == GMST_ENDED:
+                log.info('Game %d ended.', game.gameID)
+                return None
+            if progressed:
+                return time()
+            return game.getNextWakeTime()
@@ -1,166 +1,146 @@
 import socket
+import sys
 import threading
-import randomstring #generate
-from time import sleep, time
 from games import Games
 from gamestates import *
 from packetsyntax import *
 from clients import Clients
 from client import Client
 from request import Request
+from outbound import OutboundWriter
+from keepalive import KeepaliveService
+from matchmaker import Matchmaker
+from protocol import PROTOCOL_V1, PROTOCOL_VERSIONS
+import metrics
+import profiler
+from metrics import BYTES_IN, countPacketIn
 import re #regular expression for parsing username
 from serversettings import *
+import logging
+import serverlog
 
-milliTime = lambda: int(round(time() * 1000))
+log = logging.getLogger('server')
 
 
 class ThreadedServer(object):
 	clients = None
 	games = None
+	outboundWriter = None
+	keepalive = None
+	matchmaker = None
 	
 	sock = None
 	port = 36936
 	
 	
-	def __init__(self):
+	def __init__(self, games = None):
 		self.clients = Clients()
-		self.games = Games()
+		self.games = games if games is not None else Games()
+		self.outboundWriter = OutboundWriter()
+		self.keepalive = KeepaliveService(self.disconnectClient)
+		self.matchmaker = Matchmaker(self.games)
+		self.games.seatListener = self.matchmaker.seatFreed # Seats freed by players leaving in the middle of a game
+		metrics.CLIENTS_CONNECTED.setFunction(lambda: len(self.clients.clientsByName))
+		metrics.CLIENTS_SEARCHING.setFunction(self.clients.countSearching)
+		metrics.GAMES_ACTIVE.setFunction(lambda: len(self.games.games))
+		metrics.PING_RTT_P50.setFunction(lambda: (self.keepalive.getPercentile(50) or 0) / 1000.0)
+		metrics.PING_RTT_P95.setFunction(lambda: (self.keepalive.getPercentile(95) or 0) / 1000.0)
 		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 		self.sock.bind(('', self.port))
-		print('Port %d: bind successful.' % self.port)
+		log.info('Port %d: bind successful.', self.port)
 
 
 	def listen(self):
-		print('Listening for clients.')
-		threading.Thread(target = self.mainLoop, args = ()).start()
-		self.sock.listen(1)
+		log.info('Listening for clients.')
+		self.outboundWriter.start()
+		self.keepalive.start()
+		self.matchmaker.start()
+		self.sock.listen(LISTEN_BACKLOG)
 		while True:
 			clientSocket, address = self.sock.accept()
-			clientSocket.settimeout(60)
-			clientClass = Client(clientSocket, address, "")
+			clientSocket.settimeout(CLIENT_TIMEOUT_SECONDS)
+			clientClass = Client(clientSocket, address, "", self.outboundWriter)
 
 			threading.Thread(target = self.listenToClient, args = (clientClass,)).start()
 
+
+	def leaveGame(self, clientClass):
+		# Takes the client away from its table and lets the matchmaker give the seat to someone else
+		game = self.games.getGame(clientClass.currentGameID)
+		self.games.playerDisconnect(clientClass)
+		if game is not None:
+			self.matchmaker.seatFreed(game)
 			
-	def mainLoop(self):
-		while True:
-			self.handleMatchmaking()
-			sleep(1)
-
-
-	def handleMatchmaking(self):
-		searchers = self.clients.getAllSearching(GM_HOLDEM)
-		if len(searchers) > 0:
-			print('There is at least one client searching for Texas Hold \'Em!')
-			for client in searchers:
-				client.sendPacket(SX_SEARCH_OPPONENT, SX_OPPONENT_FOUND)
-				client.gameStatus = ST_IN_GAME
-			game = self.games.findGame(GM_HOLDEM)
-			if game is None:
-				threading.Thread(target = self.games.createGame, args = (GM_HOLDEM, searchers)).start()
-			else:
-				game.addPlayers(searchers)
-				
 			
-	def pingClient(self, clientClass):
-		while clientClass.pingThread is not None and not clientClass.isDisconnected():
-			pingData = randomstring.generate()
-			#print 'Sending a ping: %s' % pingData
-			clientClass.lastPingData = pingData.encode('utf-8')
-			if not clientClass.sendPacket(SX_PING, b'', pingData):
-				self.disconnectClient(clientClass)
-				break
-			clientClass.lastPingTime = milliTime()
-			sleep(PING_DELAY_SECONDS)
-				
-
 	def disconnectClient(self, clientClass):
 		if clientClass is not None:
 			clientClass.disconnect()
-			clientClass.pingThread = None
-			self.games.playerDisconnect(clientClass)
+			self.keepalive.removeClient(clientClass)
+			self.leaveGame(clientClass)
 			self.clients.removeClient(clientClass)
 
 
 	def listenToClient(self, clientClass):
-		size = 256
 		while True:
 			try:
-				message = clientClass.clientHandle.recv(size)
-				if message != b'':
+				# Stop reading requests while the client isn't reading what we send to it
+				if not clientClass.waitUntilWritable(CLIENT_TIMEOUT_SECONDS):
+					log.warning('Client %s is not reading its data.', clientClass.name)
+					self.disconnectClient(clientClass)
+					return False
+				received = clientClass.decoder.recvInto(clientClass.clientHandle)
+				if received > 0:
 					# Received a message
-					self.parseMessage(clientClass, message)
-					message = None
-					if clientClass.pingThread is None:
-						clientClass.pingThread = threading.Thread(target = self.pingClient, args = (clientClass,))
-						clientClass.pingThread.start()
+					BYTES_IN.value += received
+					self.parseMessage(clientClass)
+					self.keepalive.addClient(clientClass)
 				else:
-					print('Client %s disconnected.' % clientClass.name)
+					log.info('Client %s disconnected.', clientClass.name)
 					self.disconnectClient(clientClass)
 					return False
 			except Exception as e:
-				print('Client %s disconnected: %s' % (clientClass.name, e))
+				log.info('Client %s disconnected: %s', clientClass.name, e)
 				self.disconnectClient(clientClass)
 				return False
 
 
-	def parseMessage(self, clientClass, message):
-		#print('Parsing a message: %s' % message)
-		while 1:
-			if not message or message == b'': # Finished parsing message
-				#print('Finished parsing message')
+	def parseMessage(self, clientClass, message = None):
+		# Received data is either already in the client's decoder (recv_into) or given as message
+		if message:
+			clientClass.decoder.feed(message)
+			BYTES_IN.value += len(message)
+		for requestType, data in clientClass.decoder.frames():
+			clientClass.currentRequest.requestType = requestType
+			clientClass.currentRequest.requestID += 1
+			clientClass.currentRequest.data = data
+			if self.handleRequest(clientClass) == -1:
 				break
-			
-			firstByte = bytes([message[0]])
-			
-			if firstByte == SX_EOR: # End of a request
-				#print('End of a request.')
-				message = message[1:] # Remove first byte from message
-				if self.handleRequest(clientClass) == -1:
-					break
-				
-			elif clientClass.currentRequest.requestType == '':
-				#print('Got a header: %s' % firstByte)
-				clientClass.currentRequest.requestType = firstByte
-				clientClass.currentRequest.requestID += 1
-				message = message[1:] # Remove first byte from message
-				
-			elif clientClass.currentRequest.requestType != '': # Parse the data
-				if SX_EOR not in message:
-					#print('There is no end in this message')
-					clientClass.currentRequest.data += message
-					#print('Data now: ' + clientClass.currentRequest.data)
-					message = ''
-				else:
-					#print('There is an end in this message')
-					messageSplit = message.split(SX_EOR, 1)
-					messageData = messageSplit[0]
-					restOfTheMessage = messageSplit[1]
-					clientClass.currentRequest.data += messageData
-					message = SX_EOR + restOfTheMessage
-					#print('Data now: ' + clientClass.currentRequest.data)
-					#print('Message now: ' + message)
 					
 
 	def handleRequest(self, clientClass):
-		print('Received: %s: %s' % (clientClass.currentRequest.requestType, clientClass.currentRequest.data))
+		log.debug('Received: %s: %s', clientClass.currentRequest.requestType, clientClass.currentRequest.data)
 		if clientClass.currentRequest.requestID == clientClass.lastHandledRequestID:
-			print('Error: Request already handled!')
+			log.warning('Error: Request already handled!')
 			return -1
+		countPacketIn(clientClass.currentRequest.requestType, clientClass.currentRequest.data)
 			
 		header = b''
 		data = ''
 		isError = False
+		protocolVersion = None
+		searching = False
 			
 		if clientClass.currentRequest.requestType == SX_HELLO: # A player connected
 			#print('Got a hello!')
 			header = SX_HELLO
+			# The name may be followed by the protocol version the client would like to use (see protocol.py)
+			nameData, separator, versionData = clientClass.currentRequest.data.partition(SX_EOO)
 			
 			try:
-				name = clientClass.currentRequest.data.decode("utf-8")
+				name = nameData.decode("utf-8")
 			except UnicodeDecodeError as e:
-				print('Failed to decode player name: ' + str(e))
+				log.warning('Failed to decode player name: %s', e)
 				data = SX_ERROR_INVALID_USERNAME
 				isError = True
 				pass
@@ -172,11 +152,11 @@ class ThreadedServer(object):
 				parsedName = " ".join(re.findall("[a-zA-Z0-9\u00C0-\u00F6\u00F8-\u01BF\u01C4-\u024F]+", name))
 			
 				if len(name) < NAME_LENGTH_MIN:
-					print('Name %s is too short!' % name)
+					log.warning('Name %s is too short!', name)
 					data = SX_ERROR_USERNAME_TOO_SHORT
 					isError = True
 				elif len(name) > NAME_LENGTH_MAX:
-					print('Name %s is too long!' % name)
+					log.warning('Name %s is too long!', name)
 					data = SX_ERROR_USERNAME_TOO_LONG
 					isError = True
 				else:
@@ -188,6 +168,9 @@ class ThreadedServer(object):
 						if result > 0:
 							#print('Name set for client: %s' % clientClass.name)
 							data = clientClass.name
+							if separator:
+								protocolVersion = self.negotiateProtocol(versionData)
+								data += SXSTR_EOO + str(protocolVersion)
 						elif result == -1:
 							#print('Name %s already exists!' % clientClass.name)
 							data = SX_ERROR_NAME_TAKEN
@@ -197,7 +180,7 @@ class ThreadedServer(object):
 							data = SX_ERROR_ALREADY_CONNECTED
 							isError = True
 					else:
-						print('Name %s is not a valid name!' % name)
+						log.warning('Name %s is not a valid name!', name)
 						data = SX_ERROR_INVALID_USERNAME
 						isError = True
 				
@@ -206,8 +189,7 @@ class ThreadedServer(object):
 			#print('Received a Ping: %s Expected: %s' % (clientClass.currentRequest.data, clientClass.lastPingData))
 			header = SX_PING_RESPONSE
 			
-			if clientClass.lastPingData == clientClass.currentRequest.data:
-				clientClass.ping = milliTime() - clientClass.lastPingTime
+			if self.keepalive.handlePong(clientClass, clientClass.currentRequest.data) is not None:
 				#print('Ping is: %d' % clientClass.ping)
 				data = str(clientClass.ping)
 
@@ -217,13 +199,15 @@ class ThreadedServer(object):
 			
 			if clientClass.currentRequest.data != GM_NONE:
 				if clientClass.gameStatus == ST_IN_GAME or clientClass.gameStatus == ST_PLAYING:
-					print('Client %s is searching for a game (%d) but is already in a game.' % (clientClass.name, clientClass.currentGame))
-					self.games.playerDisconnect(clientClass)
+					log.warning('Client %s is searching for a game (%d) but is already in a game.', clientClass.name, clientClass.currentGame)
+					self.leaveGame(clientClass)
 				clientClass.gameStatus = ST_SEARCHING
 				clientClass.currentGame = ord(clientClass.currentRequest.data)
 				data = SX_NOW_SEARCHING
-				print('Client %s is now searching for a game (%d).' % (clientClass.name, clientClass.currentGame))
-				print('Searchers: %d' % len(self.clients.getAllSearching(GM_HOLDEM)))
+				searching = True
+				log.info('Client %s is now searching for a game (%d).', clientClass.name, clientClass.currentGame)
+				if log.isEnabledFor(logging.DEBUG):
+					log.debug('Searchers: %d', len(self.clients.getAllSearching(GM_HOLDEM)))
 				
 		elif clientClass.currentRequest.requestType == SX_GAME_INFO: # Game data
 			#print('Received a game data')
@@ -233,11 +217,45 @@ class ThreadedServer(object):
 			self.disconnectClient(clientClass)
 			return -1
 			
+		if protocolVersion is not None:
+			# The answer to SX_HELLO was the last frame in the old framing
+			clientClass.protocolVersion = protocolVersion
+			clientClass.decoder.protocolVersion = protocolVersion
+			
+		if searching:
+			# Only after the client has been told it is searching, so SX_OPPONENT_FOUND can't overtake the answer
+			self.matchmaker.addSearcher(clientClass)
+			
 		clientClass.lastHandledRequestID = clientClass.currentRequest.requestID
 		clientClass.currentRequest.reset()
 		return 1
+		
+		
+	def negotiateProtocol(self, versionData):
+		# The highest protocol version both the client and the server speak
+		try:
+			requested = int(versionData)
+		except ValueError:
+			return PROTOCOL_V1
+		return max([v for v in PROTOCOL_VERSIONS if v <= min(requested, PROTOCOL_VERSION_MAX)] + [PROTOCOL_V1])
 
 
 
 if __name__ == "__main__":
-	ThreadedServer().listen()
\ No newline at end of file
+	serverlog.setupLogging()
+	# Host the tables in worker processes: "python server.py --workers N" or SHARD_WORKERS in serversettings
+	workers = SHARD_WORKERS
+	if '--workers' in sys.argv:
+		workers = int(sys.argv[sys.argv.index('--workers') + 1])
+	games = None
+	if workers > 0:
+		from sharding import ShardedGames
+		games = ShardedGames(workers)
+	metrics.startMetricsServer()
+	profiler.installSignalHandler()
+	# Select the network core at startup: "python server.py --async" or SERVER_MODE in serversettings
+	if '--async' in sys.argv or SERVER_MODE == 'async':
+		from asyncserver import AsyncServer
+		AsyncServer(games).listen()
+	else:
+		ThreadedServer(games).listen()
\ No newline at end of file
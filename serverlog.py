@@ -0,0 +1,39 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+from serversettings import *
+
+listener = None
+
+
+def setupLogging(level = LOG_LEVEL, levels = LOG_LEVELS, stream = sys.stdout):
+    # Log records are put in a queue by the calling thread and written to the stream by a
+    # QueueListener thread, so game and network threads never wait on log I/O.
+    # Disabled messages are dropped before their arguments are formatted.
+    global listener
+    if listener is not None:
+        return
+    
+    logQueue = queue.SimpleQueue()
+    streamHandler = logging.StreamHandler(stream)
+    streamHandler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(logQueue, streamHandler, respect_handler_level = True)
+    
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(logQueue)]
+    root.setLevel(level)
+    for name, moduleLevel in levels.items():
+        logging.getLogger(name).setLevel(moduleLevel)
+        
+    listener.start()
+    atexit.register(stopLogging)
+    
+    
+def stopLogging():
+    # Writes out the queued records and stops the listener thread
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
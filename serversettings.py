@@ -1,4 +1,50 @@
 NAME_LENGTH_MIN = 3
 NAME_LENGTH_MAX = 10
 CHAT_MESSAGE_MAX_LENGTH = 120
-PING_DELAY_SECONDS = 5
\ No newline at end of file
+PING_DELAY_SECONDS = 5
+SERVER_MODE = 'threaded' # 'threaded' (one thread per client) or 'async' (single asyncio event loop)
+LISTEN_BACKLOG = 1024
+CLIENT_TIMEOUT_SECONDS = 60
+
+RECEIVE_BUFFER_SIZE = 4096
+MAX_FRAME_SIZE = 65536 # Clients sending longer requests than this are disconnected
+PROTOCOL_VERSION_MAX = 2 # Highest protocol version clients can ask for in SX_HELLO, see protocol.py
+
+OUTBOUND_HIGH_WATERMARK = 65536 # Stop reading requests from a client once this much data is waiting to be sent to it
+OUTBOUND_LOW_WATERMARK = 16384 # ...and continue once it has been flushed down to this
+OUTBOUND_BUFFER_MAX = 1048576 # Clients with more unsent data than this are disconnected
+
+LOG_LEVEL = 'INFO'
+LOG_LEVELS = {} # Per-module log levels, e.g. {'game': 'DEBUG', 'client': 'WARNING'}
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+SCHEDULER_WORKERS = 4 # Threads updating the game tables
+HOLDEM_SEATS = 2 # Seats at a Texas Hold 'Em table, 2 - 10
+
+KEEPALIVE_TICK_SECONDS = 0.5 # Pings are sent in batches this often
+PING_TIMEOUT_SECONDS = 20 # Clients that haven't answered a ping in this time are disconnected
+PING_AVERAGE_WEIGHT = 0.2 # Weight of the newest round trip time in a client's moving average
+PING_SAMPLES = 1024 # Round trip times kept for the percentiles
+SHARD_WORKERS = 0 # Worker processes hosting the tables (python server.py --workers N); 0 keeps every table in the server process
+
+HAND_HISTORY_DIRECTORY = 'handhistory' # Where finished hands are recorded, None to not record them
+HAND_HISTORY_SEGMENT_BYTES = 64 * 1024 * 1024 # A new segment file is started when the current one would grow past this
+HAND_HISTORY_FSYNC_SECONDS = 1 # How often written hands are forced to disk
+HAND_HISTORY_BATCH = 256 # Most hands written with a single write
+
+METRICS_ADDRESS = '127.0.0.1' # Where the metrics are served over HTTP, see metrics.py
+METRICS_PORT = 36937 # None to not serve them
+
+PROFILE_SECONDS = 30 # Length of a profile started with SIGUSR2, see profiler.py
+PROFILE_SECONDS_MAX = 300 # Longest profile that can be asked for over HTTP
+PROFILE_INTERVAL_SECONDS = 0.01 # Time between two samples of every thread's stack
+PROFILE_DIRECTORY = 'profiles' # Where profiles started with SIGUSR2 are written
+
+MATCHMAKING_MIN_PLAYERS = 2 # A new table is only opened for at least this many searchers
+MATCHMAKING_PING_BUCKETS_MS = () # Upper bounds of the ping buckets searchers are matched within, e.g. (80, 200); () for any ping
+MATCHMAKING_PING_WAIT_SECONDS = 3 # After this long searching a client is matched regardless of its ping
+
+TABLE_POOL_MIN = 4 # Spare tables kept ready at least, see tablepool.py
+TABLE_POOL_MAX = 256 # ...and at most
+TABLE_POOL_WINDOW_SECONDS = 60 # As many spare tables are kept as were opened in this time
+PLAYER_POOL_MAX = 2048 # Players of closed tables kept for reuse
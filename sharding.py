@@ -0,0 +1,432 @@
+import multiprocessing
+import threading
+from games import Games
+from gamestates import *
+from packetsyntax import *
+from client import buildPacket
+from protocol import PROTOCOL_V1, encodeGameData
+import serverlog
+from serversettings import *
+import logging
+
+log = logging.getLogger('sharding')
+
+# Tables can live in worker processes so that they aren't limited to the server process' core.
+# The server process keeps accepting connections, handling SX_HELLO, pings and matchmaking,
+# and routes each client's game data over a pipe to the worker that owns the client's table.
+# The worker sends back the packets for the clients and any changes to their game status.
+#
+# Server -> worker: ('create', gameID, gameType), ('join', gameID, [(clientID, name, protocolVersion), ...]),
+#                   ('data', clientID, data), ('disconnect', clientID)
+# Worker -> server: a list of ('send', clientID, packet), ('status', clientID, currentGameID, currentGame, gameStatus),
+#                   ('occupancy', gameID, [names of the sitting players]), ('closed', gameID)
+
+
+class WorkerOutbox(object):
+    # Collects everything a worker has to tell the server process and sends it in batches from
+    # a single thread, so a broadcast to a table costs one pipe write instead of one per player.
+    conn = None
+    events = None
+    condition = None
+
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.events = []
+        self.condition = threading.Condition()
+
+
+    def start(self):
+        threading.Thread(target = self.run, args = (), name = 'WorkerOutbox', daemon = True).start()
+
+
+    def put(self, event):
+        with self.condition:
+            self.events.append(event)
+            if len(self.events) == 1:
+                self.condition.notify()
+
+
+    def run(self):
+        while True:
+            with self.condition:
+                while len(self.events) == 0:
+                    self.condition.wait()
+                events = self.events
+                self.events = []
+            try:
+                self.conn.send(events)
+            except (OSError, EOFError):
+                log.error('Lost the connection to the server process.')
+                return
+
+
+class RemoteClient(object):
+    # Stands in for a Client inside a worker process. Game status changes are reported back to the
+    # server process, where the real Client lives.
+    clientID = -1
+    name = ''
+    protocolVersion = PROTOCOL_V1
+    outbox = None
+    disconnected = False
+    currentGameID = -1
+    _currentGame = GM_NONE
+    _gameStatus = ST_IDLE
+
+
+    def __init__(self, clientID, name, protocolVersion, outbox):
+        self.clientID = clientID
+        self.name = name
+        self.protocolVersion = protocolVersion
+        self.outbox = outbox
+
+
+    @property
+    def gameStatus(self):
+        return self._gameStatus
+
+
+    @gameStatus.setter
+    def gameStatus(self, gameStatus):
+        self._gameStatus = gameStatus
+        self.reportStatus()
+
+
+    @property
+    def currentGame(self):
+        return self._currentGame
+
+
+    @currentGame.setter
+    def currentGame(self, currentGame):
+        self._currentGame = currentGame
+        self.reportStatus()
+
+
+    def reportStatus(self):
+        if not self.disconnected:
+            self.outbox.put(('status', self.clientID, self.currentGameID, self._currentGame, self._gameStatus))
+
+
+    def sendPacket(self, headerByte1, headerByte2 = b'', dataString = ''):
+        packet = buildPacket(headerByte1, headerByte2, dataString, self.protocolVersion)
+        if packet is None:
+            return False
+        return self.sendRawPacket(packet)
+
+
+    def sendRawPacket(self, packet):
+        if self.disconnected:
+            return False
+        self.outbox.put(('send', self.clientID, packet))
+        return True
+
+
+    def isDisconnected(self):
+        return self.disconnected
+
+
+class WorkerGames(Games):
+    # The tables of one worker process
+    outbox = None
+
+
+    def __init__(self, outbox, workerNumber):
+        Games.__init__(self, 'worker%d' % workerNumber)
+        self.outbox = outbox
+
+
+    def createGame(self, gameType, playerClients, gameID = None):
+        game = Games.createGame(self, gameType, [], gameID)
+        game.occupancyListener = self.updateOccupancy
+        self.joinGame(game, playerClients)
+        return game
+
+
+    def announceSeats(self, playerClients):
+        pass # The server process has told them
+
+
+    def updateOccupancy(self, game):
+        # Called by the game whenever a player sits down or leaves the table
+        self.outbox.put(('occupancy', game.gameID, [p.getName() for p in game.players]))
+
+
+    def closeGame(self, game):
+        Games.closeGame(self, game)
+        self.outbox.put(('closed', game.gameID))
+
+
+def runWorker(conn, workerNumber):
+    # Entry point of a worker process
+    serverlog.setupLogging()
+    log.info('Worker %d started.', workerNumber)
+    outbox = WorkerOutbox(conn)
+    outbox.start()
+    games = WorkerGames(outbox, workerNumber)
+    remoteClients = {} # clientID -> RemoteClient
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            log.info('Worker %d: the server process has gone away.', workerNumber)
+            return
+
+        try:
+            handleServerMessage(message, games, remoteClients, outbox, workerNumber)
+        except Exception:
+            # A bad request from one client must not take down every table of the worker
+            log.exception('Worker %d failed to handle a %s message.', workerNumber, message[0])
+
+
+def handleServerMessage(message, games, remoteClients, outbox, workerNumber):
+    action = message[0]
+    if action == 'data':
+        remoteClient = remoteClients.get(message[1])
+        if remoteClient is not None:
+            games.deliverGameData(remoteClient.currentGameID, remoteClient, message[2])
+
+    elif action == 'join':
+        game = games.getGame(message[1])
+        joining = []
+        for clientID, name, protocolVersion in message[2]:
+            remoteClient = RemoteClient(clientID, name, protocolVersion, outbox)
+            remoteClients[clientID] = remoteClient
+            joining.append(remoteClient)
+        if game is None or not games.joinGame(game, joining):
+            log.warning('Worker %d: clients joined game %d which no longer exists.', workerNumber, message[1])
+            for remoteClient in joining:
+                # As if the table had closed right after they joined it
+                sendBackToMenu(remoteClient)
+
+    elif action == 'disconnect':
+        remoteClient = remoteClients.pop(message[1], None)
+        if remoteClient is not None:
+            games.playerDisconnect(remoteClient)
+            remoteClient.disconnected = True
+
+    elif action == 'create':
+        games.createGame(message[2], [], message[1])
+
+
+def sendBackToMenu(client):
+    # Tells a client whose table is gone that there aren't enough players and resets its game status
+    client.sendPacket(SX_GAME_INFO, SX_GAME_NOT_ENOUGH_PLAYERS, encodeGameData(SX_GAME_NOT_ENOUGH_PLAYERS, (), client.protocolVersion))
+    client.currentGameID = -1
+    client.currentGame = GM_NONE
+    client.gameStatus = ST_IDLE
+
+
+class GameProxy(object):
+    # The server process' view of a table hosted by a worker
+    gameID = -1
+    gameType = GM_NONE
+    maxPlayers = 2
+    players = [] # Names of the players sitting at the table, as last reported by the worker
+    numOfClients = 0 # Clients sent to the table that haven't disconnected
+    worker = None
+
+
+    def __init__(self, gameID, gameType, maxPlayers, worker):
+        self.gameID = gameID
+        self.gameType = gameType
+        self.maxPlayers = maxPlayers
+        self.players = []
+        self.worker = worker
+
+
+class WorkerHandle(object):
+    # The server process' end of a worker process
+    number = 0
+    process = None
+    conn = None
+    sendLock = None
+    numOfGames = 0
+    alive = True # False once the worker has stopped; no tables are placed on it any more
+
+
+    def __init__(self, number, context):
+        self.number = number
+        self.conn, workerConn = context.Pipe()
+        self.sendLock = threading.Lock()
+        self.process = context.Process(target = runWorker, args = (workerConn, number), name = 'GameWorker-%d' % number, daemon = True)
+
+
+    def send(self, message):
+        # Returns False if the worker has stopped
+        if not self.alive:
+            return False
+        try:
+            with self.sendLock:
+                self.conn.send(message)
+        except (OSError, EOFError, ValueError) as e:
+            log.error('Failed to send to game worker %d: %s', self.number, e)
+            return False
+        return True
+
+
+class ShardedGames(Games):
+    # Drop-in replacement for Games that hosts the tables in worker processes.
+    # The seats taken at each table are counted here when clients are sent to it, so the
+    # Matchmaker never has to wait for a worker to report them.
+    workers = None
+    clientIDs = None # Client -> clientID while the client is at a table
+    clientsByID = None # clientID -> Client
+    clientGames = None # clientID -> ID of the game the client joined
+    nextClientID = 0
+
+
+    def __init__(self, numOfWorkers = SHARD_WORKERS):
+        # Games.__init__ would start a GameScheduler, but no table runs in this process
+        self.games = {}
+        self.lock = threading.RLock()
+        self.clientIDs = {}
+        self.clientsByID = {}
+        self.clientGames = {}
+        context = multiprocessing.get_context('spawn') # Forking a process with running threads isn't safe
+        self.workers = [WorkerHandle(i, context) for i in range(numOfWorkers)]
+        for worker in self.workers:
+            worker.process.start()
+            threading.Thread(target = self.listenToWorker, args = (worker,), name = 'WorkerListener-%d' % worker.number, daemon = True).start()
+        log.info('Started %d game worker processes.', numOfWorkers)
+
+
+    def createGame(self, gameType, playerClients, gameID = None):
+        # Returns None if every worker has stopped; the clients are then sent back to the menu
+        log.info('Creating a new game.')
+        with self.lock:
+            workers = [w for w in self.workers if w.alive]
+            if len(workers) == 0:
+                log.error('No game worker is running, can\'t create a game.')
+                self.resetClients(playerClients)
+                return None
+            gameID = self.nextGameID
+            self.nextGameID += 1
+            worker = min(workers, key = lambda w: w.numOfGames)
+            worker.numOfGames += 1
+            game = GameProxy(gameID, gameType, self.getMaxPlayers(gameType), worker)
+            self.games[gameID] = game
+        self.sendToWorker(worker, ('create', gameID, gameType))
+        self.joinGame(game, playerClients)
+        return game
+
+
+    def joinGame(self, game, playerClients):
+        joining = []
+        with self.lock:
+            if self.games.get(game.gameID) is not game:
+                return False
+            self.announceSeats(playerClients)
+            for c in playerClients:
+                clientID = self.nextClientID
+                self.nextClientID += 1
+                self.clientIDs[c] = clientID
+                self.clientsByID[clientID] = c
+                self.clientGames[clientID] = game.gameID
+                c.currentGameID = game.gameID
+                joining.append((clientID, c.name, c.protocolVersion))
+            game.numOfClients += len(joining)
+        self.sendToWorker(game.worker, ('join', game.gameID, joining))
+        return True
+
+
+    def deliverGameData(self, gameID, clientClass, data):
+        game = self.getGame(gameID)
+        clientID = self.clientIDs.get(clientClass)
+        if game is not None and clientID is not None:
+            self.sendToWorker(game.worker, ('data', clientID, data))
+
+
+    def freeSeats(self, game):
+        return game.maxPlayers - game.numOfClients
+
+
+    def closeGame(self, game):
+        with self.lock:
+            if self.games.pop(game.gameID, None) is not None:
+                game.worker.numOfGames -= 1
+
+
+    def playerDisconnect(self, clientClass):
+        with self.lock:
+            clientID = self.clientIDs.pop(clientClass, None)
+            if clientID is None:
+                return
+            del self.clientsByID[clientID]
+            game = self.games.get(self.clientGames.pop(clientID, None))
+            if game is not None:
+                game.numOfClients -= 1
+        if game is not None:
+            self.sendToWorker(game.worker, ('disconnect', clientID))
+
+
+    def sendToWorker(self, worker, message):
+        if not worker.send(message):
+            self.workerStopped(worker)
+
+
+    def workerStopped(self, worker):
+        # Forgets the worker's tables and sends their clients back to the menu
+        with self.lock:
+            if not worker.alive:
+                return
+            worker.alive = False
+            lostGames = [gameID for gameID, game in self.games.items() if game.worker is worker]
+            for gameID in lostGames:
+                del self.games[gameID]
+            worker.numOfGames = 0
+            lostClients = [self.clientsByID[i] for i, gameID in self.clientGames.items() if gameID in lostGames]
+            for c in lostClients:
+                clientID = self.clientIDs.pop(c)
+                del self.clientsByID[clientID]
+                del self.clientGames[clientID]
+        log.error('Game worker %d has stopped; lost %d games and %d clients.', worker.number, len(lostGames), len(lostClients))
+        self.resetClients(lostClients)
+
+
+    def resetClients(self, clients):
+        for c in clients:
+            sendBackToMenu(c)
+
+
+    def listenToWorker(self, worker):
+        while True:
+            try:
+                events = worker.conn.recv()
+            except (EOFError, OSError):
+                self.workerStopped(worker)
+                return
+            for event in events:
+                self.handleWorkerEvent(event)
+
+
+    def handleWorkerEvent(self, event):
+        action = event[0]
+        if action == 'send':
+            clientClass = self.clientsByID.get(event[1])
+            if clientClass is not None and not clientClass.sendRawPacket(event[2]):
+                log.warning('Failed to send a packet to player %s.', clientClass.name)
+                self.playerDisconnect(clientClass)
+
+        elif action == 'status':
+            clientClass = self.clientsByID.get(event[1])
+            if clientClass is not None:
+                # Changes made by the table before the client left it are ignored (the client ID is gone)
+                clientClass.currentGameID = event[2]
+                clientClass.currentGame = event[3]
+                clientClass.gameStatus = event[4]
+
+        elif action == 'occupancy':
+            game = self.getGame(event[1])
+            if game is not None:
+                game.players = event[2]
+
+        elif action == 'closed':
+            game = self.getGame(event[1])
+            if game is not None:
+                self.closeGame(game)
+                with self.lock:
+                    for clientID in [i for i, gameID in self.clientGames.items() if gameID == game.gameID]:
+                        del self.clientGames[clientID]
+                        del self.clientIDs[self.clientsByID.pop(clientID)]
@@ -1,8 +1,5 @@
 class SidePot(object):
-    potNumber = 0
-    potPerPlayer = 0
-    totalPot = 0
-    playersInPot = []
+    __slots__ = ('potNumber', 'potPerPlayer', 'totalPot', 'playersInPot')
     
     def __init__(self, potNumber, potPerPlayer, totalPot, playersInPot):
         self.potNumber = potNumber
@@ -0,0 +1,304 @@
+# Runs TexasHoldEmGame headless: no sockets, no threads and no waiting for real time to pass.
+# The game gets a simulated clock that jumps straight to the next timer, a seeded RNG and
+# in-memory clients played by a strategy, so hands run as fast as the CPU allows.
+# Recorded hands (see handhistory.py) can be replayed and their payouts checked.
+# Examples:
+#   python simulation.py --hands 100000 --players 6 --seed 1
+#   python simulation.py --replay handhistory
+import argparse
+import random
+from time import perf_counter
+from game import TexasHoldEmGame
+from gamestates import *
+from packetsyntax import *
+from protocol import PROTOCOL_V1
+from serversettings import *
+import logging
+
+log = logging.getLogger('simulation')
+
+
+class SimClock(object):
+    # Stands in for time(); only moves when advanced
+    now = 0.0
+
+
+    def __init__(self, start = 1000000.0):
+        self.now = start
+
+
+    def __call__(self):
+        return self.now
+
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class StackedRandom(random.Random):
+    # A seeded RNG whose next shuffle can put chosen cards on top of the deck, in order
+    stack = None
+
+
+    def stackNextShuffle(self, cardValues):
+        self.stack = list(cardValues)
+
+
+    def shuffle(self, deck):
+        random.Random.shuffle(self, deck)
+        if self.stack:
+            order = dict((value, position) for position, value in enumerate(self.stack))
+            deck.sort(key = lambda c: order.get(int(c), len(order)))
+            self.stack = None
+
+
+class SimClient(object):
+    # In-memory stand-in for client.Client. Packets from the game are not framed or sent
+    # anywhere; the client only notices when it is its turn and when it has to sit down again.
+    name = ''
+    protocolVersion = PROTOCOL_V1
+    disconnected = False
+    currentGame = GM_NONE
+    currentGameID = -1
+    gameStatus = ST_IDLE
+    strategy = None # Called with the client and the game when it is the client's turn, returns the game data to send
+    pending = None # Game data waiting to be delivered to the game
+    packets = 0
+    keepPackets = False
+    received = None
+
+
+    def __init__(self, name, strategy, keepPackets = False):
+        self.name = name
+        self.strategy = strategy
+        self.pending = []
+        self.keepPackets = keepPackets
+        self.received = []
+        self.turnPrefix = SX_GAME_INFO + SX_GAME_PLAYER_TURN + name.encode('utf-8') + SX_EOO
+        self.sitOutPacket = SX_GAME_INFO + SX_GAME_PLAYER_SIT_OUT + name.encode('utf-8') + SX_EOR
+
+
+    def sendRawPacket(self, packet):
+        self.packets += 1
+        if self.keepPackets:
+            self.received.append(packet)
+        if packet.startswith(self.turnPrefix):
+            self.pending.append(None) # Decided when delivered, the game may still change before that
+        elif packet == self.sitOutPacket:
+            self.pending.append(SX_GAME_READY_TO_START)
+        return True
+
+
+    def sendPacket(self, headerByte1, headerByte2 = b'', dataString = ''):
+        return True
+
+
+    def isDisconnected(self):
+        return self.disconnected
+
+
+def callStrategy(client, game):
+    return SX_GAME_BET + b'0'
+
+
+def makeRandomStrategy(rng, foldChance = 0.15, raiseChance = 0.15):
+    def randomStrategy(client, game):
+        roll = rng.random()
+        if roll < foldChance:
+            return SX_GAME_FOLD
+        if roll < foldChance + raiseChance:
+            return SX_GAME_BET + str(game.bigBlindAmount * rng.randint(1, 4)).encode('utf-8')
+        return SX_GAME_BET + b'0'
+    return randomStrategy
+
+
+class Simulation(object):
+    # Drives a single table. Every step updates the game, delivers whatever the clients decided
+    # to do, and when nobody has anything to do jumps the clock to the game's next timer.
+    clock = None
+    rng = None
+    game = None
+    clients = None
+    handsPlayed = 0
+    actions = 0
+    chipsAdded = 0 # Chips given to players who sat down again without any
+    chipsLost = 0 # Chips that no player got back, e.g. the odd chips of a split pot
+
+
+    def __init__(self, numOfPlayers = 2, seed = 0, strategy = None, keepPackets = False):
+        self.clock = SimClock()
+        self.rng = StackedRandom(seed)
+        self.game = TexasHoldEmGame(0, self.clock, self.rng, max(HOLDEM_SEATS, numOfPlayers))
+        self.clients = []
+        strategy = strategy if strategy is not None else makeRandomStrategy(random.Random(seed))
+        for i in range(numOfPlayers):
+            self.addClient(SimClient('sim%d' % i, strategy, keepPackets))
+        # A table that has been playing for a while: nobody waits for the big blind
+        for p in self.game.players:
+            p.waitForBigBlind = False
+
+
+    def addClient(self, client):
+        self.clients.append(client)
+        self.game.addPlayer(client)
+        self.game.handleData(client, SX_GAME_READY_TO_START)
+
+
+    def getTotalChips(self):
+        return sum(p.chips + p.totalBet for p in self.game.getAllPlayers()) + self.game.pot - sum(p.totalBet for p in self.game.players)
+
+
+    def deliver(self):
+        # Returns True if any client sent something to the game
+        delivered = False
+        for client in self.clients:
+            while client.pending:
+                data = client.pending.pop(0)
+                if data is None:
+                    if self.game.currentPlayerTurn is None or self.game.currentPlayerTurn.clientClass is not client:
+                        continue
+                    data = client.strategy(client, self.game)
+                    if data is None:
+                        continue # Let the fold timer run out
+                    self.actions += 1
+                elif data == SX_GAME_READY_TO_START:
+                    player = self.game.findPlayer(client)
+                    if player is not None and player.chips == 0:
+                        self.chipsAdded += 100
+                self.game.handleData(client, data)
+                delivered = True
+        return delivered
+
+
+    def step(self):
+        progressed = self.game.update()
+        if self.deliver() or progressed:
+            return
+        wakeTime = self.game.getNextWakeTime()
+        if wakeTime is None:
+            raise RuntimeError('The table is stuck in state %d.' % self.game.gameState)
+        self.clock.advance(wakeTime - self.clock.now)
+
+
+    def run(self, hands):
+        # Plays hands and returns statistics about them
+        startChips = self.getTotalChips()
+        started = perf_counter()
+        target = self.game.handNumber + hands
+        while self.game.handNumber < target or self.game.gameState != GMST_HAND_ENDED:
+            self.step()
+        elapsed = perf_counter() - started
+        self.handsPlayed += hands
+        self.chipsLost = startChips + self.chipsAdded - self.getTotalChips()
+        return {
+            'hands': hands,
+            'seconds': round(elapsed, 3),
+            'handsPerSecond': round(hands / elapsed, 1) if elapsed > 0 else None,
+            'actions': self.actions,
+            'simulatedSeconds': round(self.clock.now - SimClock().now, 1),
+            'chipsAdded': self.chipsAdded,
+            'chipsLost': self.chipsLost,
+        }
+
+
+def replayHand(record):
+    # Plays a recorded hand again with the same cards and actions.
+    # Returns the list of differences between the recorded and the replayed payouts (empty if none).
+    seats = record.seats # In the order the cards were dealt
+    actions = [a for a in record.actions if a[0] != SX_GAME_BLINDS[0]]
+    blindChairs = [a[1] for a in record.actions if a[0] == SX_GAME_BLINDS[0]]
+    clientsByChair = {}
+
+    def scriptedStrategy(client, game):
+        if len(actions) == 0:
+            return None
+        action, chair, street, requested, chips = actions[0]
+        if clientsByChair.get(chair) is not client:
+            return None
+        actions.pop(0)
+        if action == SX_GAME_FOLD[0]:
+            return SX_GAME_FOLD
+        if record.formatVersion == 1:
+            # Version 1 only recorded the chips taken; taking no more than the bet to call was a check or a call
+            player = game.findPlayer(client)
+            if requested <= game.roundMinBet - player.totalBet:
+                requested = 0
+        return SX_GAME_BET + str(requested).encode('utf-8')
+
+    simulation = Simulation(0, 0, scriptedStrategy)
+    game = simulation.game
+    game.setMaxPlayers(max([game.maxPlayers] + [seat[0] + 1 for seat in seats]))
+    game.smallBlindAmount = game.defaultSmallBlind = record.smallBlind
+    playersByChair = {}
+    for chair, name, chips, cards in seats:
+        client = SimClient(name, scriptedStrategy)
+        simulation.addClient(client)
+        clientsByChair[chair] = client
+        player = game.findPlayer(client)
+        game.moveToChair(player, chair)
+        player.chips = chips
+        # Players who joined the table since the last hand post a big blind as well
+        player.waitForBigBlind = chair in blindChairs and chair not in (record.smallBlindChair, record.bigBlindChair)
+        playersByChair[chair] = player
+
+    def placeButtons():
+        # The buttons go where they were, whatever moveButtons() would do on a new table
+        game.dealerPlayer = playersByChair.get(record.dealerChair, game.players[0])
+        game.smallBlindPlayer = playersByChair.get(record.smallBlindChair, game.dealerPlayer)
+        game.bigBlindPlayer = playersByChair.get(record.bigBlindChair, game.players[-1])
+        game.dealerPlayerChair = game.dealerPlayer.chair
+        game.smallBlindPlayerChair = game.smallBlindPlayer.chair
+        game.bigBlindPlayerChair = game.bigBlindPlayer.chair
+    game.moveButtons = placeButtons
+
+    # Stack the deck the way the cards were dealt: one card to every player, then the second, then the board
+    stack = [seat[3][0] for seat in seats if len(seat[3]) > 0] + [seat[3][1] for seat in seats if len(seat[3]) > 1] + list(record.board)
+    simulation.rng.stackNextShuffle(stack)
+    simulation.run(1)
+
+    # Every player ends with the chips they started with, less what they bet, plus what they won
+    startChips = dict((seat[1], seat[2]) for seat in seats)
+    winnings = dict((seat[1], 0) for seat in seats)
+    for chair, chips in record.payouts:
+        winnings[clientsByChair[chair].name] += chips
+    differences = []
+    for p in simulation.game.getAllPlayers():
+        expected = startChips[p.getName()] - p.totalBet + winnings[p.getName()]
+        if p.chips != expected:
+            differences.append('%s ends with %d chips instead of %d' % (p.getName(), p.chips, expected))
+    if actions:
+        differences.append('%d recorded actions were not played' % len(actions))
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Simulate or replay Texas Hold \'Em hands without real time passing.')
+    parser.add_argument('--hands', type = int, default = 10000)
+    parser.add_argument('--players', type = int, default = 2)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--strategy', choices = ('call', 'random'), default = 'random')
+    parser.add_argument('--replay', metavar = 'DIRECTORY', help = 'replay every hand recorded in a hand history directory')
+    options = parser.parse_args()
+
+    if options.replay is not None:
+        from handhistory import listSegments, readSegment
+        hands = 0
+        mismatches = 0
+        for path in listSegments(options.replay):
+            for record in readSegment(path):
+                hands += 1
+                differences = replayHand(record)
+                if differences:
+                    mismatches += 1
+                    print('Game %d hand %d: %s' % (record.gameID, record.handNumber, '; '.join(differences)))
+        print('Replayed %d hands, %d did not pay out as recorded.' % (hands, mismatches))
+        return
+
+    strategy = callStrategy if options.strategy == 'call' else makeRandomStrategy(random.Random(options.seed))
+    results = Simulation(options.players, options.seed, strategy).run(options.hands)
+    for key, value in results.items():
+        print('%-18s %s' % (key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import collections
+import threading
+from time import time
+from pokerplayer import PokerPlayer
+from serversettings import *
+import logging
+
+log = logging.getLogger('tablepool')
+
+
+class PlayerPool(object):
+    # PokerPlayers of closed tables, handed out again to the clients joining tables
+    players = None
+    maxSize = PLAYER_POOL_MAX
+    lock = None
+
+
+    def __init__(self, maxSize = PLAYER_POOL_MAX):
+        self.players = []
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+
+
+    def acquire(self, clientClass):
+        with self.lock:
+            player = self.players.pop() if self.players else None
+        if player is None:
+            return PokerPlayer(clientClass)
+        player.join(clientClass)
+        return player
+
+
+    def release(self, players):
+        with self.lock:
+            room = self.maxSize - len(self.players)
+            for player in players[:max(0, room)]:
+                player.clientClass = None # Don't keep the disconnected client alive
+                self.players.append(player)
+
+
+class TablePool(object):
+    # Tables ready to be handed out without building them. Closed tables are reset and put back
+    # once the scheduler has let go of them (see Games.recycleGame).
+    #
+    # The pool keeps as many spare tables as were opened in the last TABLE_POOL_WINDOW_SECONDS,
+    # between TABLE_POOL_MIN and TABLE_POOL_MAX. Whenever a table is taken and the pool has fallen
+    # below that, a thread builds the missing tables, so the clients being seated never wait for it.
+    factory = None # Builds a new table, given its game ID
+    tables = None
+    created = None # When each table opened in the last TABLE_POOL_WINDOW_SECONDS was handed out
+    lock = None
+    warmEvent = None
+    clock = None
+
+
+    def __init__(self, factory, clock = time):
+        self.factory = factory
+        self.tables = []
+        self.created = collections.deque()
+        self.lock = threading.Lock()
+        self.warmEvent = threading.Event()
+        self.clock = clock
+
+
+    def start(self):
+        threading.Thread(target = self.warm, args = (), name = 'TablePoolWarmer', daemon = True).start()
+        self.warmEvent.set()
+
+
+    def getTargetSize(self):
+        # Must be called with the lock held
+        expired = self.clock() - TABLE_POOL_WINDOW_SECONDS
+        while self.created and self.created[0] < expired:
+            self.created.popleft()
+        return max(TABLE_POOL_MIN, min(TABLE_POOL_MAX, len(self.created)))
+
+
+    def acquire(self, gameID):
+        with self.lock:
+            self.created.append(self.clock())
+            table = self.tables.pop() if self.tables else None
+            if len(self.tables) < self.getTargetSize():
+                self.warmEvent.set()
+        if table is None:
+            return self.factory(gameID)
+        table.gameID = gameID
+        log.info('Reusing a table for the game with ID: %d', gameID)
+        return table
+
+
+    def release(self, table):
+        # table must have been reset
+        with self.lock:
+            if len(self.tables) < self.getTargetSize():
+                self.tables.append(table)
+
+
+    def size(self):
+        return len(self.tables)
+
+
+    def warm(self):
+        while True:
+            self.warmEvent.wait()
+            self.warmEvent.clear()
+            while True:
+                with self.lock:
+                    missing = self.getTargetSize() - len(self.tables)
+                if missing <= 0:
+                    break
+                table = self.factory(-1)
+                with self.lock:
+                    self.tables.append(table)
@@ -0,0 +1,91 @@
+# Outbound buffering of a client (client.py): partial sends, the flush scheduler and the buffer limit.
+# Run from the repository root: python -m pytest test_client.py
+import socket
+from client import Client, buildPacket
+from packetsyntax import *
+from serversettings import OUTBOUND_BUFFER_MAX
+
+
+class RecordingScheduler(object):
+    # Stands in for OutboundWriter and remembers which clients asked for a flush
+    def __init__(self):
+        self.scheduled = []
+
+
+    def scheduleFlush(self, client):
+        self.scheduled.append(client)
+
+
+def makeClient(flushScheduler = None):
+    serverSide, clientSide = socket.socketpair()
+    serverSide.setblocking(False)
+    clientSide.settimeout(5)
+    return Client(serverSide, ('test', 0), 'test', flushScheduler), clientSide
+
+
+def makePacket(size):
+    # A framed ping of about size bytes
+    return buildPacket(SX_PING, b'', b'x' * size)
+
+
+def receive(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        assert chunk, 'Connection closed after %d of %d bytes' % (len(data), size)
+        data += chunk
+    return bytes(data)
+
+
+def test_partial_inline_flush_is_retried_on_the_next_send():
+    client, peer = makeClient()
+    # Larger than the socket buffers, so the first send only gets part of it out
+    big = makePacket(OUTBOUND_BUFFER_MAX // 2)
+    small = makePacket(10)
+    assert client.sendRawPacket(big)
+    assert 0 < len(client.outBuffer) < len(big)
+    assert not client.flushPending
+
+    sent = big
+    received = bytearray()
+    while client.outBuffer:
+        received += peer.recv(65536)
+        # Nothing else flushes the rest
+        assert client.sendRawPacket(small)
+        sent += small
+    received += receive(peer, len(sent) - len(received))
+    assert bytes(received) == sent
+
+
+def test_scheduler_flushes_once_until_the_buffer_is_empty():
+    scheduler = RecordingScheduler()
+    client, peer = makeClient(scheduler)
+    assert client.sendRawPacket(makePacket(10))
+    assert client.sendRawPacket(makePacket(10))
+    assert scheduler.scheduled == [client]
+
+    assert client.sendRawPacket(makePacket(OUTBOUND_BUFFER_MAX // 2))
+    assert client.flush()
+    # Whatever didn't fit stays pending for the scheduler
+    assert client.outBuffer and client.flushPending
+    assert client.sendRawPacket(makePacket(10))
+    assert scheduler.scheduled == [client]
+    while client.outBuffer:
+        peer.recv(1 << 20)
+        assert client.flush()
+    assert not client.flushPending
+    assert client.sendRawPacket(makePacket(10))
+    assert scheduler.scheduled == [client, client]
+
+
+def test_full_buffer_closes_the_connection():
+    client, peer = makeClient(RecordingScheduler())
+    packet = makePacket(65536)
+    while len(client.outBuffer) + len(packet) <= OUTBOUND_BUFFER_MAX:
+        assert client.sendRawPacket(packet)
+    assert not client.sendRawPacket(packet)
+    assert client.isDisconnected()
+    assert not client.sendRawPacket(makePacket(10))
+    # The thread listening to the client wakes up to an empty read and cleans up after it
+    assert client.decoder.recvInto(client.clientHandle) == 0
+    assert peer.recv(1) == b''
@@ -0,0 +1,82 @@
+# Checks the bitmask evaluator (evaluator.py) against a brute-force reference: every five-card
+# subset of a hand is ranked the plain way and the best one is kept.
+# Run from the repository root: python -m pytest test_evaluator.py
+import itertools
+import random
+from evaluator import *
+
+HANDS = 20000
+
+
+def referenceFiveCards(values):
+    # (category, ranks in order of significance) of exactly five cards
+    ranks = sorted((value % 13 for value in values), reverse = True)
+    counts = dict((rank, ranks.count(rank)) for rank in ranks)
+    # Most of a kind first, then the higher rank
+    grouped = sorted(counts, key = lambda rank: (counts[rank], rank), reverse = True)
+    ordered = [rank for rank in grouped for i in range(counts[rank])]
+    isFlush = len(set(value // 13 for value in values)) == 1
+    straightHigh = -1
+    if len(counts) == 5:
+        if ranks[0] - ranks[4] == 4:
+            straightHigh = ranks[0]
+        elif ranks == [RANK_ACE, 3, 2, 1, 0]:
+            straightHigh = 3 # The ace counts as the lowest card
+
+    if straightHigh >= 0:
+        straight = [straightHigh - i for i in range(4)] + [straightHigh - 4 if straightHigh > 3 else RANK_ACE]
+        return (STRAIGHT_FLUSH if isFlush else STRAIGHT, straight)
+    shape = sorted(counts.values(), reverse = True)
+    if shape[0] == 4:
+        return (FOUR_OF_A_KIND, ordered)
+    if shape[:2] == [3, 2]:
+        return (FULL_HOUSE, ordered)
+    if isFlush:
+        return (FLUSH, ranks)
+    if shape[0] == 3:
+        return (THREE_OF_A_KIND, ordered)
+    if shape[:2] == [2, 2]:
+        return (TWO_PAIRS, ordered)
+    if shape[0] == 2:
+        return (PAIR, ordered)
+    return (HIGH_CARD, ranks)
+
+
+def reference(values):
+    return max(referenceFiveCards(cards) for cards in itertools.combinations(values, 5))
+
+
+def sign(x):
+    return (x > 0) - (x < 0)
+
+
+def test_matches_reference_on_random_hands():
+    rng = random.Random(6)
+    hands = [rng.sample(range(52), 7) for i in range(HANDS)]
+    strengths = [evaluate(hand) for hand in hands]
+    references = [reference(hand) for hand in hands]
+    for hand, strength, expected in zip(hands, strengths, references):
+        assert (getCategory(strength), getRanks(strength)) == expected, hand
+
+    # The order of the hands has to match as well, ties included
+    for i in range(1, HANDS):
+        a = (strengths[i - 1], references[i - 1])
+        b = (strengths[i], references[i])
+        assert sign(a[0] - b[0]) == sign((a[1] > b[1]) - (a[1] < b[1])), (hands[i - 1], hands[i])
+
+
+def test_matches_reference_on_every_category():
+    # Random hands rarely make a straight flush or four of a kind
+    hands = [
+        [12, 11, 10, 9, 8, 20, 33], # Royal flush
+        [12, 0, 1, 2, 3, 25, 40], # Five-high straight flush
+        [5, 18, 31, 44, 0, 13, 26], # Four of a kind and three of a kind
+        [7, 20, 33, 3, 16, 29, 51], # Two threes of a kind make a full house
+        [0, 2, 4, 6, 8, 10, 12], # Seven cards of a suit
+        [12, 13, 27, 41, 3, 50, 9], # Five-high straight with the ace
+        [12, 24, 36, 48, 8, 6, 1], # Ace-high straight
+        [1, 14, 5, 18, 9, 22, 30], # Three pairs
+    ]
+    for hand in hands:
+        strength = evaluate(hand)
+        assert (getCategory(strength), getRanks(strength)) == reference(hand), hand
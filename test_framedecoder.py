@@ -0,0 +1,74 @@
+# Incremental decoding of received requests (framedecoder.py), in both protocol versions.
+# Run from the repository root: python -m pytest test_framedecoder.py
+import pytest
+from framedecoder import FrameDecoder
+from packetsyntax import *
+from protocol import PROTOCOL_V1, PROTOCOL_V2, frame
+
+REQUESTS = [
+    (SX_HELLO, b'name'),
+    (SX_PING_RESPONSE, b''),
+    (SX_GAME_INFO, SX_GAME_BET + b'\x80\x01'),
+    (SX_GAME_INFO, SX_GAME_CHAT_MESSAGE + b'x' * 300), # Longer than the buffer
+]
+
+
+def makeStream(version):
+    return b''.join(frame(requestType + payload, version) for requestType, payload in REQUESTS)
+
+
+def decodeInPieces(stream, version, pieceSize):
+    decoder = FrameDecoder(bufferSize = 64)
+    decoder.protocolVersion = version
+    decoded = []
+    for i in range(0, len(stream), pieceSize):
+        decoder.feed(stream[i:i + pieceSize])
+        decoded.extend(decoder.frames())
+    return decoder, decoded
+
+
+def test_eor_frames_split_across_reads():
+    stream = makeStream(PROTOCOL_V1)
+    for pieceSize in (1, 2, 3, 7, 64, len(stream)):
+        decoder, decoded = decodeInPieces(stream, PROTOCOL_V1, pieceSize)
+        assert decoded == REQUESTS, pieceSize
+        assert decoder.start == decoder.end == 0
+
+
+def test_varint_frames_split_across_reads():
+    stream = makeStream(PROTOCOL_V2)
+    for pieceSize in (1, 2, 3, 7, 64, len(stream)):
+        decoder, decoded = decodeInPieces(stream, PROTOCOL_V2, pieceSize)
+        assert decoded == REQUESTS, pieceSize
+        assert decoder.start == decoder.end == 0
+
+
+def test_empty_requests_are_skipped():
+    for version, empty in ((PROTOCOL_V1, SX_EOR), (PROTOCOL_V2, b'\x00')):
+        decoder = FrameDecoder()
+        decoder.protocolVersion = version
+        decoder.feed(empty + frame(SX_PING + b'1', version) + empty)
+        assert list(decoder.frames()) == [(SX_PING, b'1')]
+
+
+def test_version_changes_between_frames():
+    # As after SX_HELLO: the rest of the data is decoded in the picked version
+    decoder = FrameDecoder()
+    decoder.feed(frame(SX_HELLO + b'name' + SX_EOO + b'2', PROTOCOL_V1) + frame(SX_PING + b'1', PROTOCOL_V2))
+    frames = decoder.frames()
+    assert next(frames) == (SX_HELLO, b'name' + SX_EOO + b'2')
+    decoder.protocolVersion = PROTOCOL_V2
+    assert list(frames) == [(SX_PING, b'1')]
+
+
+def test_too_long_requests_are_refused():
+    decoder = FrameDecoder(bufferSize = 16, maxFrameSize = 64)
+    with pytest.raises(ValueError):
+        decoder.feed(b'x' * 65)
+        list(decoder.frames())
+
+    decoder = FrameDecoder(maxFrameSize = 64)
+    decoder.protocolVersion = PROTOCOL_V2
+    decoder.feed(frame(b'x' * 65, PROTOCOL_V2))
+    with pytest.raises(ValueError):
+        list(decoder.frames())
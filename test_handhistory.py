@@ -0,0 +1,111 @@
+# The binary hand history (handhistory.py): writing hands, reading them back and replaying them.
+# Run from the repository root: python -m pytest test_handhistory.py
+import os
+import random
+import zlib
+import pytest
+from handhistory import *
+from simulation import Simulation, makeRandomStrategy, replayHand
+
+HANDS = 300
+
+
+def makeRecord(handNumber):
+    record = HandRecord(7, handNumber)
+    record.endTime = record.startTime + 12.5
+    record.dealerChair = 2
+    record.smallBlindChair = 2
+    record.bigBlindChair = 0
+    record.smallBlind = 5
+    record.bigBlind = 10
+    record.seats = [(0, 'zéro', 1000, [12, 51]), (2, 'two', 0xFFFFFFFF, [])]
+    record.board = [0, 1, 2, 3, 4]
+    record.actions = [(6, 2, 0, 5, 5), (6, 0, 0, 10, 10), (8, 2, 3, 0, 0)]
+    record.pots = [(25, 10, [0, 2]), (5, 15, [0])]
+    record.payouts = [(0, 30)]
+    return record
+
+
+def fields(record):
+    return (record.gameID, record.handNumber, int(record.startTime * 1000), int(record.endTime * 1000),
+            record.dealerChair, record.smallBlindChair, record.bigBlindChair, record.smallBlind, record.bigBlind,
+            record.seats, record.board, [tuple(a) for a in record.actions], record.pots, [tuple(p) for p in record.payouts])
+
+
+def recordHands(directory, segmentBytes):
+    # Simulated hands at a table of four
+    writer = HandHistoryWriter('test', str(directory))
+    writer.segmentBytes = segmentBytes
+    writer.start()
+    simulation = Simulation(4, 15, makeRandomStrategy(random.Random(15)))
+    simulation.game.handHistory = writer
+    simulation.run(HANDS)
+    writer.stop()
+
+
+def readAll(directory):
+    return [record for path in listSegments(str(directory)) for record in readSegment(path)]
+
+
+def test_record_round_trip():
+    record = makeRecord(1)
+    decoded, end = decodeRecord(record.encode())
+    assert end == len(record.encode())
+    assert decoded.formatVersion == FORMAT_VERSION
+    assert fields(decoded) == fields(record)
+
+
+def test_missing_chairs_are_stored_as_none():
+    record = makeRecord(1)
+    record.dealerChair = -1
+    record.smallBlindChair = None
+    decoded = decodeRecord(record.encode())[0]
+    assert (decoded.dealerChair, decoded.smallBlindChair) == (NONE, NONE)
+
+
+def test_damaged_records_are_refused():
+    encoded = bytearray(makeRecord(1).encode())
+    with pytest.raises(ValueError):
+        decodeRecord(encoded[:-1])
+    encoded[RECORD_HEADER.size + 3] ^= 0xFF
+    with pytest.raises(ValueError):
+        decodeRecord(encoded)
+
+
+def test_version_1_actions_are_read_as_asked_for():
+    record = makeRecord(1)
+    body = record.encode()[RECORD_HEADER.size:]
+    # Swap the version 2 actions for version 1 ones, which don't have the chips asked for
+    start = HAND_HEADER.size + COUNT8.size + sum(SEAT.size + len(seat[1].encode('utf-8')) + 2 for seat in record.seats)
+    start += COUNT8.size + len(record.board) + COUNT16.size
+    end = start + ACTION.size * len(record.actions)
+    actionsV1 = b''.join(ACTION_V1.pack(action, chair, street, chips) for action, chair, street, requested, chips in record.actions)
+    body = body[:start] + actionsV1 + body[end:]
+    decoded = decodeRecord(RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body, 0, 1)[0]
+    assert decoded.formatVersion == 1
+    assert decoded.actions == [(action, chair, street, chips, chips) for action, chair, street, requested, chips in record.actions]
+
+
+def test_writer_keeps_the_order_across_segments(tmp_path):
+    writer = HandHistoryWriter('test', str(tmp_path))
+    writer.segmentBytes = 1000
+    for handNumber in range(50):
+        writer.write([makeRecord(handNumber).encode()]) # One batch at a time, as the thread writes them
+    writer.closeSegment()
+    assert len(listSegments(str(tmp_path))) > 1
+    assert [record.handNumber for record in readAll(tmp_path)] == list(range(50))
+    # A writer started later goes on with a new segment
+    segments = listSegments(str(tmp_path))
+    writer = HandHistoryWriter('test', str(tmp_path))
+    writer.start()
+    writer.record(makeRecord(50))
+    writer.stop()
+    assert listSegments(str(tmp_path)) == segments + [os.path.join(str(tmp_path), SEGMENT_NAME % ('test', len(segments) + 1))]
+
+
+def test_recorded_hands_replay_the_same(tmp_path):
+    recordHands(tmp_path, 16384)
+    records = readAll(tmp_path)
+    assert [record.handNumber for record in records] == list(range(1, HANDS + 1))
+    for record in records:
+        assert replayHand(record) == [], record.handNumber
@@ -0,0 +1,105 @@
+# Looking up recorded hands through the sidecar indexes (handindex.py).
+# Run from the repository root: python -m pytest test_handindex.py
+import os
+from handhistory import HandHistoryWriter, HandRecord, listSegments
+from handindex import *
+
+START = 1800000000.0
+
+
+def makeRecord(gameID, handNumber, names, pot):
+    record = HandRecord(gameID, handNumber)
+    record.startTime = START + handNumber * 60
+    record.endTime = record.startTime + 30
+    record.seats = [(chair, name, 100, [chair, chair + 13]) for chair, name in enumerate(names)]
+    record.board = [40, 41, 42]
+    record.actions = [(SX_GAME_BET[0], 0, 3, pot // 2, pot // 2), (SX_GAME_BET[0], 1, 3, pot // 2, pot // 2)]
+    record.pots = [(pot, pot // 2, list(range(len(names))))]
+    record.payouts = [(0, pot)]
+    return record
+
+
+def writeHands(writer, records):
+    writer.write([record.encode() for record in records])
+
+
+def find(index, **query):
+    return [(hand.gameID, hand.handNumber) for hand in index.query(**query)]
+
+
+def test_queries(tmp_path):
+    writer = HandHistoryWriter('test', str(tmp_path))
+    writeHands(writer, [
+        makeRecord(1, 1, ['ann', 'bob'], 20),
+        makeRecord(1, 2, ['ann', 'bob', 'cid'], 400),
+        makeRecord(2, 3, ['bob', 'dan'], 60),
+    ])
+    writer.closeSegment()
+
+    index = HandHistoryIndex(str(tmp_path))
+    assert find(index) == [(1, 1), (1, 2), (2, 3)]
+    assert find(index, player = 'ann') == [(1, 1), (1, 2)]
+    assert find(index, player = 'dan', gameID = 2) == [(2, 3)]
+    assert find(index, player = 'eve') == []
+    assert find(index, minPot = 50, maxPot = 400) == [(1, 2), (2, 3)]
+    assert find(index, since = START + 120, until = START + 180) == [(1, 2)]
+    index.close()
+    assert os.path.exists(listSegments(str(tmp_path))[0] + '.idx')
+
+
+def test_hand_views_match_the_records(tmp_path):
+    writer = HandHistoryWriter('test', str(tmp_path))
+    records = [makeRecord(5, n, ['ann', 'zoë'], 10 * n) for n in range(1, 4)]
+    writeHands(writer, records)
+    writer.closeSegment()
+
+    reader = SegmentReader(listSegments(str(tmp_path))[0])
+    hands = list(reader)
+    assert [(hand.gameID, hand.handNumber, hand.startTime, hand.endTime) for hand in hands] == \
+        [(r.gameID, r.handNumber, r.startTime, r.endTime) for r in records]
+    assert hands[0].getPlayerNames() == ['ann', 'zoë']
+    decoded = hands[2].decode()
+    assert (decoded.seats, decoded.board, decoded.pots) == (records[2].seats, records[2].board, records[2].pots)
+    assert describeHand(decoded).splitlines()[1] == '  Chair 0: ann (100 chips) 2h 2d'
+    del hands, decoded
+    reader.close()
+
+
+def test_index_catches_up_with_the_segment(tmp_path):
+    writer = HandHistoryWriter('test', str(tmp_path))
+    writeHands(writer, [makeRecord(1, 1, ['ann'], 10)])
+    path = listSegments(str(tmp_path))[0]
+    HandHistoryIndex(str(tmp_path)).close()
+    covered = SegmentIndex.load(path + '.idx').covered
+
+    # More hands, and the first half of one still being written
+    writeHands(writer, [makeRecord(1, 2, ['bob'], 10)])
+    partial = makeRecord(1, 3, ['cid'], 10).encode()
+    writer.file.write(partial[:len(partial) // 2])
+    writer.file.flush()
+    index = HandHistoryIndex(str(tmp_path))
+    assert find(index) == [(1, 1), (1, 2)]
+    assert find(index, player = 'bob') == [(1, 2)]
+    index.close()
+    assert SegmentIndex.load(path + '.idx').covered > covered
+
+    writer.file.write(partial[len(partial) // 2:])
+    writer.closeSegment()
+    index = HandHistoryIndex(str(tmp_path))
+    assert find(index, player = 'cid') == [(1, 3)]
+    index.close()
+
+
+def test_damaged_index_is_rebuilt(tmp_path):
+    writer = HandHistoryWriter('test', str(tmp_path))
+    writeHands(writer, [makeRecord(1, 1, ['ann'], 10), makeRecord(1, 2, ['bob'], 10)])
+    writer.closeSegment()
+    path = listSegments(str(tmp_path))[0]
+    HandHistoryIndex(str(tmp_path)).close()
+    with open(path + '.idx', 'wb') as f:
+        f.write(b'junk')
+
+    index = HandHistoryIndex(str(tmp_path))
+    assert find(index, player = 'bob') == [(1, 2)]
+    index.close()
+    assert SegmentIndex.load(path + '.idx').offsets == [SEGMENT_HEADER.size, SEGMENT_HEADER.size + len(makeRecord(1, 1, ['ann'], 10).encode())]
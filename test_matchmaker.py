@@ -0,0 +1,59 @@
+# Matchmaking (matchmaker.py): how searchers are split over new tables and how freed seats reach the matchmaker.
+# Run from the repository root: python -m pytest test_matchmaker.py
+import pytest
+import games as gamesModule
+from games import Games
+from matchmaker import Matchmaker, splitIntoTables
+from gamestates import *
+from packetsyntax import *
+from serversettings import HOLDEM_SEATS
+from simulation import SimClient, callStrategy
+
+
+def test_split_spreads_the_clients_evenly():
+    clients = list(range(13))
+    tables = splitIntoTables(clients, 6, 2)
+    assert [len(table) for table in tables] == [5, 4, 4]
+    # In search order
+    assert sum(tables, []) == clients
+    assert [len(table) for table in splitIntoTables(list(range(12)), 6, 2)] == [6, 6]
+    assert [len(table) for table in splitIntoTables(list(range(7)), 6, 2)] == [4, 3]
+
+
+def test_split_leaves_too_few_clients_waiting():
+    assert splitIntoTables([], 6, 2) == []
+    assert splitIntoTables([0], 6, 2) == []
+    assert splitIntoTables([0, 1, 2], 6, 4) == []
+    # Two tables would need six clients, so the first four get one table and the fifth waits
+    assert splitIntoTables(list(range(5)), 4, 3) == [[0, 1, 2, 3]]
+
+
+@pytest.fixture
+def games(monkeypatch):
+    monkeypatch.setattr(gamesModule, 'HAND_HISTORY_DIRECTORY', None)
+    return Games()
+
+
+def test_player_leaving_frees_a_seat_for_the_matchmaker(games):
+    matchmaker = Matchmaker(games)
+    games.seatListener = matchmaker.seatFreed
+    clients = [SimClient('c%d' % i, callStrategy) for i in range(HOLDEM_SEATS)]
+    for c in clients:
+        c.currentGame = GM_HOLDEM
+        c.gameStatus = ST_SEARCHING
+        matchmaker.addSearcher(c)
+    matchmaker.pending.clear()
+    matchmaker.match(GM_HOLDEM)
+    game = games.getGame(clients[0].currentGameID)
+    assert game is not None
+    assert matchmaker.openTables.get(GM_HOLDEM, {}) == {} # Full
+
+    with game.lock: # Keeps the scheduler from updating the table meanwhile
+        for c in clients:
+            game.handleData(c, SX_GAME_READY_TO_START)
+        assert len(game.players) == HOLDEM_SEATS
+        matchmaker.pending.clear()
+        # Not through the server, e.g. when a packet can't be sent to the player
+        game.handleDisconnect(clients[0])
+        assert GM_HOLDEM in matchmaker.pending
+        assert matchmaker.openTables[GM_HOLDEM] == {game.gameID: game}
@@ -0,0 +1,65 @@
+# Protocol version 2 (protocol.py): varints, frames and the fields of game packets.
+# Run from the repository root: python -m pytest test_protocol.py
+import pytest
+from card import CARDS
+from packetsyntax import *
+from pokerplayer import PokerPlayer
+from protocol import *
+from simulation import SimClient, callStrategy
+
+
+def makePlayer(name, chair = -1):
+    player = PokerPlayer(SimClient(name, callStrategy))
+    if chair >= 0:
+        player.chair = chair
+        player.seated = True
+    return player
+
+
+def test_varints():
+    for value in (0, 1, 127, 128, 300, 16383, 16384, 0xFFFFFFFF, 1 << 62):
+        encoded = encodeVarint(value)
+        assert decodeVarint(b'x' + encoded + b'y', 1) == (value, len(encoded) + 1)
+    assert encodeVarint(127) == b'\x7f'
+    assert encodeVarint(300) == b'\xac\x02'
+    with pytest.raises(ValueError):
+        encodeVarint(-1)
+    with pytest.raises(ValueError):
+        decodeVarint(b'\xac')
+    with pytest.raises(ValueError):
+        decodeVarint(b'\xff' * 10 + b'\x01')
+
+
+def test_frames():
+    body = SX_PING + b'x' * 200
+    for version in PROTOCOL_VERSIONS:
+        stream = frame(body, version) + frame(SX_PING, version)
+        assert readFrame(stream, 0, version) == (body, len(stream) - len(frame(SX_PING, version)))
+        # Not received completely yet
+        for cut in (0, 1, len(stream) - len(frame(SX_PING, version)) - 1):
+            assert readFrame(stream[:cut], 0, version) == (None, 0)
+    assert frame(body, PROTOCOL_V1) == body + SX_EOR
+    assert frame(body, PROTOCOL_V2) == b'\xc9\x01' + body
+
+
+def test_game_data_round_trips():
+    seated = makePlayer('seated', 3)
+    standing = makePlayer('standing é')
+    cases = [
+        (SX_GAME_PLAYER_CHIPS, [seated, 0, standing, 1000000], [3, 0, 'standing é', 1000000]),
+        (SX_GAME_DEAL_TABLE, [CARDS[0], CARDS[51], CARDS[26]], [0, 51, 26]),
+        (SX_GAME_BET, [seated, 0xFFFFFFFF], [3, 0xFFFFFFFF]),
+        (SX_GAME_BUTTONS_CHAIRS, [0, -1, 9], [0, -1, 9]),
+        (SX_GAME_PLAYER_CHAIR, ['a', 0, 'b', 9], ['a', 0, 'b', 9]),
+        (SX_GAME_PLAYER_HAND, [standing, CARDS[12], CARDS[13]], ['standing é', 12, 13]),
+        (SX_GAME_CHAT_MESSAGE, [seated, 'hi' * 100], [3, 'hi' * 100]),
+        (SX_GAME_NOT_ENOUGH_PLAYERS, [], []),
+    ]
+    for header, fields, decoded in cases:
+        assert decodeGameData(header, encodeGameData(header, fields, PROTOCOL_V2)) == decoded, header
+
+
+def test_game_data_v1_is_text():
+    seated = makePlayer('seated', 3)
+    assert encodeGameData(SX_GAME_BET, [seated, 25], PROTOCOL_V1) == 'seated' + SXSTR_EOO + '25'
+    assert encodeGameData(SX_GAME_DEAL_HAND, [CARDS[5], CARDS[40]], PROTOCOL_V1) == '05' + SXSTR_EOO + '40'
@@ -0,0 +1,89 @@
+# The event-driven table scheduler (scheduler.py): tables are updated in deadline order, once per wake-up.
+# Run from the repository root: python -m pytest test_scheduler.py
+import threading
+from time import time
+from gamestates import *
+from scheduler import GameScheduler
+
+
+class RecordingGame(object):
+    # Stands in for a table and records when it was updated
+    gameID = 0
+    gameState = GMST_START
+
+
+    def __init__(self, name, updates, endAfter = -1):
+        self.name = name
+        self.updates = updates
+        self.endAfter = endAfter
+        self.lock = threading.RLock()
+
+
+    def update(self):
+        self.updates.append(self.name)
+        if self.updates.count(self.name) == self.endAfter:
+            self.gameState = GMST_ENDED
+        return False
+
+
+    def getNextWakeTime(self):
+        return None
+
+
+def test_due_games_come_out_in_deadline_order():
+    scheduler = GameScheduler(0)
+    now = time()
+    games = [RecordingGame(i, []) for i in range(5)]
+    for game, delay in zip(games, (3, 1, 4, 0, 2)):
+        scheduler.schedule(game, now - 10 + delay)
+    with scheduler.condition:
+        due = [scheduler.nextDueGame().name for i in range(len(games))]
+    assert due == [3, 1, 4, 0, 2]
+
+
+def test_earlier_deadline_replaces_the_later_one():
+    scheduler = GameScheduler(0)
+    now = time()
+    first, second = RecordingGame('first', []), RecordingGame('second', [])
+    scheduler.schedule(first, now - 1)
+    scheduler.schedule(second, now - 2)
+    scheduler.schedule(first, now - 3)
+    # A later deadline doesn't push back the one already set
+    scheduler.schedule(second, now + 60)
+    assert scheduler.deadlines[second][0] == now - 2
+    with scheduler.condition:
+        assert scheduler.nextDueGame() is first
+        assert scheduler.nextDueGame() is second
+        # Only the replaced entry of the first game is left, and it is skipped
+        assert [entry[2] for entry in scheduler.heap] == [first]
+        assert first not in scheduler.deadlines
+
+
+def test_workers_update_the_games_when_they_are_due():
+    updates = []
+    scheduler = GameScheduler(1)
+    done = threading.Event()
+    scheduler.endedListener = lambda game: done.set() if game.name == 'last' else None
+    scheduler.start()
+    now = time()
+    scheduler.schedule(RecordingGame('last', updates, 1), now + 0.3)
+    scheduler.schedule(RecordingGame('second', updates, 1), now + 0.2)
+    scheduler.schedule(RecordingGame('first', updates, 1), now + 0.1)
+    assert done.wait(5)
+    assert updates == ['first', 'second', 'last']
+
+
+def test_ended_games_are_not_updated_again():
+    updates = []
+    ended = {'game': threading.Event(), 'marker': threading.Event()}
+    scheduler = GameScheduler(1)
+    scheduler.endedListener = lambda game: ended[game.name].set()
+    scheduler.start()
+    game = RecordingGame('game', updates, 1)
+    scheduler.wake(game)
+    assert ended['game'].wait(5)
+    scheduler.wake(game)
+    # Updated after the game's wake-up by the only worker
+    scheduler.schedule(RecordingGame('marker', updates, 1), time() + 0.05)
+    assert ended['marker'].wait(5)
+    assert updates == ['game', 'marker']
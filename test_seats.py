@@ -0,0 +1,87 @@
+# Seats of a Texas Hold 'Em table: the seat array, the free-seat bits and the next-seat links (see game.py).
+# Run from the repository root: python -m pytest test_seats.py
+import pytest
+from game import MAX_SEATS, TexasHoldEmGame
+from pokerplayer import PokerPlayer
+from simulation import SimClient, callStrategy
+
+
+def makeTable(maxPlayers, chairs):
+    game = TexasHoldEmGame(0, maxPlayers = maxPlayers)
+    for chair in chairs:
+        game.takeSeat(PokerPlayer(SimClient('p%d' % chair, callStrategy)), chair)
+    return game
+
+
+def test_links_skip_the_free_chairs():
+    game = makeTable(10, [1, 4, 7])
+    assert game.nextTakenChair == [1, 4, 4, 4, 7, 7, 7, 1, 1, 1]
+    assert game.getFreeChair() == 0
+
+    game.leaveSeat(game.seats[4])
+    assert game.seats[4] is None
+    assert game.nextTakenChair == [1, 7, 7, 7, 7, 7, 7, 1, 1, 1]
+
+    game.leaveSeat(game.seats[7])
+    # The only taken chair links to itself
+    assert game.nextTakenChair == [1] * 10
+
+
+def test_free_chairs_are_taken_lowest_first():
+    game = makeTable(6, [0, 1, 2, 3, 4, 5])
+    assert game.getFreeChair() == -1
+    game.leaveSeat(game.seats[4])
+    game.leaveSeat(game.seats[2])
+    assert game.getFreeChair() == 2
+    game.takeSeat(PokerPlayer(SimClient('new', callStrategy)), game.getFreeChair())
+    assert game.getFreeChair() == 4
+
+
+def test_empty_table_has_no_links():
+    game = makeTable(4, [])
+    assert game.nextTakenChair == [-1] * 4
+    assert game.getFreeChair() == 0
+
+
+def test_move_to_chair_keeps_the_sitting_order():
+    game = makeTable(6, [0, 1])
+    first = game.players[0]
+    game.moveToChair(first, 5)
+    assert game.players[0] is first
+    assert game.seats[0] is None and game.seats[5] is first
+    assert game.nextTakenChair == [1, 5, 5, 5, 5, 1]
+    assert game.getFreeChair() == 0
+
+
+def test_seat_count_is_checked():
+    for maxPlayers in (1, MAX_SEATS + 1):
+        with pytest.raises(ValueError):
+            TexasHoldEmGame(0, maxPlayers = maxPlayers)
+    game = makeTable(4, [0])
+    with pytest.raises(ValueError):
+        game.setMaxPlayers(6)
+
+
+def test_next_player_goes_around_the_gaps():
+    game = makeTable(10, [2, 5, 9])
+    game.currentRound = 1 # Everyone still has to act
+    assert game.getNextPlayerFrom(game.seats[2]).chair == 5
+    assert game.getNextPlayerFrom(game.seats[9]).chair == 2
+    game.seats[2].folded = True
+    assert game.getNextPlayerFrom(game.seats[9]).chair == 5
+
+
+def test_first_buttons_follow_the_chairs():
+    # A new player on a freed chair sits down last but is between the dealer and the others
+    game = makeTable(6, [0, 1, 2, 3])
+    game.leaveSeat(game.seats[1])
+    game.takeSeat(PokerPlayer(SimClient('new', callStrategy)), game.getFreeChair())
+    game.moveButtons()
+    assert (game.dealerPlayer.chair, game.smallBlindPlayer.chair, game.bigBlindPlayer.chair) == (0, 1, 2)
+
+
+def test_first_buttons_of_two_players():
+    game = makeTable(6, [3, 5])
+    game.moveButtons()
+    assert game.dealerPlayer is game.smallBlindPlayer
+    assert (game.dealerPlayer.chair, game.bigBlindPlayer.chair) == (3, 5)
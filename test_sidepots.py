@@ -0,0 +1,103 @@
+# Splitting the pot into side pots and settling them at the end of a hand (game.py).
+# Run from the repository root: python -m pytest test_sidepots.py
+from card import CARDS
+from game import TexasHoldEmGame
+from pokerplayer import PokerPlayer
+from simulation import SimClient, callStrategy
+
+# Card values are rank + suit * 13, with the two as rank 0 and the ace as rank 12
+BOARD = [0, 18, 33, 48, 2] # Two, seven, nine, jack and four of mixed suits: nothing on the board itself
+ACES = [12, 25]
+KINGS = [11, 24]
+QUEENS = [10, 23]
+KING_QUEEN = [37, 49] # The same high cards as...
+KING_QUEEN_TOO = [11, 23] # ...these
+JUNK = [3, 17]
+
+
+def makeHand(bets):
+    # bets: (cards, total bet, all in, folded) of each player, in chair order
+    game = TexasHoldEmGame(0, maxPlayers = len(bets))
+    game.cardsOnTable = [CARDS[value] for value in BOARD]
+    for chair, (cards, totalBet, allIn, folded) in enumerate(bets):
+        player = PokerPlayer(SimClient('p%d' % chair, callStrategy))
+        game.takeSeat(player, chair)
+        player.cards = [CARDS[value] for value in cards]
+        player.chips = 0
+        player.totalBet = totalBet
+        player.allIn = allIn
+        player.folded = folded
+        game.pot += totalBet
+    return game
+
+
+def describePots(game):
+    return [(sidePot.potPerPlayer, sidePot.totalPot, [p.chair for p in sidePot.playersInPot]) for sidePot in game.sidePots]
+
+
+def test_one_pot_per_all_in_stack():
+    game = makeHand([
+        (ACES, 50, True, False),
+        (KINGS, 100, True, False),
+        (QUEENS, 200, False, False),
+        (JUNK, 30, False, True), # Folded, but the chips stay in the pots they reached
+    ])
+    game.calculateSidePots()
+    assert describePots(game) == [(50, 180, [0, 1, 2]), (100, 100, [1, 2]), (200, 100, [2])]
+
+
+def test_each_pot_goes_to_the_best_hand_in_it():
+    game = makeHand([
+        (ACES, 50, True, False),
+        (KINGS, 100, True, False),
+        (QUEENS, 200, False, False),
+        (JUNK, 30, False, True),
+    ])
+    game.endHand()
+    assert [p.chips for p in game.players] == [180, 100, 100, 0]
+    assert game.pot == 0
+
+
+def test_equal_all_ins_make_one_pot():
+    game = makeHand([
+        (KINGS, 40, True, False),
+        (ACES, 40, True, False),
+        (QUEENS, 40, False, False),
+    ])
+    game.calculateSidePots()
+    assert describePots(game) == [(40, 120, [0, 1, 2])]
+    game.endHand()
+    assert [p.chips for p in game.players] == [0, 120, 0]
+
+
+def test_tied_hands_split_the_side_pot():
+    game = makeHand([
+        (ACES, 50, True, False),
+        (KING_QUEEN, 150, True, False),
+        (KING_QUEEN_TOO, 150, False, False),
+        (JUNK, 10, False, True),
+    ])
+    game.endHand()
+    assert describePots(game) == [(50, 160, [0, 1, 2]), (150, 200, [1, 2])]
+    assert [p.chips for p in game.players] == [160, 100, 100, 0]
+
+
+def test_tied_hands_split_every_pot():
+    game = makeHand([
+        (KING_QUEEN, 60, True, False),
+        (KING_QUEEN_TOO, 60, False, False),
+        (JUNK, 4, False, True),
+    ])
+    game.endHand()
+    assert [p.chips for p in game.players] == [62, 62, 0]
+
+
+def test_last_player_standing_takes_everything():
+    game = makeHand([
+        (JUNK, 20, False, True),
+        (QUEENS, 40, False, False),
+        (ACES, 30, False, True),
+    ])
+    game.endHand(True)
+    assert [p.chips for p in game.players] == [0, 90, 0]
+    assert game.pot == 0
@@ -1,13 +1,19 @@
 from time import time
 
 class Timer(object):
-    defaultTime = 0
-    timerLeft = 0
-    timerStartTime = 0
+    __slots__ = ('defaultTime', 'timerLeft', 'timerStartTime', 'timerDuration', 'clock')
     
     
-    def __init__(self, defaultTime):
+    def __init__(self, defaultTime, clock = time):
         self.defaultTime = defaultTime
+        self.clock = clock # Returns the current time in seconds, time() unless a simulation provides its own
+        self.reset()
+        
+        
+    def reset(self):
+        self.timerLeft = 0
+        self.timerStartTime = 0
+        self.timerDuration = 0
 
 
     def start(self, fullSeconds = 0):
@@ -15,13 +21,21 @@ class Timer(object):
             self.timerLeft = fullSeconds
         else:
             self.timerLeft = self.defaultTime
-        self.timerStartTime = time()
+        self.timerDuration = self.timerLeft
+        self.timerStartTime = self.clock()
         
         
     def update(self):
         if self.timerStartTime == 0: # Timer has not started yet
             return False
-        self.timerLeft = (self.timerStartTime + self.defaultTime) - time()
+        self.timerLeft = (self.timerStartTime + self.timerDuration) - self.clock()
         if self.timerLeft <= 0:
             return False
-        return True
\ No newline at end of file
+        return True
+    
+    
+    def getDeadline(self):
+        # The clock() time at which the timer runs out, None if it has not been started
+        if self.timerStartTime == 0:
+            return None
+        return self.timerStartTime + self.timerDuration